@@ -19,11 +19,18 @@ import numpy        as np
 import traceback
 import itertools
 import collections
+import collections.abc
 import functools
 import threading
+import concurrent.futures
+import multiprocessing
 import os.path
 import time
 import base64
+import hashlib
+import tempfile
+import mmap
+import array
 import xml.sax
 import xml.sax.handler
 import tkinter              as tk
@@ -58,6 +65,23 @@ DEFAULT_BED_M = 10
 FILETYPES_GCODE = ( ("g-code", "*.gcode"), ("all", "*.*") )
 FILETYPES_SVG = ( ("svg", "*.svg"), ("all", "*.*") )
 
+INFO_HEAD_SIZE = 256 << 10
+INFO_HEAD_MAX = 4 << 20
+INFO_TAIL_SIZE = 256 << 10
+INFO_BLOCK_SIZE = 64 << 10
+
+CACHE_DIR_NAME = "g_code_viewer"
+CACHE_MAX_BYTES = 1 << 30
+
+LAYER_PICTURE_MAX_BYTES = 256 << 20
+LAYER_CHECKPOINT_MOVES = 1000
+LAYER_GRID_CELL = 2.0           # mm, cell of the SegmentGrid of a layer
+LAYER_GRID_CULL = 0.25          # cull by the SegmentGrid if less than this part of the layer is on the canvas
+LAYER_GRID_MAX = 64             # SegmentGrid kept ( layers )
+LAYER_LOD_PIXEL = 0.5           # canvas pixels, error of the simplified extrusion polylines ( PolylineLOD )
+LAYER_LOD_LEVELS = ( 0.02, 0.04, 0.08, 0.16, 0.32 )    # mm, tolerances of the PolylineLOD levels
+LAYER_LOD_MAX_BYTES = 64 << 20
+
 ## vvv Helper class for affine Transfomation and line intersection vvv
 
 Point = collections.namedtuple( 'Point', ['X', 'Y'] )
@@ -91,8 +115,15 @@ Matrix.dotPoint     = lambda m, p : Point(
                         m.scX * p[0] + m.skX * p[1] + m.trX * 1
                     ,   m.skY * p[0] + m.scY * p[1] + m.trY * 1
                     )
-Matrix.__matmul__   = lambda self, other : Matrix.dot( self, other ) if isinstance( other, Matrix ) else Matrix.dotPoint( self, other )
+Matrix.dotPoints    = lambda m, a : a @ np.array( ( ( m.scX, m.skY ), ( m.skX, m.scY ) ) ) + ( m.trX, m.trY )
+                    # points [ n, 2 ] at once ( affine part )
+Matrix.__matmul__   = lambda self, other : (
+                        Matrix.dot( self, other ) if isinstance( other, Matrix ) else
+                        Matrix.dotPoints( self, other ) if isinstance( other, np.ndarray ) and other.ndim == 2 else
+                        Matrix.dotPoint( self, other )
+                    )
                     # a @ b
+Matrix.inv          = lambda m : Matrix.fromNdarray( np.linalg.inv( np.array( m, dtype = np.float64 ).reshape( 3, 3 ) ) )
 Matrix.tran         = lambda tx, ty : Matrix(
                         1, 0, tx
                     ,   0, 1, ty
@@ -278,85 +309,27 @@ ICON_CLOSE = '''
 
 DrawFunc = collections.namedtuple( 'DrawFunc', ['f', 'args', 'kwargs'], defaults=( None, (), {} ) )
 
-def makeTkImage( nparray ):
+def makeSurface( nparray ):
 
-    # important vvv
-    # convert skia = BGRA to TkInter = RGBA
+    # skia surface on a numpy array in RGBA order ( TkInter / PIL order )
+    # The drawings go straight to the pixels Tk takes, without channel swap nor copy.
 
-    np.dot(
-        nparray
-    ,   np.array(   [   [0, 0, 1, 0 ]   # 0 <= 2
-                    ,   [0, 1, 0, 0 ]   # 1 <= 1
-                    ,   [1, 0, 0, 0 ]   # 2 <= 0
-                    ,   [0, 0, 0, 1 ]   # 4 <= 4
-                    ], dtype = np.uint8
-                )
-    ,   out = nparray                   # output same array
-    )                                   # return same array ( not copy ). So throw it away.
+    return skia.Surface( nparray, colorType = skia.ColorType.kRGBA_8888_ColorType )
 
-    im = Image.fromarray( nparray, mode="RGBA" )  # make PIL Image
+def makePILImage( nparray ):
 
-#   ** oops! in-place update is not support
-#
-#   >>> import numpy as np
-#   >>> array = np.array( [ [ 1,2,3,4], [2,4,6,8] ] )
-#   >>> array_mtx =  np.array( [ [0, 0, 1, 0 ], [0, 1, 0, 0 ], [1, 0, 0, 0 ], [0, 0, 0, 1 ] ] )
-#   >>> array @= array_mtx
-#   Traceback (most recent call last):
-#     File "<stdin>", line 1, in <module>
-#   TypeError: In-place matrix multiplication is not (yet) supported. Use 'a = a @ b' instead of 'a @= b'.
-#   >>> array = array @ array_mtx
-#   >>> array
-#   array([[3, 2, 1, 4],
-#          [6, 4, 2, 8]])
-#
-#   ** oops! in-place another update is very slow...
-#
-#   t_shape = self.surface.shape
-#   t_surface = surface.reshape( [ t_shape[0] * t_shape[1], t_shape[2] ] )
-#
-#   for i in range( t_surface.shape[ 0 ] ):
-#       ( t_surface[i][0], t_surface[i][2] ) = ( t_surface[i][2], t_surface[i][0] )
-#
-#   im = Image.fromarray( array, mode="RGBA" )
-#
-#   ** slice is memory copy ...
-#
-#   im = Image.fromarray( surface[ :, :, [2, 1, 0, 3] ], mode="RGBA" )
-#
-#   ** This is it !  np.dot( array ... out=array )
-#
-#   >>> import numpy as np
-#   >>>
-#   >>> def np_id(x):
-#   ...     return x.__array_interface__['data'][0]
-#   ...
-#   >>> array = np.array( [ [ [ 1,2,3,4], [2,4,6,8] ], [ [ 1,2,3,4], [2,4,6,8] ] ] )
-#   >>>
-#   >>> i1 = np_id(array)
-#   >>>
-#   >>> array_mtx =  np.array( [ [0, 0, 1, 0 ], [0, 1, 0, 0 ], [1, 0, 0, 0 ], [0, 0, 0, 1 ] ] )
-#   >>> x = np.dot( array, array_mtx, out=array )
-#   >>>
-#   >>> x
-#   array([[[3, 2, 1, 4],
-#           [6, 4, 2, 8]],
-#
-#          [[3, 2, 1, 4],
-#           [6, 4, 2, 8]]])
-#   >>> array
-#   array([[[3, 2, 1, 4],
-#           [6, 4, 2, 8]],
-#
-#          [[3, 2, 1, 4],
-#           [6, 4, 2, 8]]])
-#   >>>
-#   >>> i2 = np_id(x)
-#   >>> i3 = np_id(array)
-#   >>> ( i1 == i2 == i3 )
-#   True
+    # PIL Image on the memory of a RGBA numpy array ( not copy, a slice is made contiguous )
+
+    nparray = np.ascontiguousarray( nparray )
+
+    return Image.frombuffer( "RGBA", ( nparray.shape[ 1 ], nparray.shape[ 0 ] ), nparray, "raw", "RGBA", 0, 1 )
+
+def makeTkImage( nparray ):
+
+    # RGBA numpy array ( see makeSurface ) to TkInter Image
+    # ImageTk.PhotoImage.paste() of the same size updates an existing one in place
 
-    return ImageTk.PhotoImage( im )      # make TkInter Image
+    return ImageTk.PhotoImage( makePILImage( nparray ) )      # make TkInter Image
 
 def svgIconRenderer( filename_or_strem, view_w = 16, view_h = 16, color = 0xFF000000 ):
 
@@ -393,7 +366,7 @@ def svgIconRenderer( filename_or_strem, view_w = 16, view_h = 16, color = 0xFF00
             self.view_w = view_w
             self.view_h = view_h
             self.array = np.zeros( ( view_w, view_h, 4 ), dtype = np.uint8 )
-            self.surface = skia.Surface( self.array )
+            self.surface = makeSurface( self.array )
             self.skc = self.surface.getCanvas()
             self.depth = 0
             self.state = 0
@@ -916,6 +889,9 @@ def format_size( sz ):
 
 def format_time_minsec( sec ):
 
+    if not math.isfinite( sec ):
+        return "--:--"
+
     ( f, i ) = math.modf( sec )
 
     s = i % 60
@@ -926,6 +902,9 @@ def format_time_minsec( sec ):
 
 def format_time( sec ):
 
+    if not math.isfinite( sec ):
+        return "--:--:--.--"
+
     ( f, i ) = math.modf( sec )
 
     s = i % 60
@@ -947,9 +926,20 @@ G1code = collections.namedtuple( 'G1code', ( 'X', 'Y', 'Z', 'E', 'F', 'tail', 'c
 KW_G1         = re.compile( r"\s*G[01]\s+([^;]+)", re.I )
 KW_G1_PARAM   = re.compile( r"\s*([A-Z])(-?[0-9.]+)", re.I )
 
+def bytesPattern( pattern ):
+    # same regex for bytes ( used by the loader, which works on raw bytes lines )
+    return re.compile( pattern.pattern.encode(), pattern.flags & ~re.UNICODE )
+
+KW_G1_B         = bytesPattern( KW_G1 )
+KW_G1_PARAM_B   = bytesPattern( KW_G1_PARAM )
+
 def parseG1( ln ):
 
-    m = KW_G1.match( ln )
+    # ln : str or bytes
+
+    is_b = isinstance( ln, bytes )
+
+    m = ( KW_G1_B if is_b else KW_G1 ).match( ln )
 
     if m:
         gx = None
@@ -960,10 +950,13 @@ def parseG1( ln ):
 
         gtail = m.string[ m.end():]
 
-        if gtail == "":
+        if len( gtail ) == 0:
             gtail = None
 
-        for m in KW_G1_PARAM.finditer( m.group( 1 ) ):
+        elif is_b:
+            gtail = gtail.decode( 'utf8', errors = 'replace' )
+
+        for m in ( KW_G1_PARAM_B if is_b else KW_G1_PARAM ).finditer( m.group( 1 ) ):
 
             if m:
 
@@ -971,6 +964,9 @@ def parseG1( ln ):
                     p = m.group( 1 ).upper()
                     v = float( m.group( 2 ) )
 
+                    if is_b:
+                        p = p.decode()
+
                     if p == 'X':
                         gx = v
 
@@ -993,6 +989,39 @@ def parseG1( ln ):
 
     return None
 
+KW_MOVE     = re.compile( r"\s*G([0-3])\s+([^;]+)", re.I )
+KW_MOVE_B   = bytesPattern( KW_MOVE )
+
+MOVE_WORDS  = 'XYZEFIJR'        # G0 / G1 use X - F, G2 / G3 ( arc ) also I, J ( center offset ) or R ( radius )
+
+def parseMove( ln ):
+
+    # G0 - G3 line ( bytes ) -> ( motion ( 0 - 3 ), [ X, Y, Z, E, F, I, J, R ] ( nan : not present ), tail ) or None
+    # same rules as parseG1
+
+    m = KW_MOVE_B.match( ln )
+
+    if not m:
+        return None
+
+    words = [ np.nan ] * len( MOVE_WORDS )
+
+    gtail = m.string[ m.end(): ]
+    gtail = gtail.decode( 'utf8', errors = 'replace' ) if len( gtail ) > 0 else None
+
+    for p in KW_G1_PARAM_B.finditer( m.group( 2 ) ):
+
+        k = MOVE_WORDS.find( p.group( 1 ).upper().decode() )
+
+        if k >= 0:
+            try:
+                words[ k ] = float( p.group( 2 ) )
+
+            except Exception as err:
+                traceback.print_exception( err, file=sys.stderr )
+
+    return ( int( m.group( 1 ) ), words, gtail )
+
 KW_COMMENT          = re.compile( r"^\s*;" )
 KW_BED_SHAPE        = re.compile( r"^\s*;\s*bed_shape\s*=\s*(.+)", re.I )
 # ; bed_shape = 0x0,250x0,250x210,0x210
@@ -1004,485 +1033,2838 @@ KW_THUMBNAIL_BEGIN  = re.compile( r"^\s*;\s*thumbnail\s*begin" )
 KW_THUMBNAIL_BODY   = re.compile( r"^\s*;\s*(\S+)" )
 KW_THUMBNAIL_END    = re.compile( r"^\s*;\s*thumbnail\s*end" )
 
+KW_MACHINE          = re.compile( r"^\s*M(20[1345])(?![0-9])([^;]*)", re.I )
+# M201 X1000 Y1000 Z200 E5000 ; max accelerations, M203 max feedrates, M204 P/R/T/S accelerations, M205 jerk / min feedrates
+
 KW_LAYER_HEIGHT         = re.compile( r"^\s*;\s*layer_height\s*=\s*([\d.]+)" )
 KW_FIRST_LAYER_HEIGHT   = re.compile( r"^\s*;\s*first_layer_height\s*=\s*([\d.]+)" )
 
-LayerData = collections.namedtuple( 'LayerData', ( 'height', 'layer' ) )
+KW_COMMENT_B            = bytesPattern( KW_COMMENT )
+KW_BED_SHAPE_B          = bytesPattern( KW_BED_SHAPE )
+KW_EST_PRINT_TIME_B     = bytesPattern( KW_EST_PRINT_TIME )
+KW_THUMBNAIL_BEGIN_B    = bytesPattern( KW_THUMBNAIL_BEGIN )
+KW_THUMBNAIL_BODY_B     = bytesPattern( KW_THUMBNAIL_BODY )
+KW_THUMBNAIL_END_B      = bytesPattern( KW_THUMBNAIL_END )
+KW_LAYER_HEIGHT_B       = bytesPattern( KW_LAYER_HEIGHT )
+KW_MACHINE_B            = bytesPattern( KW_MACHINE )
+KW_FIRST_LAYER_HEIGHT_B = bytesPattern( KW_FIRST_LAYER_HEIGHT )
 
-class GcodeLoader:
+def openGcodeBuffer( file ):
 
-    bed_x_min = None
-    bed_x_max = None
-    bed_y_min = None
-    bed_y_max = None
+    # Returns the whole file as a buffer ( mmap for a path, bytes for a file object ) without decoding.
 
-    layer_data      = []
-    raw_gcode       = []
-    raw_gcode_cm_no = []
+    if not hasattr( file, 'read' ):
+        with open( file, 'rb' ) as fin:
+            if os.fstat( fin.fileno() ).st_size == 0:
+                return b''
 
-    feedrates   = []
+            return mmap.mmap( fin.fileno(), 0, access = mmap.ACCESS_READ )
 
-    time_est    = 0
-    time_calc   = 0
-    time_diff_rate = 1
+    buf = file.read()
 
-    read_bytes = 0
-    size_bytes = 0
-    read_time_st = 0
-    read_time_nw = 0
+    if isinstance( buf, str ):
+        buf = buf.encode( 'utf8' )
 
-    thumbnail_image_bytes = None        # png image bytes
+    return buf
 
-    class DummyLock:
-        def __enter__(self): return self
-        def __exit__(self, exc_type, exc_value, traceback): pass
+def lineChunks( buf, chunk_size, st = 0, ed = None ):
 
-    lock = DummyLock()
+    # Split buf[ st : ed ] ( st, ed : line boundaries ) into chunks of about chunk_size bytes at line boundaries.
+    # yield ( chunk end, line start offsets, line end offsets ( exclusive, with the newline ) )
 
-    err  = None
+    size = len( buf ) if ed is None else ed
 
-    def getProc( self ):
-        with self.lock:
-            return ( self.read_bytes, self.size_bytes, self.read_time_nw - self.read_time_st )
+    while st < size:
+        ed = buf.rfind( b'\n', st, min( st + chunk_size, size ) ) + 1
 
-    def getThumbnailImage( self ):
-        with self.lock:
-            return self.thumbnail_image_bytes
+        if ed <= st:
+            ed = buf.find( b'\n', st + chunk_size, size ) + 1
 
-    @staticmethod
-    def value_correction( z ):
-        return round( z, 3 )
+            if ed <= st:
+                ed = size
 
-    def __init__( self, tlock = False ):
+        if ed > size - chunk_size // 8:     # do not leave a tiny tail chunk
+            ed = size
 
-        if tlock:
-            self.lock = threading.Lock()
+        a = np.frombuffer( buf, dtype = np.uint8, count = ed - st, offset = st )
 
-    def load( self, file = None ):
+        ends = np.flatnonzero( a == 0x0a ) + ( st + 1 )
 
-        err  = None
+        del a
 
-        self.layer_data         = []
-        self.raw_gcode          = []
-        self.raw_gcode_cm_no    = []
+        if len( ends ) == 0 or ends[ -1 ] != ed:
+            ends = np.append( ends, ed )
 
-        self.feedrates = []
+        starts = np.empty_like( ends )
+        starts[ 0 ] = st
+        starts[ 1: ] = ends[ :-1 ]
 
-        self.read_bytes = 0
-        self.size_bytes = 0
-        self.read_time_st = time.time()
-        self.read_time_nw = time.time()
+        yield ( ed, starts, ends )
 
-        try:
-            self._load_impl( file )
-        except Exception as err:
-            self.err = err
-            raise err
+        st = ed
 
-    def _load_impl( self, file = None ):
+def lineRanges( buf, size ):
 
-        if file is None:
-            return
+    # Split buf into ranges of about size bytes at line boundaries. return [ ( st, ed ), ... ]
 
-        if not hasattr( file, 'read' ):
-            fin = open( file, encoding = 'utf8', errors = 'replace' )
-        else:
-            fin = file
+    ranges = []
+    st = 0
 
-        if fin.seekable():
-            fin.seek( 0, io.SEEK_END )
+    while st < len( buf ):
+        ed = buf.find( b'\n', st + size ) + 1
 
-            with self.lock:
-                self.size_bytes = fin.tell()
+        if ed <= st or ed > len( buf ) - size // 8:
+            ed = len( buf )
 
-            fin.seek( 0, io.SEEK_SET )
+        ranges.append( ( st, ed ) )
+        st = ed
 
-        c_x = 0
-        c_y = 0
-        c_z = 0
-        c_zz = 0
-        c_l = 0
-        c_f = 0
+    return ranges
 
-        f_bed_s     = False
-        f_est       = False
-        f_thumb     = 0
-        thumb       = io.BytesIO()
+class GcodeLines( collections.abc.Sequence ):
 
-        layer = []
+    # Lines of the source by byte offset. The text stays in the file and is read through mmap on demand.
+    #
+    # offsets : int64 [ lines + 1 ], line i is [ offsets[ i ], offsets[ i + 1 ] ) with its newline
+    # source  : file name, or bytes ( loaded from a file object )
+    # A line is returned as bytes with the original line ending.
 
-        feedrates = set()
+    COPY_BLOCK = 1 << 20
 
-        no = -1
-        tm_calc = 0
+    def __init__( self, source = None, offsets = None ):
 
-        while True:
-            ln = fin.readline()
+        self.source     = source
+        self.offsets    = offsets if offsets is not None else np.zeros( 1, dtype = np.int64 )
+        self.stamp      = self.fileStamp( source ) if isinstance( source, str ) else None
+        self.buf        = None
 
-            if ln == "":
-                break
+    @staticmethod
+    def fileStamp( filename ):
+        st = os.stat( filename )
+        return ( st.st_size, st.st_mtime_ns )
 
-            self.raw_gcode.append( ln )
+    def __len__( self ):
+        return len( self.offsets ) - 1
 
-            no += 1
+    def __getitem__( self, i ):
+        if isinstance( i, slice ):
+            return [ self[ j ] for j in range( *i.indices( len( self ) ) ) ]
 
-            if fin.seekable():
-                with self.lock:
-                    self.read_bytes = fin.tell()
+        if i < 0:
+            i += len( self )
 
-            with self.lock:
-                self.read_time_nw = time.time()
+        if i < 0 or i >= len( self ):
+            raise IndexError( i )
 
-            ln = ln.rstrip( "\r\n" )
+        return self.buffer()[ int( self.offsets[ i ] ) : int( self.offsets[ i + 1 ] ) ]
 
-            if KW_COMMENT.match( ln ):
+    def buffer( self ):
 
-                if f_thumb != 1:
-                    self.raw_gcode_cm_no.append( no )
+        if self.buf is None:
+            if self.stamp is not None:
+                if self.fileStamp( self.source ) != self.stamp:
+                    raise Exception( "File has been changed after loading. [%s]" % ( self.source, ) )
 
-                else:       # if f_thumb == 1:
-                    m = KW_THUMBNAIL_END.match( ln )
+                self.buf = openGcodeBuffer( self.source )
 
-                    if m:
-                        f_thumb = 2
+            else:
+                self.buf = self.source if self.source is not None else b''
 
-                        thumb.seek( 0, os.SEEK_END )
+        return self.buf
 
-                        if thumb.tell() > 0:
-                            thumb.seek( 0, os.SEEK_SET )
+    def close( self ):
+        if isinstance( self.buf, mmap.mmap ):
+            self.buf.close()
 
-                            image_bytes = base64.b64decode( thumb.getvalue() )
+        self.buf = None
 
-                            if len( image_bytes ) >= 8 and image_bytes[0:8] == b'\x89PNG\r\n\x1a\n':
-                                with self.lock:
-                                    self.thumbnail_image_bytes = image_bytes
-                    else:
-                        m = KW_THUMBNAIL_BODY.match( ln )
+    def offset( self, i ):
+        return int( self.offsets[ i ] )
 
-                        if m:
-                            thumb.write( m.group( 1 ).encode() )
+    def copyTo( self, stream, st = 0, ed = None ):
 
-                    continue
+        # write lines [ st, ed ) to stream in blocks of COPY_BLOCK bytes
 
-                if f_thumb == 0:
-                    m = KW_THUMBNAIL_BEGIN.match( ln )
+        buf = self.buffer()
+        a = self.offset( st )
+        b = self.offset( len( self ) if ed is None else ed )
 
-                    if m:
-                        f_thumb = 1
-                        continue
+        with memoryview( buf ) as mv:
+            while a < b:
+                n = min( b, a + self.COPY_BLOCK )
+                stream.write( mv[ a : n ] )
+                a = n
 
-                if f_bed_s == False:
-                    m = KW_BED_SHAPE.match( ln )
+LINE_OTHER      = 0
+LINE_COMMENT    = 1
+LINE_G1         = 2     # G0 - G3
+LINE_ODD        = 3     # left to the regex path ( leading white space, broken number, too long number ... )
+LINE_MACHINE    = 4     # M201 / M203 / M204 / M205
 
-                    if m:
-                        f_bed_s = True
+G1_TOKEN_WIDTH  = 24
 
-                        b_x = []
-                        b_y = []
+def tokenizeG1( buf, starts, ends ):
 
-                        for xy in m.group( 1 ).split( ',' ):
+    # Bulk version of KW_COMMENT / parseMove for one chunk of lines [ starts[i], ends[i] ) of buf.
+    #
+    # return ( kind, rows, motion, words, tails )
+    #   kind   : LINE_* for each line ( LINE_ODD lines are resolved to one of the others here )
+    #   rows   : index of the G0 - G3 lines ( ascending )
+    #   motion : 0 - 3 ( G0 - G3 ) of the rows
+    #   words  : float array [ len( rows ), 8 ] of MOVE_WORDS ( nan : not present )
+    #   tails  : { index in rows : tail }
 
-                            try:
-                                xy = xy.split( 'x' )
+    n   = len( starts )
+    st  = int( starts[ 0 ] )
+    ed  = int( ends[ -1 ] )
 
-                                b_x.append( int( xy[0] ) )
-                                b_y.append( int( xy[1] ) )
+    a   = np.frombuffer( buf, dtype = np.uint8, count = ed - st, offset = st )
+    ap  = np.concatenate( ( a, np.zeros( 4, dtype = np.uint8 ) ) )     # padded, for look ahead
 
-                            except:
-                                pass
+    s   = starts - st
+    e   = ends - st
 
-                        if len( b_x ) > 0 and len( b_y ) > 0:
+    # rstrip( "\r\n" )
 
-                            self.bed_x_min = min( b_x )
-                            self.bed_x_max = max( b_x )
-                            self.bed_y_min = min( b_y )
-                            self.bed_y_max = max( b_y )
+    e2 = e.copy()
 
-                        continue
+    for c in ( 0x0a, 0x0d ):
+        e2 -= ( e2 > s ) & ( ap[ np.maximum( e2 - 1, 0 ) ] == c )
 
-                if f_est == False:
-                    m = KW_EST_PRINT_TIME.match( ln )
+    ln_len = e2 - s
 
-                    if m:
-                        f_est = True
+    c0 = ap[ s ]
+    c1 = ap[ s + 1 ]
+    c2 = ap[ s + 2 ]
+    c3 = ap[ s + 3 ]
 
-                        def num_int( x ):
+    def is_ws( c ):
+        return ( c == 0x20 ) | ( c == 0x09 ) | ( c == 0x0d ) | ( c == 0x0b ) | ( c == 0x0c )
 
-                            ret = 0
+    kind = np.full( n, LINE_OTHER, dtype = np.uint8 )
 
-                            try:
-                                ret = int( x )
-                            except:
-                                pass
+    g01 = ( ln_len >= 3 ) & ( ( c0 | 0x20 ) == ord( 'g' ) ) & ( c1 >= ord( '0' ) ) & ( c1 <= ord( '3' ) )
 
-                            return ret
+    kind[ g01 & is_ws( c2 ) ]                                                   = LINE_ODD
+    kind[ g01 & ( ( c2 == 0x20 ) | ( c2 == 0x09 ) ) & ( ln_len >= 4 ) & ( c3 != ord( ';' ) ) ] = LINE_G1
+    kind[ g01 & ( ( c2 == 0x20 ) | ( c2 == 0x09 ) ) & ( ( ln_len < 4 ) | ( c3 == ord( ';' ) ) ) ] = LINE_OTHER
+    c4 = ap[ s + 4 ]
 
-                        td = num_int( m.group( 1 ) )
-                        th = num_int( m.group( 2 ) )
-                        tm = num_int( m.group( 3 ) )
-                        ts = num_int( m.group( 4 ) )
+    kind[ ( ln_len >= 4 ) & ( ( c0 | 0x20 ) == ord( 'm' ) ) & ( c1 == ord( '2' ) ) & ( c2 == ord( '0' ) )
+        & np.isin( c3, np.frombuffer( b'1345', dtype = np.uint8 ) )
+        & ( ( ln_len == 4 ) | is_ws( c4 ) | ( c4 == ord( ';' ) ) ) ]            = LINE_MACHINE
+    kind[ ( ln_len > 0 ) & is_ws( c0 ) ]                                        = LINE_ODD
+    kind[ ( ln_len > 0 ) & ( c0 == ord( ';' ) ) ]                               = LINE_COMMENT
 
-                        self.time_est = ( td * 60 * 60 * 24 ) + ( th * 60 * 60 ) + ( tm * 60 ) + ts
+    g_rows = np.flatnonzero( kind == LINE_G1 )
 
-                        continue
+    gs  = s[ g_rows ]
+    ge  = e2[ g_rows ]
+    gm  = c1[ g_rows ] - ord( '0' )
 
-            else:
-                g1 = parseG1( ln )
+    # parameter area [ gs + 2, pe ), pe : first ';' or end of line
 
-                if g1 is not None:
+    semi = np.append( np.flatnonzero( a == ord( ';' ) ), len( ap ) )
+    pe = np.minimum( semi[ np.searchsorted( semi, gs + 2 ) ], ge )
 
-                    if g1.Z is not None:
-                        c_z = g1.Z
+    # words : a letter followed by -?[0-9.]+
 
-                    if (    ( c_z < c_l )                                   # z lower   ( ex. Start extrude (0.2mm) is higher than first layer (<0.2mm)
-                        or  (   c_z > c_l                                   # z higher
-                            and (   ( g1.Z is not None and g1.Z < c_zz )    #   z down
-                                or  ( g1.E is not None and g1.E > 0 )       #   extrude
-                                )
-                            )
-                        ):
+    is_num  = ( ( ap >= ord( '0' ) ) & ( ap <= ord( '9' ) ) ) | ( ap == ord( '.' ) )
+    is_dot  = ( ap == ord( '.' ) )
+    upper   = ap & 0xdf
+    is_alp  = ( upper >= ord( 'A' ) ) & ( upper <= ord( 'Z' ) ) & ( ap >= ord( 'A' ) )
 
-                        self.layer_data.append( LayerData( self.value_correction( c_l ), layer ) )
-                        layer = []
-                        c_l = c_z
+    p = np.flatnonzero( is_alp[ : len( a ) ] )
 
-                    if g1.F is not None:
-                        c_f = g1.F
+    li = np.searchsorted( gs, p, side = 'right' ) - 1                  # index in g_rows
+    ok = li >= 0
+    p  = p[ ok ]
+    li = li[ ok ]
 
-                    if g1.X is not None or g1.Y is not None or g1.Z is not None:
+    ok = ( p >= gs[ li ] + 2 ) & ( p < pe[ li ] )
+    p  = p[ ok ]
+    li = li[ ok ]
 
-                        if g1.E is not None and g1.E > 0:
-                            feedrates.add( c_f )
+    q0 = p + 1 + ( ap[ p + 1 ] == ord( '-' ) )
 
-                        x = ( g1.X - c_x )  if g1.X is not None else 0
-                        y = ( g1.Y - c_y )  if g1.Y is not None else 0
-                        z = ( g1.Z - c_zz ) if g1.Z is not None else 0
-                        l = math.sqrt( x * x + y * y + z * z )
-                        tmd = l / ( c_f / 60 )
-                        tm_calc += tmd
+    not_num = np.flatnonzero( ~is_num )
+    q1 = np.minimum( not_num[ np.searchsorted( not_num, q0 ) ], pe[ li ] )
 
-                        layer.append( G1code( g1.X, g1.Y, g1.Z, g1.E, g1.F, g1.tail, c_x, c_y, c_f, no, tm_calc, tmd ) )
+    ok = q1 > q0
+    p  = p[ ok ]
+    li = li[ ok ]
+    q0 = q0[ ok ]
+    q1 = q1[ ok ]
 
-                    if g1.X is not None:
-                        c_x = g1.X
+    # check numbers ( float() would fail ) -> regex path
 
-                    if g1.Y is not None:
-                        c_y = g1.Y
+    dot_cum = np.concatenate( ( [ 0 ], np.cumsum( is_dot ) ) )
+    dots = dot_cum[ q1 ] - dot_cum[ q0 ]
 
-                    if g1.Z is not None:
-                        c_zz = g1.Z
+    bad = ( dots > 1 ) | ( ( q1 - q0 ) - dots == 0 ) | ( q1 - p > G1_TOKEN_WIDTH )
 
-        if len( layer ) != 0:
-            self.layer_data.append( LayerData( self.value_correction( c_l ), layer ) )
+    odd_li = np.unique( li[ bad ] )
+    kind[ g_rows[ odd_li ] ] = LINE_ODD
 
-        self.time_calc = tm_calc
+    g_ok = np.ones( len( g_rows ), dtype = bool )
+    g_ok[ odd_li ] = False
 
-        if self.time_est != 0 and self.time_calc != 0:
-            self.time_diff_rate = self.time_est / self.time_calc
+    letter = upper[ p ]
 
-        self.feedrates = sorted( feedrates )
+    sel = g_ok[ li ] & np.isin( letter, np.frombuffer( MOVE_WORDS.encode(), dtype = np.uint8 ) )
+    p       = p[ sel ]
+    li      = li[ sel ]
+    q1      = q1[ sel ]
+    letter  = letter[ sel ]
 
-class Viewer:
+    # number text ( with sign ) -> float in one go
 
-    option = None
-    root = None
+    width = int( ( q1 - p - 1 ).max() ) if len( p ) > 0 else 1
 
-    zoom = ZOOM_DEFAULT
+    idx = ( p + 1 )[ :, None ] + np.arange( width )
+    txt = ap[ np.minimum( idx, len( ap ) - 1 ) ]
+    txt[ idx >= q1[ :, None ] ] = 0
+    val = txt.view( 'S%d' % ( width, ) ).ravel().astype( np.float64 )
 
-    bed_w = DEFAULT_BED_W
-    bed_h = DEFAULT_BED_H
-    bed_m = DEFAULT_BED_M
+    words = np.full( ( len( g_rows ), len( MOVE_WORDS ) ), np.nan )
 
-    surface = None
+    for ( i, w ) in enumerate( MOVE_WORDS.encode() ):
+        m = ( letter == w )
+        l = li[ m ]
+        v = val[ m ]
 
-    feedrate_color_h_st = 0.125     # HSV Color H Start
-    feedrate_color_h_ln = -0.25     # HSV Color H Length
+        last = np.ones( len( l ), dtype = bool )        # the last one wins
+        last[ : -1 ] = l[ 1: ] != l[ : -1 ]
 
-    canv_rect_xy = Point( 1, 1 )
-    canv_rect_wh = Point( 2, 2 )
+        words[ l[ last ], i ] = v[ last ]
 
-    canv_rect_offset_X = 0.0
-    canv_rect_offset_Y = 0.0
+    words = words[ g_ok ]
+    gm = gm[ g_ok ]
+    pe = pe[ g_ok ]
+    ge = ge[ g_ok ]
+    g_rows = g_rows[ g_ok ]
 
-    canv_padxy = 8
+    tails = {}
 
-    gcode = None
-    gcode_lns = []
-    gcode_fr_map = {}
-    gcode_fr_fail = skia.HSVToColor( [ feedrate_color_h_st  * 360, 1, 1 ] )
-    gcode_thumbnail = None
+    for i in np.flatnonzero( pe < ge ).tolist():
+        tails[ i ] = bytes( buf[ st + int( pe[ i ] ) : st + int( ge[ i ] ) ] ).decode( 'utf8', errors = 'replace' )
 
-    scan_mark = None
+    # odd lines
 
-    bed_color = 0xff333333
-    legend_border_color = 0xff33ff33
+    odd_rows = np.flatnonzero( kind == LINE_ODD )
 
-    config_padxy = 10
+    if len( odd_rows ) > 0:
 
-    play_timer_id = None
+        o_rows  = []
+        o_gm    = []
+        o_words = []
+        o_tails = []
 
-    play_timer_span_dic = {  # ms, skip
-        "Slow"         : ( int( 1000 /  10 ), 1 )
-    ,   "Normal"       : ( int( 1000 / 100 ), 1 )
-    ,   "Fast"         : ( int( 1000 / 100 ), 5 )
-    ,   "VeryFast"     : ( int( 1000 / 100 ), 10 )
-    ,   "SupreSpeed"    : ( int( 1000 / 100 ), 20 )
-    ,   "UltraSpeed"    : ( int( 1000 / 100 ), 50 )
-    ,   "SoundSpeed"     : ( int( 1000 / 100 ), 100 )
-    ,   "HeavenlySpeed"  : ( int( 1000 / 100 ), 200 )
-    ,   "LightningSpeed" : ( int( 1000 / 100 ), 500 )
-    ,   "GodSpeed"       : ( int( 1000 / 100 ), -1 )
-    }
+        for i in odd_rows.tolist():
+            ln = bytes( buf[ st + int( s[ i ] ) : st + int( e2[ i ] ) ] )
 
-    thread_gl = None
-    thread_gl_filename  = None
-    thread_gl_thread    = None
-    thread_gl_th_image  = None
-    thread_gl_ptm       = int( 1000 / 8 )
+            if KW_COMMENT_B.match( ln ):
+                kind[ i ] = LINE_COMMENT
+                continue
 
-    experiment = None
+            if KW_MACHINE_B.match( ln ):
+                kind[ i ] = LINE_MACHINE
+                continue
 
-    def __init__( self, **kwargs ):
-        self.option = kwargs
+            mv = parseMove( ln )
 
-        self.bed_w = self.option.get( "bed_w", self.bed_w )
-        self.bed_h = self.option.get( "bed_h", self.bed_h )
+            if mv is None:
+                kind[ i ] = LINE_OTHER
+                continue
 
-    def isModeExp( self ):
-        return self.option.get( 'experiment', False )
+            kind[ i ] = LINE_G1
 
-    def play_timer_span( self ):
-        return self.play_timer_span_dic.get( self.cbo_pl.get() )
+            o_rows.append( i )
+            o_gm.append( mv[0] )
+            o_words.append( mv[1] )
+            o_tails.append( mv[2] )
 
-    def gcode_ln_min( self ):
-        return 1 if len( self.gcode.layer_data ) > 1 else 0
+        if len( o_rows ) > 0:
+            rows = np.concatenate( ( g_rows, o_rows ) )
+            order = np.argsort( rows, kind = 'stable' )
 
-    def gcode_ln_max( self ):
-        return len( self.gcode.layer_data ) - 1
+            g_tails = [ None ] * len( g_rows )
 
-    def gcode_li_max( self ):
-        try:
-            return len( self.gcode.layer_data[ self.gcode_ln() ].layer ) - 1
-        except IndexError:
-            return 0
+            for ( i, t ) in tails.items():
+                g_tails[ i ] = t
 
-    def gcode_ln( self ):
-        return self.scale_v_value.get()
+            g_tails += o_tails
 
-    def gcode_li( self ):
-        return self.scale_h_value.get()
+            g_rows  = rows[ order ]
+            gm      = np.concatenate( ( gm, o_gm ) ).astype( np.uint8 )[ order ]
+            words   = np.concatenate( ( words, np.array( o_words, dtype = np.float64 ) ) )[ order ]
+            tails   = { j : g_tails[ i ] for ( j, i ) in enumerate( order.tolist() ) if g_tails[ i ] is not None }
 
-    def gcode_layer( self, ln ):
-        try:
-            return self.gcode.layer_data[ ln ].layer
-        except IndexError:
-            return []
+    return ( kind, g_rows, gm.astype( np.uint8 ), words, tails )
 
-    def gcode_layer_height( self, ln ):
-        try:
-            return self.gcode.layer_data[ ln ].height
-        except IndexError:
-            return 0
+TokenizedChunk = collections.namedtuple( 'TokenizedChunk', ( 'ed', 'starts', 'ends', 'rows', 'motion', 'words', 'tails', 'comments', 'machine' ) )
 
-    def gcode_lnli( self, ln, li ):
-        layer = self.gcode_layer( ln )
+def tokenizeChunk( buf, ed, starts, ends ):
 
-        if len( layer ) == 0:
-            return None
+    # tokenizeG1 of one chunk of lines, plus the comment and the machine limit lines ( [ ( line index, bytes without newline ) ] )
 
-        if li < 0:
-            li = 0
-        elif li >= len( layer ):
-            li = len( layer ) - 1
+    ( kind, rows, motion, words, tails ) = tokenizeG1( buf, starts, ends )
 
-        return layer[ li ]
+    ( comments, machine ) = (
+        [ ( i, bytes( buf[ int( starts[ i ] ) : int( ends[ i ] ) ] ).rstrip( b"\r\n" ) ) for i in np.flatnonzero( kind == k ).tolist() ]
+        for k in ( LINE_COMMENT, LINE_MACHINE )
+        )
 
-    def bedOuter( self ):
-        return Point( self.bed_w + self.bed_m * 2, self.bed_h + self.bed_m * 2 )
+    return TokenizedChunk( ed, starts, ends, rows, motion, words, tails, comments, machine )
 
-    def drawAreaSize( self ):
-        bed_o = self.bedOuter()
-        return Point( int( bed_o.X * self.zoom ), int( bed_o.Y * self.zoom ) )
+def tokenizeFileRange( filename, st, ed, chunk_size ):
 
-    def canvAreaSize( self ):
-        return Point( self.canv_rect_wh.X - self.canv_rect_xy.X, self.canv_rect_wh.Y - self.canv_rect_xy.Y )
+    # Worker of the parallel loader ( runs in another process ) : tokenizeChunk over the lines of file[ st : ed ]
 
-    def feedrateColor( self, fr ):
-        return self.gcode_fr_map.get( fr, self.gcode_fr_fail )
+    buf = openGcodeBuffer( filename )
 
-    def setupGcode( self, gcode, filename = None ):
-        title_tail = ""
+    try:
+        return [ tokenizeChunk( buf, *c ) for c in lineChunks( buf, chunk_size, st, ed ) ]
+    finally:
+        if isinstance( buf, mmap.mmap ):
+            buf.close()
 
-        if filename is not None:
-            # title_tail = " - %s [%s]" % ( os.path.basename( filename ), filename )
-            title_tail = " - [%s]" % ( os.path.basename( filename ) )
+LayerData = collections.namedtuple( 'LayerData', ( 'height', 'layer' ) )
+LoadState = collections.namedtuple( 'LoadState', ( 'c_x', 'c_y', 'c_z', 'c_l', 'c_f', 'tm_calc' ) )
 
-        self.root.title( SCRIPT_NAME + title_tail)
+ARC_TOLERANCE       = 0.02                  # chord error of the arc segments ( mm ), the finest of LAYER_LOD_LEVELS ( -a for finer arcs )
+ARC_MAX_SEGMENTS    = 1024                  # per arc
 
-        self.gcode = gcode
+def expandArcs( c_x, c_y, motion, words, tails, tolerance = ARC_TOLERANCE ):
 
-        self.scale_v.configure( from_ = self.gcode_ln_max(), to = self.gcode_ln_min() )
-        self.scale_v_value.set( self.gcode_ln_min() )
+    # Replace the G2 / G3 rows of a block with chords ( G1 rows ), all arcs at once.
+    #
+    #   c_x, c_y : position before the block, motion / words / tails : as tokenizeG1
+    # return ( src, words, tails )
+    #   src   : row of the input for each output row
+    #   words : [ X, Y, Z, E, F ] of the output rows
+    #
+    # The center is start + ( I, J ), or from R ( R < 0 : the longer arc ), with the same rules as Marlin.
+    # E is split evenly over the chords ( of the same length ), Z and F are set on the first chord.
+    # An arc without a center ( radius 0 ) stays a linear move.
 
-        self.scale_h.configure( from_ = 0, to = self.gcode_li_max() )
-        self.scale_h_value.set( 0 )
+    n = len( motion )
 
-        self.gcode_fr_map = {}
+    ( X, Y ) = ( words[ :, 0 ], words[ :, 1 ] )
 
-        if len( gcode.feedrates ) > 0:
-            min_fr = min( gcode.feedrates )
-            max_fr = max( gcode.feedrates )
-            wid_fr = max_fr - min_fr
+    ex = forwardFill( X, c_x )
+    ey = forwardFill( Y, c_y )
+    sx = np.concatenate( ( [ c_x ], ex[ : -1 ] ) )
+    sy = np.concatenate( ( [ c_y ], ey[ : -1 ] ) )
 
-            for fr in gcode.feedrates:
+    arc = np.flatnonzero( motion >= 2 )
 
-                p = ( ( fr - min_fr ) / wid_fr )
-                h = self.feedrate_color_h_st + self.feedrate_color_h_ln * p
+    a_sx = sx[ arc ]
+    a_sy = sy[ arc ]
+    a_ex = ex[ arc ]
+    a_ey = ey[ arc ]
+    cw   = motion[ arc ] == 2
+    ( I, J, R ) = ( np.nan_to_num( words[ arc, 5 ] ), np.nan_to_num( words[ arc, 6 ] ), words[ arc, 7 ] )
 
-                if h < 0.0:
-                    h += 1.0
-                elif h > 1.0:
-                    h -= 1.0
+    # R form -> I, J
 
-                c = skia.HSVToColor( [ h * 360, 1, 1 ] )
+    dx = a_ex - a_sx
+    dy = a_ey - a_sy
+    d  = np.hypot( dx, dy )
 
-                self.gcode_fr_map[ fr ] = c
+    use_r = ~np.isnan( R ) & ( R != 0 ) & ( d > 0 )
 
-        self.zoom = ZOOM_DEFAULT
+    if np.any( use_r ):
+        r  = R[ use_r ]
+        dd = d[ use_r ]
+        e  = np.where( cw[ use_r ] ^ ( r < 0 ), -1.0, 1.0 )
+        h  = np.sqrt( np.maximum( r * r - ( dd * 0.5 ) ** 2, 0 ) )
 
-        if self.gcode.bed_x_max is not None:
-            self.bed_w = self.gcode.bed_x_max
+        I[ use_r ] = dx[ use_r ] * 0.5 + e * h * ( -dy[ use_r ] / dd )
+        J[ use_r ] = dy[ use_r ] * 0.5 + e * h * (  dx[ use_r ] / dd )
 
-        if self.gcode.bed_y_max is not None:
-            self.bed_h = self.gcode.bed_y_max
+    radius = np.hypot( I, J )
 
-        self.gcode_thumbnail = None
+    # angular travel ( < 0 : clockwise ), a full circle when the end is the start
 
-        thumbnail_bytes = self.gcode.getThumbnailImage()
+    ( rp, rq ) = ( -I, -J )
+    ( tx, ty ) = ( a_ex - ( a_sx + I ), a_ey - ( a_sy + J ) )
 
-        if thumbnail_bytes != None:
-            self.gcode_thumbnail = skia.Image.MakeFromEncoded( skia.Data( thumbnail_bytes ) )
+    ang = np.arctan2( rp * ty - rq * tx, rp * tx + rq * ty )
+    ang = np.where( ang < 0, ang + 2 * np.pi, ang )
+    ang = np.where( cw, ang - 2 * np.pi, ang )
+    ang = np.where( ( ang == 0 ) & ( d == 0 ), 2 * np.pi, ang )
 
-    def setupIcons( self ):
-        self.icon_zoom_in       = makeTkImage( svgIconRenderer( io.StringIO( ICON_ZOOM_IN ), 24, 24 ) )
-        self.icon_zoom_out      = makeTkImage( svgIconRenderer( io.StringIO( ICON_ZOOM_OUT ), 24, 24 ) )
-        self.icon_zoom_reset    = makeTkImage( svgIconRenderer( io.StringIO( ICON_ZOOM_RESET ), 24, 24 ) )
-        self.icon_up            = makeTkImage( svgIconRenderer( io.StringIO( ICON_UP ), 24, 24 ) )
-        self.icon_down          = makeTkImage( svgIconRenderer( io.StringIO( ICON_DOWN ), 24, 24 ) )
-        self.icon_forward_skip  = makeTkImage( svgIconRenderer( io.StringIO( ICON_FORWARD_SKIP ), 24, 24 ) )
-        self.icon_forward       = makeTkImage( svgIconRenderer( io.StringIO( ICON_FORWARD ), 24, 24 ) )
-        self.icon_backword      = makeTkImage( svgIconRenderer( io.StringIO( ICON_BACKWORD ), 24, 24 ) )
-        self.icon_backword_skip = makeTkImage( svgIconRenderer( io.StringIO( ICON_BACKWORD_SKIP ), 24, 24 ) )
-        self.icon_file_text     = makeTkImage( svgIconRenderer( io.StringIO( ICON_FILE_TEXT ), 24, 24 ) )
-        self.icon_file_svg      = makeTkImage( svgIconRenderer( io.StringIO( ICON_FILE_SVG ), 24, 24 ) )
-        self.icon_player_play   = makeTkImage( svgIconRenderer( io.StringIO( ICON_PLAYER_PLAY ), 24, 24 ) )
-        self.icon_player_pause  = makeTkImage( svgIconRenderer( io.StringIO( ICON_PLAYER_PAUSE ), 24, 24 ) )
-        self.icon_config        = makeTkImage( svgIconRenderer( io.StringIO( ICON_CONFIIG ), 24, 24 ) )
-        self.icon_close         = makeTkImage( svgIconRenderer( io.StringIO( ICON_CLOSE ), 16, 16, color = self.legend_border_color ) )
+    # chords : sagitta radius * ( 1 - cos( step / 2 ) ) <= tolerance
 
-    def close( self ):
-        if self.experiment != None:
-            self.experiment.close()
+    valid = radius > 0
+
+    step = 2 * np.arccos( np.clip( 1 - tolerance / np.where( valid, radius, 1 ), -1, 1 ) )
+    segs = np.ceil( np.abs( ang ) / np.maximum( step, 1e-9 ) )
+    segs = np.where( valid, np.clip( segs, 1, ARC_MAX_SEGMENTS ), 1 ).astype( np.int64 )
+
+    counts = np.ones( n, dtype = np.int64 )
+    counts[ arc ] = segs
+
+    src   = np.repeat( np.arange( n ), counts )
+    first = np.cumsum( counts ) - counts        # output row of the first chord of each input row
+
+    out = words[ src, : 5 ].copy()
+
+    # chord end points
+
+    a_idx = np.repeat( np.arange( len( arc ) ), segs )
+    k     = np.arange( len( a_idx ) ) - np.repeat( np.cumsum( segs ) - segs, segs ) + 1      # 1 .. segs
+    t     = k / segs[ a_idx ]
+
+    th  = np.arctan2( rq, rp )[ a_idx ] + ang[ a_idx ] * t
+    cx  = ( a_sx + I )[ a_idx ]
+    cy  = ( a_sy + J )[ a_idx ]
+    rr  = radius[ a_idx ]
+
+    px  = np.where( k == segs[ a_idx ], a_ex[ a_idx ], cx + rr * np.cos( th ) )
+    py  = np.where( k == segs[ a_idx ], a_ey[ a_idx ], cy + rr * np.sin( th ) )
+
+    rows = np.repeat( first[ arc ], segs ) + k - 1
+
+    v = valid[ a_idx ]
+
+    out[ rows[ v ], 0 ] = px[ v ]
+    out[ rows[ v ], 1 ] = py[ v ]
+    out[ rows, 3 ] /= segs[ a_idx ]
+
+    later = rows[ k > 1 ]
+    out[ later, 2 ] = np.nan
+    out[ later, 4 ] = np.nan
+
+    return ( src, out, { int( first[ i ] ) : tl for ( i, tl ) in tails.items() } )
+
+def forwardFill( a, init ):
+    # replace nan with the last value before it ( init at the head )
+    idx = np.where( np.isnan( a ), 0, np.arange( 1, len( a ) + 1 ) )
+    np.maximum.accumulate( idx, out = idx )
+    return np.concatenate( ( [ init ], a ) )[ idx ]
+
+G1_FLAG_X       = 0x01
+G1_FLAG_Y       = 0x02
+G1_FLAG_Z       = 0x04
+G1_FLAG_E       = 0x08
+G1_FLAG_F       = 0x10
+G1_FLAG_EXTRUDE = 0x20      # E > 0
+
+class ToolpathLayer( collections.abc.Sequence ):
+
+    # View of the moves [ st, ed ) of a Toolpath. Indexing and iteration return G1code.
+
+    def __init__( self, toolpath, st, ed ):
+        self.toolpath = toolpath
+        self.st = st
+        self.ed = ed
+
+    def __len__( self ):
+        return self.ed - self.st
+
+    def __getitem__( self, i ):
+        if isinstance( i, slice ):
+            return [ self[ j ] for j in range( *i.indices( len( self ) ) ) ]
+
+        if i < 0:
+            i += len( self )
+
+        if i < 0 or i >= len( self ):
+            raise IndexError( i )
+
+        return self.toolpath.g1code( self.st + i )
+
+    def __iter__( self ):
+        return self.toolpath.iterG1code( self.st, self.ed )
+
+    def column( self, name ):
+        return getattr( self.toolpath, name )[ self.st : self.ed ]
+
+    def extrusionHeads( self, st, ed ):
+        # the extrusion moves ( E > 0 without Z ) of [ st, ed ) as toolpath indices, and True at the first move of each polyline
+        tp  = self.toolpath
+        idx = np.flatnonzero( ( tp.flags[ self.st + st : self.st + ed ] & ( G1_FLAG_EXTRUDE | G1_FLAG_Z ) ) == G1_FLAG_EXTRUDE ) + self.st + st
+        cf  = tp.cf[ idx ]
+
+        head = np.ones( len( idx ), dtype = bool )
+        head[ 1: ] = ( idx[ 1: ] != idx[ : -1 ] + 1 ) | ( cf[ 1: ] != cf[ : -1 ] )
+
+        return ( idx, head )
+
+    def extrusionRuns( self, st = 0, ed = None, take = None ):
+        # Polylines of the extrusion moves ( E > 0 without Z ) of [ st, ed ), split at the other moves and at feedrate changes.
+        # take : indices of the polylines to return ( see extrusionRunsOf ), None : all
+        # return [ ( feedrate, points [ n, 2 ] ) ], a polyline starts at the current position of its first move
+
+        ed = len( self ) if ed is None else ed
+
+        tp = self.toolpath
+
+        ( idx, head ) = self.extrusionHeads( st, ed )
+
+        if take is not None:
+            on = np.zeros( np.count_nonzero( head ), dtype = bool )
+            on[ take ] = True
+            keep = on[ np.cumsum( head ) - 1 ]
+            ( idx, head ) = ( idx[ keep ], head[ keep ] )
+
+        cf    = tp.cf[ idx ]
+        heads = np.flatnonzero( head )
+
+        pos = np.arange( len( idx ) ) + np.cumsum( head )               # index of the end point of each move
+        hp  = pos[ heads ] - 1                                          # index of the start point of each polyline
+
+        ( cx, cy, x, y ) = ( tp.cx[ idx ], tp.cy[ idx ], tp.X[ idx ], tp.Y[ idx ] )
+
+        pts = np.empty( ( len( idx ) + len( heads ), 2 ) )
+        pts[ pos, 0 ] = np.where( np.isnan( x ), cx, x )
+        pts[ pos, 1 ] = np.where( np.isnan( y ), cy, y )
+        pts[ hp, 0 ]  = cx[ heads ]
+        pts[ hp, 1 ]  = cy[ heads ]
+
+        return list( zip( cf[ heads ].tolist(), np.split( pts, hp[ 1: ] ) ) )
+
+    def extrusionRunsOf( self, st, ed, moves ):
+        # the extrusionRuns( st, ed ) holding any of moves ( sorted indices, e.g. SegmentGrid.query ) :
+        # ( their indices, the feedrates of all the polylines )
+        # A polyline is taken whole : cut at the moves off the canvas, its joins and the overlaps would be drawn otherwise.
+
+        ( idx, head ) = self.extrusionHeads( st, ed )
+
+        frs = self.toolpath.cf[ idx[ head ] ]
+
+        if len( idx ) == 0:
+            return ( np.zeros( 0, dtype = np.int64 ), frs )
+
+        run = np.cumsum( head ) - 1
+        pos = np.minimum( np.searchsorted( idx, moves + self.st ), len( idx ) - 1 )
+
+        return ( np.unique( run[ pos[ idx[ pos ] == moves + self.st ] ] ), frs )
+
+    def otherMoves( self, st = 0, ed = None, moves = None ):
+        # indices of the moves of [ st, ed ) that are not in an extrusion polyline ( travel, z ),
+        # moves : sorted indices of the moves to take ( e.g. SegmentGrid.query )
+        ed = len( self ) if ed is None else ed
+
+        if moves is None:
+            flags = self.toolpath.flags[ self.st + st : self.st + ed ]
+            return ( np.flatnonzero( ( flags & ( G1_FLAG_EXTRUDE | G1_FLAG_Z ) ) != G1_FLAG_EXTRUDE ) + st ).tolist()
+
+        moves = moves[ ( moves >= st ) & ( moves < ed ) ]
+        return moves[ ( self.toolpath.flags[ moves + self.st ] & ( G1_FLAG_EXTRUDE | G1_FLAG_Z ) ) != G1_FLAG_EXTRUDE ].tolist()
+
+    def extrusionSkip( self, li, n ):
+        # index of the n th extrusion move after the move li ( n < 0 : before ), the first / last move if there are less
+        # ( binary search of Toolpath.extrusionCount )
+
+        ec = self.toolpath.extrusionCount()[ self.st : self.ed ]
+        c  = int( ec[ li ] )
+
+        if n < 0:
+            c -= int( self.toolpath.E[ self.st + li ] > 0 )         # the extrusion moves before li
+
+        i = int( np.searchsorted( ec, c + n + ( 1 if n < 0 else 0 ) ) )
+
+        return max( 0, min( i, len( self ) - 1 ) )
+
+    def checkpoints( self, step ):
+        # Move indices about every step moves where no extrusion polyline goes on ( the runs of [ 0, c ) and [ c, ed )
+        # are those of [ 0, ed ) ), a run longer than step is cut. The first is 0.
+
+        tp = self.toolpath
+        key = ( step, self.st, self.ed )
+
+        if key in tp.checkpoint:
+            return tp.checkpoint[ key ]
+
+        ext = ( tp.flags[ self.st : self.ed ] & ( G1_FLAG_EXTRUDE | G1_FLAG_Z ) ) == G1_FLAG_EXTRUDE
+        cf  = tp.cf[ self.st : self.ed ]
+
+        cont = np.zeros( len( ext ), dtype = bool )
+        cont[ 1: ] = ext[ 1: ] & ext[ : -1 ] & ( cf[ 1: ] == cf[ : -1 ] )
+
+        free = np.flatnonzero( ~cont )
+        want = np.arange( step, len( ext ), step )
+
+        cps = free[ np.searchsorted( free, want, side = 'right' ) - 1 ] if len( free ) > 0 else want
+        cps = np.where( want - cps < step, cps, want )
+
+        tp.checkpoint[ key ] = np.unique( np.concatenate( ( [ 0 ], cps ) ) )
+        return tp.checkpoint[ key ]
+
+class SegmentGrid:
+
+    # Uniform grid of the moves of a ToolpathLayer ( cell : mm ) for the culling at high zoom.
+    # A move is the segment from its current position to its end point, a long one is put in the cells along it
+    # ( pieces of a cell length ), so the size is about the path length / cell. The cells are kept as CSR in row order :
+    # query() of a rectangle takes one slice per row.
+
+    def __init__( self, layer, cell = LAYER_GRID_CELL ):
+        tp = layer.toolpath
+
+        ( st, ed ) = ( layer.st, layer.ed )
+
+        x0 = tp.cx[ st : ed ]
+        y0 = tp.cy[ st : ed ]
+        x1 = np.where( np.isnan( tp.X[ st : ed ] ), x0, tp.X[ st : ed ] )
+        y1 = np.where( np.isnan( tp.Y[ st : ed ] ), y0, tp.Y[ st : ed ] )
+
+        moves = np.flatnonzero( ~( np.isnan( x0 ) | np.isnan( y0 ) ) )       # NaN : no position yet
+
+        ( x0, y0, x1, y1 ) = ( x0[ moves ], y0[ moves ], x1[ moves ], y1[ moves ] )
+
+        self.cell = cell
+        self.org  = Point( float( np.fmin( x0, x1 ).min() ), float( np.fmin( y0, y1 ).min() ) ) if len( moves ) > 0 else Point( 0.0, 0.0 )
+        self.end  = Point( float( np.fmax( x0, x1 ).max() ), float( np.fmax( y0, y1 ).max() ) ) if len( moves ) > 0 else Point( 0.0, 0.0 )
+        self.nx   = int( ( self.end.X - self.org.X ) // cell ) + 1
+        self.ny   = int( ( self.end.Y - self.org.Y ) // cell ) + 1
+
+        # pieces of a cell length at most, each in 2 x 2 cells at most
+
+        n = np.maximum( np.ceil( np.maximum( np.abs( x1 - x0 ), np.abs( y1 - y0 ) ) / cell ), 1 ).astype( np.int64 )
+
+        m = np.repeat( np.arange( len( moves ) ), n )
+        j = np.arange( len( m ) ) - np.repeat( np.cumsum( n ) - n, n )
+
+        t0 = j / n[ m ]
+        t1 = ( j + 1 ) / n[ m ]
+
+        ( dx, dy ) = ( x1 - x0, y1 - y0 )
+
+        ( px0, px1 ) = ( x0[ m ] + dx[ m ] * t0, x0[ m ] + dx[ m ] * t1 )
+        ( py0, py1 ) = ( y0[ m ] + dy[ m ] * t0, y0[ m ] + dy[ m ] * t1 )
+
+        ( ix0, ix1 ) = ( self.cellX( np.fmin( px0, px1 ) ), self.cellX( np.fmax( px0, px1 ) ) )
+        ( iy0, iy1 ) = ( self.cellY( np.fmin( py0, py1 ) ), self.cellY( np.fmax( py0, py1 ) ) )
+
+        sx = ix1 != ix0
+        sy = iy1 != iy0
+
+        cells = np.concatenate( ( iy0 * self.nx + ix0, ( iy0 * self.nx + ix1 )[ sx ], ( iy1 * self.nx + ix0 )[ sy ], ( iy1 * self.nx + ix1 )[ sx & sy ] ) )
+        order = np.argsort( cells )
+
+        self.layer_len = len( layer )
+        self.moves = np.concatenate( ( moves[ m ], moves[ m[ sx ] ], moves[ m[ sy ] ], moves[ m[ sx & sy ] ] ) )[ order ].astype( np.int32 )
+        self.start = np.concatenate( ( [ 0 ], np.cumsum( np.bincount( cells, minlength = self.nx * self.ny ) ) ) )
+
+    def cellX( self, x ):
+        return np.clip( np.floor_divide( np.subtract( x, self.org.X ), self.cell ).astype( np.int64 ), 0, self.nx - 1 )
+
+    def cellY( self, y ):
+        return np.clip( np.floor_divide( np.subtract( y, self.org.Y ), self.cell ).astype( np.int64 ), 0, self.ny - 1 )
+
+    def coverage( self, x0, y0, x1, y1 ):
+        # part of the bounding box of the layer in the rectangle ( 0 .. 1 )
+
+        w = max( self.end.X - self.org.X, self.cell )
+        h = max( self.end.Y - self.org.Y, self.cell )
+
+        iw = max( min( x1, self.org.X + w ) - max( x0, self.org.X ), 0 )
+        ih = max( min( y1, self.org.Y + h ) - max( y0, self.org.Y ), 0 )
+
+        return ( iw * ih ) / ( w * h )
+
+    def query( self, x0, y0, x1, y1 ):
+        # sorted indices of the moves which may cross the rectangle ( bed coordinates )
+
+        if x1 < self.org.X or y1 < self.org.Y or x0 > self.end.X or y0 > self.end.Y:
+            return np.zeros( 0, dtype = np.int32 )
+
+        ( cx0, cx1 ) = ( int( self.cellX( x0 ) ), int( self.cellX( x1 ) ) )
+        ( cy0, cy1 ) = ( int( self.cellY( y0 ) ), int( self.cellY( y1 ) ) )
+
+        hit = np.zeros( self.layer_len, dtype = bool )
+
+        for r in range( cy0, cy1 + 1 ):
+            hit[ self.moves[ self.start[ r * self.nx + cx0 ] : self.start[ r * self.nx + cx1 + 1 ] ] ] = True
+
+        return np.flatnonzero( hit )
+
+class PolylineLOD:
+
+    # Douglas-Peucker simplification of polylines ( extrusionRuns ) for all the tolerances at once.
+    # The recursion runs once with the smallest tolerance over all polylines together ( a numpy step per depth ),
+    # each split point gets the distance that split it, capped by that of its parent split : the points of a weight
+    # above tol are those Douglas-Peucker keeps with tol ( the recursion tree is the same for every tolerance ).
+
+    def __init__( self, runs, tol ):
+        self.feedrates = [ fr for ( fr, _ ) in runs ]
+        self.points    = np.concatenate( [ p for ( _, p ) in runs ] ) if len( runs ) > 0 else np.zeros( ( 0, 2 ) )
+
+        n  = np.array( [ len( p ) for ( _, p ) in runs ], dtype = np.int64 )
+        ed = np.cumsum( n )
+        st = ed - n
+
+        pts = self.points
+
+        self.heads  = st
+        self.weight = np.zeros( len( pts ) )
+        self.weight[ st ] = np.inf
+        self.weight[ ed - 1 ] = np.inf
+
+        ( a, b, cap ) = ( st, ed - 1, np.full( len( st ), np.inf ) )
+
+        while True:
+            more = b - a > 1
+            ( a, b, cap ) = ( a[ more ], b[ more ], cap[ more ] )
+
+            if len( a ) == 0:
+                break
+
+            n   = b - a - 1
+            off = np.cumsum( n ) - n
+            seg = np.repeat( np.arange( len( a ) ), n )
+            idx = np.arange( len( seg ) ) - off[ seg ] + a[ seg ] + 1
+
+            # distance to the segment a - b ( a point if a = b, e.g. a closed perimeter )
+
+            ( pa, ab ) = ( pts[ a ][ seg ], ( pts[ b ] - pts[ a ] )[ seg ] )
+
+            ap = pts[ idx ] - pa
+            l2 = ( ab * ab ).sum( axis = 1 )
+            t  = np.clip( np.divide( ( ap * ab ).sum( axis = 1 ), l2, out = np.zeros( len( l2 ) ), where = l2 > 0 ), 0, 1 )
+            d  = np.hypot( ap[ :, 0 ] - ab[ :, 0 ] * t, ap[ :, 1 ] - ab[ :, 1 ] * t )
+
+            dmax = np.maximum.reduceat( d, off )
+
+            hit = np.flatnonzero( d == dmax[ seg ] )
+            hit = hit[ np.concatenate( ( [ True ], seg[ hit[ 1: ] ] != seg[ hit[ : -1 ] ] ) ) ]    # the first farthest point
+
+            split = dmax > tol
+
+            ( k, w ) = ( idx[ hit ][ split ], np.minimum( dmax, cap )[ split ] )
+
+            self.weight[ k ] = w
+
+            ( a, b, cap ) = ( np.concatenate( ( a[ split ], k ) ), np.concatenate( ( k, b[ split ] ) ), np.concatenate( ( w, w ) ) )
+
+    def nbytes( self ):
+        return self.points.nbytes + self.weight.nbytes
+
+    def runs( self, tol, take = None ):
+        # the polylines simplified with tol ( mm ), as extrusionRuns ( take : indices of the polylines, None : all )
+        keep  = self.weight > tol
+        heads = self.heads
+        frs   = self.feedrates
+
+        if take is not None:
+            on = np.zeros( len( heads ), dtype = bool )
+            on[ take ] = True
+            keep &= np.repeat( on, np.diff( heads, append = len( self.points ) ) )
+            ( heads, frs ) = ( heads[ take ], [ frs[ k ] for k in take.tolist() ] )
+
+        pos = np.cumsum( keep ) - 1
+
+        return list( zip( frs, np.split( self.points[ keep ], pos[ heads[ 1: ] ] ) ) )
+
+class Toolpath( collections.abc.Sequence ):
+
+    # Columnar store of all moves of a file.
+    #
+    # One row per move in contiguous arrays, layers are ranges given by layer_offset ( len = layers + 1 ).
+    # A missing word ( None in G1code ) is stored as nan, and the G1_FLAG_* bits in 'flags' tell which words were present.
+    # As a sequence it behaves like the old list of LayerData.
+
+    COLUMNS_FLOAT   = ( 'X', 'Y', 'Z', 'E', 'F', 'cx', 'cy', 'cf', 'tm', 'tmd' )
+    COLUMNS_INT     = ( ( 'no', np.int32 ), ( 'flags', np.uint8 ) )
+
+    def __init__( self, columns = None, layer_offset = None, layer_height = None, tail = None ):
+
+        if columns is None:
+            columns = {}
+
+        for n in self.COLUMNS_FLOAT:
+            setattr( self, n, columns.get( n, np.zeros( 0, dtype = np.float64 ) ) )
+
+        for ( n, t ) in self.COLUMNS_INT:
+            setattr( self, n, columns.get( n, np.zeros( 0, dtype = t ) ) )
+
+        self.layer_offset   = layer_offset if layer_offset is not None else np.zeros( 1, dtype = np.int64 )
+        self.layer_height   = layer_height if layer_height is not None else np.zeros( 0, dtype = np.float64 )
+        self.tail           = tail if tail is not None else {}      # { move index : tail } ( only a few moves have a comment )
+        self.e_count        = None                                  # see extrusionCount
+        self.checkpoint     = {}                                    # { ( step, st, ed ) : checkpoints } see ToolpathLayer.checkpoints
+
+    def __len__( self ):
+        return len( self.layer_height )
+
+    def __getitem__( self, ln ):
+        if ln < 0:
+            ln += len( self )
+
+        if ln < 0 or ln >= len( self ):
+            raise IndexError( ln )
+
+        return LayerData( float( self.layer_height[ ln ] ), ToolpathLayer( self, int( self.layer_offset[ ln ] ), int( self.layer_offset[ ln + 1 ] ) ) )
+
+    @classmethod
+    def columnTypes( cls ):
+        return tuple( ( n, np.float64 ) for n in cls.COLUMNS_FLOAT ) + cls.COLUMNS_INT
+
+    @classmethod
+    def columnNames( cls ):
+        return tuple( n for ( n, _ ) in cls.columnTypes() )
+
+    def moves( self ):
+        return len( self.no )
+
+    def columns( self ):
+        return { n : getattr( self, n ) for n in self.columnNames() }
+
+    def nbytes( self ):
+        return sum( x.nbytes for x in self.columns().values() ) + self.layer_offset.nbytes + self.layer_height.nbytes
+
+    def extrusionCount( self ):
+        # cumulative count of the extrusion moves ( E > 0 ) : the moves [ a, b ] have e_count[ b ] - e_count[ a - 1 ] of them
+        if self.e_count is None or len( self.e_count ) != self.moves():
+            self.e_count = np.cumsum( self.E > 0, dtype = np.int64 )
+
+        return self.e_count
+
+    def layerTimes( self ):
+        # sec per layer ( sum of tmd )
+        tm = np.concatenate( ( [ 0 ], self.tm ) )
+        return tm[ self.layer_offset[ 1: ] ] - tm[ self.layer_offset[ : -1 ] ]
+
+    def layerTime( self, ln ):
+        if ln < 0:
+            ln += len( self )
+
+        if ln < 0 or ln >= len( self ):
+            raise IndexError( ln )
+
+        ( st, ed ) = ( int( self.layer_offset[ ln ] ), int( self.layer_offset[ ln + 1 ] ) )
+
+        return float( self.tm[ ed - 1 ] - ( self.tm[ st - 1 ] if st > 0 else 0 ) ) if ed > st else 0.0
+
+    def g1code( self, i ):
+
+        def nn( v ):
+            v = float( v )
+            return None if v != v else v
+
+        return G1code(
+                nn( self.X[ i ] ), nn( self.Y[ i ] ), nn( self.Z[ i ] ), nn( self.E[ i ] ), nn( self.F[ i ] )
+            ,   self.tail.get( i )
+            ,   float( self.cx[ i ] ), float( self.cy[ i ] ), float( self.cf[ i ] )
+            ,   int( self.no[ i ] )
+            ,   float( self.tm[ i ] ), float( self.tmd[ i ] )
+            )
+
+    def iterG1code( self, st = 0, ed = None ):
+
+        if ed is None:
+            ed = self.moves()
+
+        def nn( a ):
+            return [ None if v != v else v for v in a[ st : ed ].tolist() ]
+
+        def ll( a ):
+            return a[ st : ed ].tolist()
+
+        tail = self.tail
+
+        for ( i, x, y, z, e, f, cx, cy, cf, no, tm, tmd ) in zip(
+                itertools.count( st )
+            ,   nn( self.X ), nn( self.Y ), nn( self.Z ), nn( self.E ), nn( self.F )
+            ,   ll( self.cx ), ll( self.cy ), ll( self.cf ), ll( self.no ), ll( self.tm ), ll( self.tmd )
+            ):
+            yield G1code( x, y, z, e, f, tail.get( i ), cx, cy, cf, no, tm, tmd )
+
+class ToolpathBuilder:
+
+    # Append-only store of moves that makes a Toolpath.
+    #
+    # The columns are arrays with spare capacity ( doubled when full ), rows are written once and never changed.
+    # snapshot() returns a Toolpath of the completed layers as views of these arrays,
+    # so a snapshot taken by the loader thread stays valid while the store keeps growing.
+
+    INITIAL_CAPACITY = 1 << 16
+
+    def __init__( self ):
+        self.arrays         = { n : np.empty( self.INITIAL_CAPACITY, dtype = t ) for ( n, t ) in Toolpath.columnTypes() }
+        self.size           = 0
+        self.layer_offset   = [ 0 ]
+        self.layer_height   = []
+        self.tail           = {}
+        self.e_moves        = []            # [ ( no, E, F ) ] of the E only lines ( retract / unretract ), for planMoveTimes
+
+    def count( self ):
+        return self.size
+
+    def extendEMoves( self, no, E, F ):
+        if len( no ) > 0:
+            self.e_moves.append( ( no, E, F ) )
+
+    def eMoves( self ):
+        if len( self.e_moves ) == 0:
+            return ( np.zeros( 0, dtype = np.int64 ), np.zeros( 0 ), np.zeros( 0 ) )
+
+        return tuple( np.concatenate( c ) for c in zip( *self.e_moves ) )
+
+    def layers( self ):
+        return len( self.layer_height )
+
+    def extend( self, columns, tail = None ):
+        n  = len( columns[ 'no' ] )
+        ed = self.size + n
+
+        if ed > len( self.arrays[ 'no' ] ):
+            cap = max( ed, len( self.arrays[ 'no' ] ) * 2 )
+
+            for ( k, a ) in self.arrays.items():
+                b = np.empty( cap, dtype = a.dtype )
+                b[ : self.size ] = a[ : self.size ]
+                self.arrays[ k ] = b
+
+        for ( k, a ) in self.arrays.items():
+            a[ self.size : ed ] = columns[ k ]
+
+        if tail:
+            self.tail.update( ( self.size + i, t ) for ( i, t ) in tail.items() )
+
+        self.size = ed
+
+    def endLayer( self, height, at = None ):
+        # at : index of the first move of the next layer ( default : end of the moves )
+        self.layer_offset.append( self.size if at is None else at )
+        self.layer_height.append( height )
+
+    def snapshot( self ):
+        # completed layers only ( the moves after layer_offset[ -1 ] may still be in the current layer )
+        ed = self.layer_offset[ -1 ]
+
+        return Toolpath(
+                { k : a[ : ed ] for ( k, a ) in self.arrays.items() }
+            ,   np.array( self.layer_offset, dtype = np.int64 )
+            ,   np.array( self.layer_height, dtype = np.float64 )
+            ,   self.tail
+            )
+
+    def build( self ):
+        return Toolpath(
+                { k : a[ : self.size ].copy() for ( k, a ) in self.arrays.items() }
+            ,   np.array( self.layer_offset, dtype = np.int64 )
+            ,   np.array( self.layer_height, dtype = np.float64 )
+            ,   self.tail
+            )
+
+class MachineLimits:
+
+    # Machine limits of the file, set by M201 ( max acceleration ), M203 ( max feedrate ), M204 ( acceleration )
+    # and M205 ( jerk, junction deviation, min feedrate ). Units are mm/s and mm/s^2.
+    #
+    # Each limit is a timeline of ( line number, value ) from the default ( Prusa MK3 firmware ),
+    # so a value changed in the middle of the file ( ex. M204 S per feature ) applies from that line.
+
+    DEFAULTS = {
+        'acc_x'       : 1000,   'acc_y'       : 1000,   'acc_z'       : 200,    'acc_e'       : 5000
+    ,   'vmax_x'      : 200,    'vmax_y'      : 200,    'vmax_z'      : 12,     'vmax_e'      : 120
+    ,   'acc_print'   : 1250,   'acc_retract' : 1250,   'acc_travel'  : 1250
+    ,   'jerk_x'      : 8,      'jerk_y'      : 8,      'jerk_z'      : 0.4,    'jerk_e'      : 4.5
+    ,   'jd'          : 0                                       # junction deviation ( 0 : classic jerk )
+    ,   'min_print'   : 0,      'min_travel'  : 0
+    }
+
+    WORDS = {
+        201 : { 'X' : ( 'acc_x', ), 'Y' : ( 'acc_y', ), 'Z' : ( 'acc_z', ), 'E' : ( 'acc_e', ) }
+    ,   203 : { 'X' : ( 'vmax_x', ), 'Y' : ( 'vmax_y', ), 'Z' : ( 'vmax_z', ), 'E' : ( 'vmax_e', ) }
+    ,   204 : { 'P' : ( 'acc_print', ), 'R' : ( 'acc_retract', ), 'T' : ( 'acc_travel', ), 'S' : ( 'acc_print', 'acc_travel' ) }
+    ,   205 : { 'X' : ( 'jerk_x', ), 'Y' : ( 'jerk_y', ), 'Z' : ( 'jerk_z', ), 'E' : ( 'jerk_e', ), 'J' : ( 'jd', ), 'S' : ( 'min_print', ), 'T' : ( 'min_travel', ) }
+    }
+
+    def __init__( self ):
+        self.timeline   = { n : ( [ -1 ], [ v ] ) for ( n, v ) in self.DEFAULTS.items() }
+        self.parsed     = {}        # line -> [ ( name, value ) ] ( the same lines are repeated, ex. M204 S800 )
+        self.arrays     = {}
+
+    def parse( self, ln, no ):
+        # ln : M201 - M205 line ( bytes )
+        sets = self.parsed.get( ln )
+
+        if sets is None:
+            sets = []
+            m = KW_MACHINE_B.match( ln )
+
+            if m:
+                words = self.WORDS[ int( m.group( 1 ) ) ]
+
+                for p in KW_G1_PARAM_B.finditer( m.group( 2 ) ):
+                    try:
+                        v = float( p.group( 2 ) )
+                    except ValueError:
+                        continue
+
+                    sets.extend( ( n, v ) for n in words.get( p.group( 1 ).upper().decode(), () ) )
+
+            self.parsed[ ln ] = sets
+
+        for ( n, v ) in sets:
+            self.timeline[ n ][0].append( no )
+            self.timeline[ n ][1].append( v )
+            self.arrays.pop( n, None )
+
+    def values( self, name, no ):
+        # value in effect at each line of no ( ascending line numbers ), a float if it never changes
+        a = self.arrays.get( name )
+
+        if a is None:
+            a = self.arrays[ name ] = tuple( np.asarray( x ) for x in self.timeline[ name ] )
+
+        ( nos, vals ) = a
+
+        if len( nos ) == 1:
+            return float( vals[ 0 ] )
+
+        counts = np.diff( np.searchsorted( no, nos ), append = len( no ) )
+        return np.repeat( vals.astype( np.float64 ), counts )
+
+PLAN_BLOCK = 1 << 20           # moves per block of planMoveTimes ( bounds the temporary memory )
+PLAN_ACC_MAX = 1e9              # mm/s^2, the acceleration when no limit is set ( kept finite for the passes )
+
+def noLimit( v ):
+    # a limit <= 0 is not set ( ex. M203 Z0 )
+    return np.where( v > 0, v, np.inf )
+
+def axisLimit( v, iu ):
+    # limit of an axis along the move ( iu = 1 / |u| ), inf where the axis does not move or the limit is not set
+    with np.errstate( invalid = 'ignore' ):
+        return np.where( np.isfinite( iu ), noLimit( v ) * iu, np.inf )
+
+def axisJerk( v, iu ):
+    # jerk of an axis along the move ( 0 : stop at the junction ), inf where the axis does not move
+    with np.errstate( invalid = 'ignore' ):
+        return np.where( np.isfinite( iu ), np.maximum( v, 0 ) * iu, np.inf )
+
+def trapezoidTime( l, v0, v1, vc, acc ):
+
+    # time of a move of length l, entry speed v0, exit speed v1, cruise speed vc ( v0, v1 <= vc ), acceleration acc
+    # ( the peak speed is vc, or lower for a triangle, then there is no cruise )
+
+    with np.errstate( divide = 'ignore', invalid = 'ignore' ):
+        s  = ( v0 * v0 + v1 * v1 ) / 2
+        vp = np.minimum( np.sqrt( np.maximum( acc * l + s, 0 ) ), vc )
+
+        t = ( 2 * vp - v0 - v1 ) / acc + np.maximum( l - ( vp * vp - s ) / acc, 0 ) / vp
+
+        t = np.where( acc > 0, t, l / vc )
+
+    return np.where( ( vc > 0 ) & ( l > 0 ), t, 0 )
+
+def planMoveTimes( tp, machine, e_moves ):
+
+    # Time of each move of the Toolpath tp with acceleration ( trapezoid motion planner, all moves at once ).
+    #
+    #   machine : MachineLimits, e_moves : ( no, E, F ) of the E only lines ( ToolpathBuilder.eMoves() )
+    # return tmd ( sec per move, the time of the E only lines is added to the next move )
+    #
+    # The usual two passes ( the entry speed is limited by the junction and by what the next moves can
+    # decelerate to / the previous moves can accelerate to ) are min-plus recurrences on the squared speed,
+    #   B[k] = min( C[k]^2, B[k+1] + 2 a[k] l[k] ),
+    # solved with a cumulative sum and np.minimum.accumulate instead of a loop, PLAN_BLOCK moves at a time
+    # ( the value at the block boundary is carried over ).
+    # A move after an E only line starts from rest ( the firmware stops for a retract ).
+
+    n = tp.moves()
+
+    if n == 0:
+        return np.zeros( 0 )
+
+    no = tp.no
+
+    lim = {}
+
+    def limit( name, st, ed ):
+        # a float if it never changes, else the values of the moves [ st, ed )
+        if name not in lim:
+            lim[ name ] = machine.values( name, no )
+        v = lim[ name ]
+        return v if np.ndim( v ) == 0 else v[ st : ed ]
+
+    ( e_no, e_e, e_f ) = e_moves
+
+    e_next = np.searchsorted( no, e_no )            # next move of each E only line
+
+    stop = np.zeros( n + 1, dtype = bool )
+    stop[ e_next ] = True
+
+    l   = np.empty( n )
+    vc  = np.empty( n )
+    acc = np.empty( n )
+    cap = np.empty( n + 1 )                         # speed limit at the start of each move ( and the end )
+
+    z = 0.0
+    last = None                                     # ( u, vc, safe ) of the move before the block
+
+    for st in range( 0, n, PLAN_BLOCK ):
+        ed = min( st + PLAN_BLOCK, n )
+        m = ed - st
+
+        ex = np.where( np.isnan( tp.X[ st : ed ] ), tp.cx[ st : ed ], tp.X[ st : ed ] )
+        ey = np.where( np.isnan( tp.Y[ st : ed ] ), tp.cy[ st : ed ], tp.Y[ st : ed ] )
+        ez = forwardFill( tp.Z[ st : ed ], z )
+
+        d = np.stack( ( ex - tp.cx[ st : ed ], ey - tp.cy[ st : ed ], np.diff( ez, prepend = z ) ) )
+        z = ez[ -1 ]
+
+        l[ st : ed ] = lb = np.sqrt( ( d * d ).sum( axis = 0 ) )
+
+        with np.errstate( divide = 'ignore', invalid = 'ignore' ):
+            u = d / np.where( lb > 0, lb, np.inf )      # [ 3, m ]
+            iu = 1 / np.abs( u )                    # inf for a still axis, the axis limit does not apply ( axisLimit )
+
+            extrude = ( tp.flags[ st : ed ] & G1_FLAG_EXTRUDE ) != 0
+
+            # cruise speed and acceleration, limited per axis
+
+            vb = np.maximum( tp.cf[ st : ed ] / 60, np.where( extrude, limit( 'min_print', st, ed ), limit( 'min_travel', st, ed ) ) )
+            ab = noLimit( np.where( extrude, limit( 'acc_print', st, ed ), limit( 'acc_travel', st, ed ) ) )
+            safe = vb.copy()
+
+            for ( i, ax ) in enumerate( 'xyz' ):
+                np.minimum( vb,   axisLimit( limit( 'vmax_' + ax, st, ed ), iu[ i ] ), out = vb )
+                np.minimum( ab,   axisLimit( limit( 'acc_'  + ax, st, ed ), iu[ i ] ), out = ab )
+                np.minimum( safe, axisJerk(  limit( 'jerk_' + ax, st, ed ), iu[ i ] ), out = safe )
+
+            np.minimum( ab, PLAN_ACC_MAX, out = ab )
+
+            jd = np.broadcast_to( limit( 'jd', st, ed ), m )
+
+            safe = np.where( jd > 0, 0, np.minimum( safe, vb ) )
+
+            vc[ st : ed ]  = vb
+            acc[ st : ed ] = ab
+
+            # junction speed limit between move k - 1 and k ( k = st + 1 - j .. ed - 1 )
+
+            if last is None:
+                cap[ 0 ] = safe[ 0 ]
+                ( uj, vj_c, sj ) = ( u, vb, safe )
+            else:
+                ( uj, vj_c, sj ) = ( np.concatenate( ( a, b ), axis = -1 ) for ( a, b ) in zip( last, ( u, vb, safe ) ) )
+
+            j = uj.shape[ 1 ] - 1                       # junctions in the block
+
+            if j > 0:
+                idu = 1 / np.abs( uj[ :, 1: ] - uj[ :, : -1 ] )
+                vc_j = np.minimum( vj_c[ 1: ], vj_c[ : -1 ] )
+                vj = vc_j.copy()
+
+                for ( i, ax ) in enumerate( 'xyz' ):
+                    np.minimum( vj, axisJerk( np.broadcast_to( limit( 'jerk_' + ax, st, ed ), m )[ m - j : ], idu[ i ] ), out = vj )
+
+                if np.any( jd > 0 ):
+                    cos_t = np.clip( -( uj[ :, 1: ] * uj[ :, : -1 ] ).sum( axis = 0 ), -1, 1 )
+                    sin_h = np.sqrt( ( 1 - cos_t ) / 2 )
+                    vj_jd = np.sqrt( ab[ m - j : ] * jd[ m - j : ] * sin_h / ( 1 - sin_h ) )
+                    vj_jd = np.minimum( np.where( sin_h >= 1, np.inf, vj_jd ), vc_j )
+
+                    vj = np.where( jd[ m - j : ] > 0, vj_jd, vj )
+
+                cap[ ed - j : ed ] = np.where( stop[ ed - j : ed ], np.minimum( sj[ 1: ], sj[ : -1 ] ), vj )
+
+        last = ( u[ :, -1: ], vb[ -1: ], safe[ -1: ] )
+
+    cap[ n ] = last[ 2 ][ 0 ]
+
+    np.maximum( cap, 0, out = cap )
+    np.square( cap, out = cap )
+
+    # backward pass ( squared speed, cap becomes B )
+
+    for ed in range( n, 0, -PLAN_BLOCK ):
+        st = max( ed - PLAN_BLOCK, 0 )
+
+        dv = 2 * acc[ st : ed ] * l[ st : ed ]
+        S = np.concatenate( ( np.cumsum( dv[ :: -1 ] )[ :: -1 ], [ 0 ] ) )        # sum of dv[ k : ed ]
+
+        cap[ st : ed + 1 ] = S + np.minimum.accumulate( ( cap[ st : ed + 1 ] - S )[ :: -1 ] )[ :: -1 ]
+
+    # forward pass and the time of each move
+
+    tmd = np.empty( n )
+    v0 = cap[ 0 ]
+
+    for st in range( 0, n, PLAN_BLOCK ):
+        ed = min( st + PLAN_BLOCK, n )
+
+        dv = 2 * acc[ st : ed ] * l[ st : ed ]
+        P = np.concatenate( ( [ 0 ], np.cumsum( dv ) ) )                            # sum of dv[ st : k ]
+
+        B = cap[ st : ed + 1 ].copy()
+        B[ 0 ] = v0
+
+        V = P + np.minimum.accumulate( B - P )
+        v0 = V[ -1 ]
+
+        v = np.sqrt( np.maximum( V, 0 ) )
+        vb = vc[ st : ed ]
+
+        tmd[ st : ed ] = trapezoidTime( l[ st : ed ], np.minimum( v[ : -1 ], vb ), np.minimum( v[ 1: ], vb ), vb, acc[ st : ed ] )
+
+    # E only lines ( from rest to rest )
+
+    if len( e_no ) > 0:
+        e_l   = np.abs( e_e )
+        e_vc  = np.minimum( e_f / 60, noLimit( machine.values( 'vmax_e', e_no ) ) )
+        e_acc = np.minimum( np.minimum( noLimit( machine.values( 'acc_retract', e_no ) ), noLimit( machine.values( 'acc_e', e_no ) ) ), PLAN_ACC_MAX )
+        e_v0  = np.minimum( np.maximum( machine.values( 'jerk_e', e_no ), 0 ), e_vc )
+
+        e_t = trapezoidTime( e_l, e_v0, e_v0, e_vc, e_acc )
+
+        np.add.at( tmd, np.minimum( e_next, n - 1 ), e_t )
+
+    return tmd
+
+def defaultCacheDir():
+
+    base = os.environ.get( 'LOCALAPPDATA' ) or os.environ.get( 'XDG_CACHE_HOME' ) or os.path.join( os.path.expanduser( '~' ), '.cache' )
+
+    return os.path.join( base, CACHE_DIR_NAME )
+
+class GcodeCache:
+
+    # Sidecar cache of parsed G-code ( one .npz per file in the cache directory ).
+    #
+    # The entry of a file is named by its absolute path and holds a key of the size, mtime and a sampled digest of the content.
+    # When the key differs the file is parsed again and the entry is overwritten.
+    # The least recently used entries are removed while the directory is larger than max_bytes.
+
+    VERSION         = 5                 # bump when GcodeLoader.cacheData() ( or how its values are computed ) changes
+    SAMPLE_SIZE     = 64 << 10
+    SAMPLE_COUNT    = 16
+
+    def __init__( self, path = None, max_bytes = CACHE_MAX_BYTES ):
+
+        self.path       = path if path is not None else defaultCacheDir()
+        self.max_bytes  = max_bytes
+
+    def entryName( self, filename ):
+
+        name = os.path.abspath( filename ).encode( 'utf8', errors = 'surrogateescape' )
+
+        return os.path.join( self.path, hashlib.sha1( name ).hexdigest() + '.npz' )
+
+    def key( self, filename, buf ):
+
+        # size, mtime and the digest of SAMPLE_COUNT + 1 blocks spread over the file ( head and tail included )
+
+        st = os.stat( filename )
+        h  = hashlib.blake2b( digest_size = 16 )
+        n  = len( buf )
+
+        for i in range( self.SAMPLE_COUNT + 1 ):
+            p = max( 0, ( n - self.SAMPLE_SIZE ) * i // self.SAMPLE_COUNT )
+            h.update( buf[ p : p + self.SAMPLE_SIZE ] )
+
+        return "%d:%d:%d:%s" % ( self.VERSION, st.st_size, st.st_mtime_ns, h.hexdigest() )
+
+    def load( self, loader, filename, key ):
+
+        # return True if the loader was filled from the cache
+
+        entry = self.entryName( filename )
+
+        if not os.path.exists( entry ):
+            return False
+
+        try:
+            with np.load( entry, allow_pickle = False ) as data:
+
+                if str( data[ 'key' ] ) != key:
+                    return False
+
+                loader.setCacheData( { n : data[ n ] for n in data.files }, filename )
+
+            os.utime( entry )           # mark as recently used
+
+        except Exception as err:
+            print( "Cache read error. [%s] %s" % ( entry, err ), file=sys.stderr )
+            return False
+
+        return True
+
+    def store( self, loader, filename, key ):
+
+        entry = self.entryName( filename )
+
+        try:
+            os.makedirs( self.path, exist_ok = True )
+
+            data = loader.cacheData()
+            data[ 'key' ] = np.array( key )
+
+            ( fd, tmp ) = tempfile.mkstemp( suffix = '.tmp', dir = self.path )
+
+            try:
+                with os.fdopen( fd, 'wb' ) as f:
+                    np.savez( f, **data )
+
+                os.replace( tmp, entry )
+
+            except:
+                os.remove( tmp )
+                raise
+
+            self.evict()
+
+        except Exception as err:
+            print( "Cache write error. [%s] %s" % ( entry, err ), file=sys.stderr )
+
+    def evict( self ):
+
+        entries = []
+
+        for e in os.scandir( self.path ):
+            if e.is_file() and e.name.endswith( '.npz' ):
+                st = e.stat()
+                entries.append( ( st.st_mtime, st.st_size, e.path ) )
+
+        entries.sort( reverse = True )
+        total = 0
+
+        for ( _, sz, path ) in entries:
+            total += sz
+
+            if total > self.max_bytes:
+                try:
+                    os.remove( path )
+                except OSError:
+                    pass
+
+class GcodeLoader:
+
+    bed_x_min = None
+    bed_x_max = None
+    bed_y_min = None
+    bed_y_max = None
+
+    toolpath        = None
+    layer_data      = []                # Toolpath ( sequence of LayerData ) after load
+    raw_gcode       = GcodeLines()                      # lines by offset into the source file
+    raw_gcode_cm_no = np.zeros( 0, dtype = np.int64 )   # line numbers of the comment lines ( except the thumbnail )
+
+    feedrates   = []
+
+    time_est    = 0
+    time_calc   = 0
+    time_diff_rate = 1
+
+    read_bytes = 0
+    size_bytes = 0
+    read_time_st = 0
+    read_time_nw = 0
+
+    thumbnail_image_bytes = None        # png image bytes
+
+    class DummyLock:
+        def __enter__(self): return self
+        def __exit__(self, exc_type, exc_value, traceback): pass
+
+    lock = DummyLock()
+
+    err  = None
+
+    def getProc( self ):
+        with self.lock:
+            return ( self.read_bytes, self.size_bytes, self.read_time_nw - self.read_time_st )
+
+    def getThumbnailImage( self ):
+        with self.lock:
+            return self.thumbnail_image_bytes
+
+    def getLayerData( self ):
+        # layers published so far ( all layers after load )
+        with self.lock:
+            return ( self.layer_data, self.feedrates )
+
+    @staticmethod
+    def value_correction( z ):
+        return round( z, 3 )
+
+    workers             = 1             # > 1 : parse with a process pool ( large file only )
+    parallel_min_size   = 16 << 20
+    parallel_task_size  = 8 << 20
+
+    cache               = None          # GcodeCache ( None : no cache )
+    cached              = False         # True if the last load() came from the cache
+
+    arc_tolerance       = ARC_TOLERANCE
+
+    def __init__( self, tlock = False, workers = 1, cache = None, arc_tolerance = ARC_TOLERANCE ):
+
+        if tlock:
+            self.lock = threading.Lock()
+
+        self.workers = max( 1, workers )
+        self.cache   = cache
+        self.arc_tolerance = arc_tolerance
+
+    def load( self, file = None ):
+
+        err  = None
+
+        self.toolpath           = None
+        self.layer_data         = []
+        self.raw_gcode          = GcodeLines()
+        self.raw_gcode_cm_no    = np.zeros( 0, dtype = np.int64 )
+
+        self.feedrates = []
+        self.cached    = False
+
+        self.read_bytes = 0
+        self.size_bytes = 0
+        self.read_time_st = time.time()
+        self.read_time_nw = time.time()
+
+        try:
+            self._load_impl( file )
+        except Exception as err:
+            self.err = err
+            raise err
+
+    read_chunk_size = 1 << 20
+
+    def _load_impl( self, file = None ):
+
+        if file is None:
+            return
+
+        buf = openGcodeBuffer( file )
+
+        try:
+            key = None
+
+            if self.cache is not None and not hasattr( file, 'read' ):
+                key = "%s:%r" % ( self.cache.key( file, buf ), self.arc_tolerance )
+
+                if self.cache.load( self, file, key ):
+                    self.cached = True
+
+                    with self.lock:
+                        self.read_bytes = self.size_bytes = len( buf )
+                        self.read_time_nw = time.time()
+
+                    return
+
+            source = buf if hasattr( file, 'read' ) else file
+
+            if not hasattr( file, 'read' ) and self.workers > 1 and len( buf ) >= self.parallel_min_size:
+                self._load_buffer( buf, source, self._parallelChunks( file, buf ) )
+            else:
+                self._load_buffer( buf, source, ( tokenizeChunk( buf, *c ) for c in lineChunks( buf, self.read_chunk_size ) ) )
+
+            if key is not None:
+                self.cache.store( self, file, key )
+
+        finally:
+            if isinstance( buf, mmap.mmap ):
+                buf.close()
+
+    def cacheData( self ):
+
+        # arrays of the load() result for GcodeCache ( no pickle, the tails are stored as one utf8 blob )
+
+        tp = self.toolpath
+
+        tail_idx = sorted( tp.tail )
+        tail_b   = [ tp.tail[ i ].encode( 'utf8', errors = 'surrogateescape' ) for i in tail_idx ]
+
+        data = { 'tp_' + n : a for ( n, a ) in tp.columns().items() }
+
+        data.update(
+                tp_layer_offset = tp.layer_offset
+            ,   tp_layer_height = tp.layer_height
+            ,   tp_tail_idx     = np.array( tail_idx, dtype = np.int64 )
+            ,   tp_tail_len     = np.array( [ len( b ) for b in tail_b ], dtype = np.int64 )
+            ,   tp_tail_bytes   = np.frombuffer( b''.join( tail_b ), dtype = np.uint8 )
+            ,   raw_gcode_offset = self.raw_gcode.offsets
+            ,   raw_gcode_cm_no = self.raw_gcode_cm_no
+            ,   feedrates       = np.array( self.feedrates, dtype = np.float64 )
+            ,   bed             = np.array( [ np.nan if v is None else v for v in ( self.bed_x_min, self.bed_x_max, self.bed_y_min, self.bed_y_max ) ], dtype = np.float64 )
+            ,   time            = np.array( [ self.time_est, self.time_calc, self.time_diff_rate ], dtype = np.float64 )
+            ,   thumbnail       = np.frombuffer( self.thumbnail_image_bytes or b'', dtype = np.uint8 )
+            )
+
+        return data
+
+    def setCacheData( self, data, source ):
+
+        tail_bytes = data[ 'tp_tail_bytes' ].tobytes()
+        tail_ed    = np.cumsum( data[ 'tp_tail_len' ] ).tolist()
+        tail_st    = [ 0 ] + tail_ed[ : -1 ]
+
+        tail = { i : tail_bytes[ a : b ].decode( 'utf8', errors = 'surrogateescape' ) for ( i, a, b ) in zip( data[ 'tp_tail_idx' ].tolist(), tail_st, tail_ed ) }
+
+        toolpath = Toolpath(
+                { n : data[ 'tp_' + n ] for n in Toolpath.columnNames() }
+            ,   data[ 'tp_layer_offset' ]
+            ,   data[ 'tp_layer_height' ]
+            ,   tail
+            )
+
+        bed = [ None if v != v else int( v ) for v in data[ 'bed' ].tolist() ]
+        ( time_est, time_calc, time_diff_rate ) = data[ 'time' ].tolist()
+        thumbnail = data[ 'thumbnail' ].tobytes()
+
+        ( self.bed_x_min, self.bed_x_max, self.bed_y_min, self.bed_y_max ) = bed
+
+        toolpath.extrusionCount()
+
+        self.toolpath           = toolpath
+        self.layer_data         = toolpath
+        self.raw_gcode          = GcodeLines( source, data[ 'raw_gcode_offset' ] )
+        self.raw_gcode_cm_no    = data[ 'raw_gcode_cm_no' ]
+        self.feedrates          = data[ 'feedrates' ].tolist()
+        self.time_est           = int( time_est )
+        self.time_calc          = time_calc
+        self.time_diff_rate     = time_diff_rate
+
+        with self.lock:
+            self.thumbnail_image_bytes = thumbnail if len( thumbnail ) > 0 else None
+
+    class CommentState:
+        def __init__( self ):
+            self.f_bed_s    = False
+            self.f_est      = False
+            self.f_thumb    = 0
+            self.thumb      = io.BytesIO()
+            self.cm_no      = array.array( 'q' )
+
+    def _parseComment( self, cs, ln, no ):
+
+        # ln : comment line ( bytes, without newline )
+
+        if cs.f_thumb != 1:
+            cs.cm_no.append( no )
+
+        else:       # if cs.f_thumb == 1:
+            m = KW_THUMBNAIL_END_B.match( ln )
+
+            if m:
+                cs.f_thumb = 2
+
+                thumb = cs.thumb
+                thumb.seek( 0, os.SEEK_END )
+
+                if thumb.tell() > 0:
+                    thumb.seek( 0, os.SEEK_SET )
+
+                    image_bytes = base64.b64decode( thumb.getvalue() )
+
+                    if len( image_bytes ) >= 8 and image_bytes[0:8] == b'\x89PNG\r\n\x1a\n':
+                        with self.lock:
+                            self.thumbnail_image_bytes = image_bytes
+            else:
+                m = KW_THUMBNAIL_BODY_B.match( ln )
+
+                if m:
+                    cs.thumb.write( m.group( 1 ) )
+
+            return
+
+        if cs.f_thumb == 0:
+            m = KW_THUMBNAIL_BEGIN_B.match( ln )
+
+            if m:
+                cs.f_thumb = 1
+                return
+
+        if cs.f_bed_s == False:
+            m = KW_BED_SHAPE_B.match( ln )
+
+            if m:
+                cs.f_bed_s = True
+
+                b_x = []
+                b_y = []
+
+                for xy in m.group( 1 ).decode( 'utf8', errors = 'replace' ).split( ',' ):
+
+                    try:
+                        xy = xy.split( 'x' )
+
+                        b_x.append( int( xy[0] ) )
+                        b_y.append( int( xy[1] ) )
+
+                    except:
+                        pass
+
+                if len( b_x ) > 0 and len( b_y ) > 0:
+
+                    self.bed_x_min = min( b_x )
+                    self.bed_x_max = max( b_x )
+                    self.bed_y_min = min( b_y )
+                    self.bed_y_max = max( b_y )
+
+                return
+
+        if cs.f_est == False:
+            m = KW_EST_PRINT_TIME_B.match( ln )
+
+            if m:
+                cs.f_est = True
+
+                def num_int( x ):
+
+                    ret = 0
+
+                    try:
+                        ret = int( x )
+                    except:
+                        pass
+
+                    return ret
+
+                td = num_int( m.group( 1 ) )
+                th = num_int( m.group( 2 ) )
+                tm = num_int( m.group( 3 ) )
+                ts = num_int( m.group( 4 ) )
+
+                self.time_est = ( td * 60 * 60 * 24 ) + ( th * 60 * 60 ) + ( tm * 60 ) + ts
+
+                return
+
+    def _stitchMoves( self, builder, state, feedrates, no, motion, words, tails ):
+
+        # Run the modal state ( position, feedrate, layer heuristic, time ) over one block of G0 - G3 lines
+        # and append the moves to builder. The arcs are replaced with chords first.
+        #   state  : LoadState before the block
+        #   no     : line number of each line, motion : 0 - 3, words : MOVE_WORDS ( nan : not present ), tails : { index : tail }
+        # return LoadState after the block
+
+        if len( no ) == 0:
+            return state
+
+        if np.any( motion >= 2 ):
+            ( src, words, tails ) = expandArcs( state.c_x, state.c_y, motion, words, tails, self.arc_tolerance )
+            no = no[ src ]
+
+        ( X, Y, Z, E, F ) = words.T[ : 5 ]
+
+        has_x   = ~np.isnan( X )
+        has_y   = ~np.isnan( Y )
+        has_z   = ~np.isnan( Z )
+        has_e   = ~np.isnan( E )
+        has_f   = ~np.isnan( F )
+        extrude = E > 0
+
+        cz  = forwardFill( Z, state.c_z )                               # c_z after the line
+        cf  = forwardFill( F, state.c_f )
+        czz = np.concatenate( ( [ state.c_z ], cz[ : -1 ] ) )           # c_zz, c_x, c_y before the line
+        cx  = np.concatenate( ( [ state.c_x ], forwardFill( X, state.c_x ) ) )
+        cy  = np.concatenate( ( [ state.c_y ], forwardFill( Y, state.c_y ) ) )
+
+        # layer change
+        #   z lower  : ( ex. Start extrude (0.2mm) is higher than first layer (<0.2mm)
+        #   z higher : and ( z down or extrude )
+        # c_z is constant in a run, and once c_l follows c_z nothing changes until the next run.
+
+        n = len( no )
+
+        run_st  = np.flatnonzero( np.concatenate( ( [ True ], cz[ 1: ] != cz[ : -1 ] ) ) )
+        run_ed  = np.append( run_st[ 1: ], n )
+        cond    = np.append( np.flatnonzero( extrude | ( has_z & ( Z < czz ) ) ), n )
+        run_c   = cond[ np.searchsorted( cond, run_st ) ]
+
+        c_l = state.c_l
+        breaks = []
+
+        for ( r_st, r_ed, r_c, z ) in zip( run_st.tolist(), run_ed.tolist(), run_c.tolist(), cz[ run_st ].tolist() ):
+
+            if z < c_l:
+                breaks.append( ( r_st, c_l ) )
+                c_l = z
+
+            elif z > c_l and r_c < r_ed:
+                breaks.append( ( r_c, c_l ) )
+                c_l = z
+
+        # moves
+
+        moved = has_x | has_y | has_z
+        rec = np.flatnonzero( moved )
+
+        e_only = has_e & ~moved
+        builder.extendEMoves( no[ e_only ], E[ e_only ], cf[ e_only ] )
+
+        dx = np.where( has_x, X - cx[ : -1 ], 0 )[ rec ]
+        dy = np.where( has_y, Y - cy[ : -1 ], 0 )[ rec ]
+        dz = np.where( has_z, Z - czz, 0 )[ rec ]
+        l  = np.sqrt( dx * dx + dy * dy + dz * dz )
+
+        m_cf = cf[ rec ]
+
+        tmd = np.zeros( len( rec ) )
+        np.divide( l, m_cf / 60, out = tmd, where = ( m_cf != 0 ) )
+
+        tm = np.cumsum( np.concatenate( ( [ state.tm_calc ], tmd ) ) )[ 1: ]
+
+        flags = (   has_x * G1_FLAG_X
+                |   has_y * G1_FLAG_Y
+                |   has_z * G1_FLAG_Z
+                |   has_e * G1_FLAG_E
+                |   has_f * G1_FLAG_F
+                |   extrude * G1_FLAG_EXTRUDE
+                )[ rec ]
+
+        feedrates.update( np.unique( m_cf[ extrude[ rec ] ] ).tolist() )
+
+        m_before = np.cumsum( moved ) - moved       # moves before the line
+        base = builder.count()
+
+        builder.extend(
+                dict(
+                    X = X[ rec ], Y = Y[ rec ], Z = Z[ rec ], E = E[ rec ], F = F[ rec ]
+                ,   cx = cx[ rec ], cy = cy[ rec ], cf = m_cf
+                ,   no = no[ rec ], flags = flags
+                ,   tm = tm, tmd = tmd
+                )
+            ,   { int( m_before[ i ] ) : t for ( i, t ) in tails.items() if moved[ i ] }
+            )
+
+        for ( i, h ) in breaks:
+            builder.endLayer( self.value_correction( h ), at = base + int( m_before[ i ] ) )
+
+        return LoadState(
+                float( cx[ -1 ] ), float( cy[ -1 ] ), float( cz[ -1 ] ), c_l, float( cf[ -1 ] )
+            ,   float( tm[ -1 ] ) if len( tm ) > 0 else state.tm_calc
+            )
+
+    def _parallelChunks( self, filename, buf ):
+
+        # Tokenize the ranges of the file in a process pool and yield the chunks in file order.
+        # The modal state is stitched in _load_buffer ( serially ), so the result is the same as the serial load.
+        # The workers are not forked from this process ( the Tk loop and the other threads may hold locks ) :
+        # forkserver where there is one, else spawn.
+
+        ranges = lineRanges( buf, self.parallel_task_size )
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+        with concurrent.futures.ProcessPoolExecutor( max_workers = self.workers, mp_context = multiprocessing.get_context( method ) ) as pool:
+
+            futures = collections.deque()
+            ranges_iter = iter( ranges )
+
+            while True:
+                while len( futures ) < self.workers * 2:    # keep the pool busy without holding all results
+                    r = next( ranges_iter, None )
+
+                    if r is None:
+                        break
+
+                    futures.append( pool.submit( tokenizeFileRange, filename, r[0], r[1], self.read_chunk_size ) )
+
+                if len( futures ) == 0:
+                    break
+
+                for chunk in futures.popleft().result():
+                    yield chunk
+
+    def _load_buffer( self, buf, source, chunks ):
+
+        with self.lock:
+            self.size_bytes = len( buf )
+
+        cs          = self.CommentState()
+        machine     = MachineLimits()
+        state       = LoadState( 0, 0, 0, 0, 0, 0 )
+        builder     = ToolpathBuilder()
+        feedrates   = set()
+        offsets     = []
+        no          = 0
+
+        for chunk in chunks:
+
+            offsets.append( chunk.starts )
+
+            for ( i, ln ) in chunk.comments:
+                self._parseComment( cs, ln, no + i )
+
+            for ( i, ln ) in chunk.machine:
+                machine.parse( ln, no + i )
+
+            state = self._stitchMoves( builder, state, feedrates, chunk.rows + no, chunk.motion, chunk.words, chunk.tails )
+
+            no += len( chunk.starts )
+
+            with self.lock:
+                self.read_bytes = chunk.ed
+                self.read_time_nw = time.time()
+
+                if builder.layers() != len( self.layer_data ):     # publish the completed layers
+                    self.layer_data = builder.snapshot()
+                    self.feedrates  = sorted( feedrates )
+
+        if builder.count() != builder.layer_offset[ -1 ]:
+            builder.endLayer( self.value_correction( state.c_l ) )
+
+        toolpath = builder.build()
+        e_moves  = builder.eMoves()
+
+        toolpath.extrusionCount()
+
+        with self.lock:
+            self.toolpath   = toolpath
+            self.layer_data = toolpath
+            self.feedrates  = sorted( feedrates )
+
+        del builder             # the snapshots are gone, free the buffers before planning
+
+        # acceleration aware time ( the time while loading is length / feedrate )
+
+        tmd = planMoveTimes( toolpath, machine, e_moves )
+
+        with self.lock:
+            toolpath.tmd = tmd
+            toolpath.tm  = np.cumsum( tmd )
+
+        offsets.append( np.array( [ len( buf ) ], dtype = np.int64 ) )
+
+        self.raw_gcode          = GcodeLines( source, np.concatenate( offsets ).astype( np.int64, copy = False ) )
+        self.raw_gcode_cm_no    = np.array( cs.cm_no, dtype = np.int64 )
+
+        self.time_calc = float( toolpath.tm[ -1 ] ) if toolpath.moves() > 0 else 0
+
+        if self.time_est != 0 and self.time_calc != 0:
+            self.time_diff_rate = self.time_est / self.time_calc
+
+GcodeInfo = collections.namedtuple( 'GcodeInfo', ( 'size', 'bed', 'time_est', 'layer_height', 'first_layer_height', 'thumbnail' ) )
+# bed : ( x_min, x_max, y_min, y_max ) or None, time_est : sec ( 0 : unknown ), heights : mm or None, thumbnail : png bytes or None
+
+def scanGcodeInfo( filename ):
+
+    # Metadata from the comments at the head ( thumbnail ) and the tail ( slicer config ) of the file, without the full parse.
+    # The head is read while a thumbnail continues ( up to INFO_HEAD_MAX ), the tail by seek.
+
+    gl = GcodeLoader()
+    cs = gl.CommentState()
+    lh = {}
+
+    def scan( data ):
+        for ln in data.split( b'\n' ):
+            ln = ln.rstrip( b'\r' )
+
+            if not KW_COMMENT_B.match( ln ):
+                continue
+
+            gl._parseComment( cs, ln, 0 )
+
+            for kw in ( KW_LAYER_HEIGHT_B, KW_FIRST_LAYER_HEIGHT_B ):
+                if kw not in lh:
+                    m = kw.match( ln )
+
+                    if m:
+                        try:
+                            lh[ kw ] = float( m.group( 1 ) )
+                        except ValueError:
+                            pass
+
+    with open( filename, 'rb' ) as fin:
+
+        size = os.fstat( fin.fileno() ).st_size
+        rest = b''
+
+        while True:
+            data = rest + fin.read( INFO_BLOCK_SIZE )
+            pos  = fin.tell()
+
+            if pos < size:
+                cut = data.rfind( b'\n' ) + 1
+                ( data, rest ) = ( data[ : cut ], data[ cut : ] )
+            else:
+                rest = b''
+
+            scan( data )
+
+            if pos >= size or pos >= INFO_HEAD_MAX or ( pos >= INFO_HEAD_SIZE and cs.f_thumb != 1 ):
+                break
+
+        if pos < size:
+            st = max( pos, size - INFO_TAIL_SIZE )
+
+            fin.seek( st )
+            data = fin.read()
+
+            if st > pos:
+                data = data[ data.find( b'\n' ) + 1 : ]        # partial line
+            else:
+                data = rest + data
+
+            scan( data )
+
+    bed = None
+
+    if gl.bed_x_min is not None:
+        bed = ( gl.bed_x_min, gl.bed_x_max, gl.bed_y_min, gl.bed_y_max )
+
+    return GcodeInfo(
+            size
+        ,   bed
+        ,   gl.time_est
+        ,   lh.get( KW_LAYER_HEIGHT_B )
+        ,   lh.get( KW_FIRST_LAYER_HEIGHT_B )
+        ,   gl.thumbnail_image_bytes
+        )
+
+def pngSize( image_bytes ):
+
+    # ( width, height ) from the IHDR chunk
+
+    return ( int.from_bytes( image_bytes[ 16 : 20 ], 'big' ), int.from_bytes( image_bytes[ 20 : 24 ], 'big' ) )
+
+def formatGcodeInfo( info ):
+
+    # one line summary ( for the load progress )
+
+    text = []
+
+    if info.time_est != 0:
+        text.append( "Est. %s" % ( format_time( info.time_est )[ : -3 ], ) )
+
+    if info.layer_height is not None:
+        text.append( "Layer %.2f mm" % ( info.layer_height, ) )
+
+    if info.bed is not None:
+        text.append( "Bed %dx%d" % ( info.bed[1], info.bed[3] ) )
+
+    return " | ".join( text )
+
+def polylinePath( polylines ):
+    # skia.Path of the polylines [ points [ n, 2 ] ], a contour each
+
+    pts   = np.concatenate( polylines )
+    verbs = np.full( len( pts ), int( skia.Path.kLine_Verb ), dtype = np.uint8 )
+    verbs[ np.cumsum( [ 0 ] + [ len( p ) for p in polylines[ : -1 ] ] ) ] = int( skia.Path.kMove_Verb )
+
+    return skia.Path.Make( list( map( Point._make, pts.tolist() ) ), verbs.tolist(), [], skia.PathFillType.kWinding )
+
+def drawFuncRect( draws, pad = 2 ):
+    # bounding rect ( x0, y0, x1, y1 ) of DrawFunc lines and circles in canvas coordinates, or None
+
+    xs = []
+    ys = []
+
+    for d in draws:
+        w = d.args[ -1 ].getStrokeWidth() / 2 + pad
+
+        if d.f.__name__ == 'drawCircle':
+            ( c, r ) = d.args[ : 2 ]
+            xs += [ c[0] - r - w, c[0] + r + w ]
+            ys += [ c[1] - r - w, c[1] + r + w ]
+        elif d.f.__name__ == 'drawPoints':
+            pts = np.array( d.args[ 1 ] )
+            xs += [ pts[ :, 0 ].min() - w, pts[ :, 0 ].max() + w ]
+            ys += [ pts[ :, 1 ].min() - w, pts[ :, 1 ].max() + w ]
+        else:
+            for pt in d.args[ : 2 ]:
+                xs += [ pt[0] - w, pt[0] + w ]
+                ys += [ pt[1] - w, pt[1] + w ]
+
+    if len( xs ) == 0:
+        return None
+
+    return ( int( math.floor( min( xs ) ) ), int( math.floor( min( ys ) ) ), int( math.ceil( max( xs ) ) ), int( math.ceil( max( ys ) ) ) )
+
+def mergeRects( rects, w, h ):
+    # clip the rects to the canvas ( w x h ) and merge the overlapping ones
+
+    out = []
+
+    for r in rects:
+        if r is None:
+            continue
+
+        r = ( max( r[0], 0 ), max( r[1], 0 ), min( r[2], w ), min( r[3], h ) )
+
+        if r[0] >= r[2] or r[1] >= r[3]:
+            continue
+
+        while True:
+            for ( i, o ) in enumerate( out ):
+                if r[0] <= o[2] and o[0] <= r[2] and r[1] <= o[3] and o[1] <= r[3]:
+                    r = ( min( r[0], o[0] ), min( r[1], o[1] ), max( r[2], o[2] ), max( r[3], o[3] ) )
+                    del out[ i ]
+                    break
+            else:
+                break
+
+        out.append( r )
+
+    return out
+
+class PlayFrame:
+
+    # What the playback keeps between its frames ( Viewer.updateImagePlay ).
+    #
+    # The canvas is moves ( bed and extrusion ) + travel ( travel and z moves, transparent ) + the marks of the current move
+    # + the overlays. A step draws the new moves on moves / travel and recomposes only the dirty rects of the surface.
+
+    def __init__( self, key, ln, shape ):
+        self.key        = key
+        self.ln         = ln
+        self.li         = -1
+        self.moves      = np.zeros( shape, dtype = np.uint8 )
+        self.travel     = np.zeros( shape, dtype = np.uint8 )
+        self.marks      = None                  # rect of the current move marks of the last frame
+        self.details    = None                  # rect of the details of the last frame
+
+class FrameStats:
+
+    # Frame times ( ms ) of the last frames of the frame scheduler ( Viewer.requestImage ) and the number of
+    # dropped frames ( the requests served by a later frame ).
+
+    def __init__( self, size = 60 ):
+        self.times      = collections.deque( maxlen = size )
+        self.frames     = 0
+        self.dropped    = 0
+
+    def add( self, ms, requests ):
+        self.times.append( ms )
+        self.frames  += 1
+        self.dropped += max( requests - 1, 0 )
+
+    def average( self ):
+        return sum( self.times ) / len( self.times ) if len( self.times ) > 0 else 0.0
+
+class PlayPace:
+
+    # Pace of the playback ( Viewer.progressPlay ).
+    # The timer interval is the rest of the frame period after the measured cost of the tick ( at least idle_ms for
+    # the Tk events ), and a tick takes the steps due at the speed for the time since the last one, so a slow layer
+    # gets fewer frames of more steps at the same speed. The achieved fps and print time speed are of the last frames
+    # ( the ticks that showed a new position ) up to the last tick, a tick without a frame is refresh() after idle_ticks.
+
+    def __init__( self, fps, idle_ms = 5, size = 30, idle_ticks = 10 ):
+        self.period_ms  = 1000 / fps
+        self.idle_ms    = idle_ms
+        self.idle_ticks = idle_ticks
+        self.frames     = collections.deque( maxlen = size )  # ( perf_counter, print time )
+        self.last       = None                                  # perf_counter of the last tick
+        self.idle       = 0                                     # ticks since the last frame or refresh
+        self.credit     = 0.0
+
+    def start( self ):
+        self.frames.clear()
+        self.last   = None
+        self.idle   = 0
+        self.credit = 0.0
+
+    def steps( self, now, rate ):
+        # the steps due at rate ( per sec ) since the last tick ( the first tick takes 1 ), a stall of more than
+        # 0.25 sec is not caught up
+
+        if self.last is None:
+            return 1
+
+        self.credit += min( now - self.last, 0.25 ) * rate
+
+        n = int( self.credit )
+        self.credit -= n
+
+        return n
+
+    def refresh( self ):
+        # True if a tick without a frame has to draw the details anyway ( the Play line would get stale )
+        self.idle += 1
+
+        if self.idle < self.idle_ticks:
+            return False
+
+        self.idle = 0
+
+        return True
+
+    def tick( self, now, print_tm, frame ):
+        # record the tick started at now ( frame : it showed a new position ), return the timer interval ( ms ) to the next one
+        self.last = now
+
+        if frame:
+            self.frames.append( ( now, print_tm ) )
+            self.idle = 0
+
+        cost = ( time.perf_counter() - now ) * 1000
+
+        return int( max( self.period_ms - cost, self.idle_ms ) )
+
+    def span( self ):
+        return self.last - self.frames[ 0 ][ 0 ] if len( self.frames ) >= 2 else 0.0
+
+    def fps( self ):
+        t = self.span()
+        return ( len( self.frames ) - 1 ) / t if t > 0 else 0.0
+
+    def speed( self ):
+        # print sec per sec
+        t = self.span()
+        return ( self.frames[ -1 ][ 1 ] - self.frames[ 0 ][ 1 ] ) / t if t > 0 else 0.0
+
+class FrozenVar:
+
+    # the value of a Tk variable ( or the position of a scrollbar ) at a moment ( Viewer.renderSnapshot )
+
+    def __init__( self, value ):
+        self.value = value
+
+    def get( self ):
+        return self.value
+
+class RenderCancelled( Exception ):
+    pass
+
+class RenderThread:
+
+    # Renders the frames of the Viewer off the Tk thread ( Viewer.renderFrame ).
+    #
+    # post() hands a snapshot of the viewer ( Viewer.renderSnapshot ) to render. A snapshot waiting is replaced by a newer
+    # one, the frame being rendered is finished. cancel() drops both ( the Tk thread draws in place ).
+    # The frames are rendered into two surfaces in turn : the Tk thread take()s the finished one and giveBack()s the
+    # one it showed so far as the next back buffer.
+
+    def __init__( self ):
+        self.cond       = threading.Condition()
+        self.serial     = 0                     # serial of the last post / cancel
+        self.cancelled  = 0                     # serial of the last cancel
+        self.job        = None                  # ( serial, snapshot ) waiting
+        self.running    = False
+        self.done       = None                  # ( surface, ms ) finished, not taken yet
+        self.back       = None                  # back buffer
+
+        self.thread = threading.Thread( target = self.run, daemon = True )
+        self.thread.start()
+
+    def post( self, snapshot ):
+        with self.cond:
+            self.serial += 1
+
+            snapshot.render_cancel = functools.partial( self.isCancelled, self.serial )
+
+            self.job = ( self.serial, snapshot )
+            self.cond.notify()
+
+    def cancel( self ):
+        with self.cond:
+            self.serial    += 1
+            self.cancelled  = self.serial
+            self.job        = None
+
+            if self.done is not None:
+                self.back = self.done[ 0 ]
+                self.done = None
+
+    def isCancelled( self, serial ):
+        # cancel() after the post() of the frame serial ( a later post() does not cancel it )
+        return self.cancelled > serial
+
+    def busy( self ):
+        with self.cond:
+            return self.job is not None or self.running or self.done is not None
+
+    def take( self ):
+        with self.cond:
+            done = self.done
+            self.done = None
+
+            return done
+
+    def giveBack( self, surface ):
+        with self.cond:
+            if self.back is None:
+                self.back = surface
+
+    def run( self ):
+        while True:
+            with self.cond:
+                while self.job is None:
+                    self.cond.wait()
+
+                ( serial, snapshot ) = self.job
+
+                self.job     = None
+                self.running = True
+
+                surface = self.back
+                self.back = None
+
+            canv_wh = snapshot.canvAreaSize()
+            shape   = ( canv_wh.Y, canv_wh.X, 4 )
+
+            if surface is None or surface.shape != shape:
+                surface = np.zeros( shape, dtype = np.uint8 )
+
+            ok = False
+            t  = time.perf_counter()
+
+            try:
+                with snapshot.render_lock:
+                    snapshot.renderImage( makeSurface( surface ).getCanvas(), surface )
+
+                ok = True
+
+            except RenderCancelled:
+                pass
+
+            except Exception as err:
+                traceback.print_exception( err, file=sys.stderr )
+
+            ms = ( time.perf_counter() - t ) * 1000
+
+            with self.cond:
+                self.running = False
+
+                if ok and not snapshot.render_cancel():
+                    if self.done is not None:
+                        self.back = self.done[ 0 ]
+
+                    self.done = ( surface, ms )
+
+                elif self.back is None:
+                    self.back = surface
+
+class Viewer:
+
+    option = None
+    root = None
+
+    zoom = ZOOM_DEFAULT
+
+    bed_w = DEFAULT_BED_W
+    bed_h = DEFAULT_BED_H
+    bed_m = DEFAULT_BED_M
+
+    surface = None
+
+    feedrate_color_h_st = 0.125     # HSV Color H Start
+    feedrate_color_h_ln = -0.25     # HSV Color H Length
+
+    canv_rect_xy = Point( 1, 1 )
+    canv_rect_wh = Point( 2, 2 )
+
+    canv_rect_offset_X = 0.0
+    canv_rect_offset_Y = 0.0
+
+    canv_padxy = 8
+
+    gcode = None
+    gcode_lns = []
+    gcode_fr_map = {}
+    gcode_fr_fail = skia.HSVToColor( [ feedrate_color_h_st  * 360, 1, 1 ] )
+    gcode_thumbnail = None
+
+    scan_mark = None
+
+    bed_color = 0xff333333
+    legend_border_color = 0xff33ff33
+
+    paint_e = functools.partial(                # extrusion ( bed coordinates )
+                skia.Paint
+            ,   Color=0xff990000
+            ,   AntiAlias=True
+            ,   StrokeWidth=0.4
+            ,   Style=skia.Paint.kStroke_Style
+            ,   StrokeCap=skia.Paint.kRound_Cap
+            ,   StrokeJoin=skia.Paint.kRound_Join
+            )
+
+    layer_b_color = 0xcc666666                  # extrusion of the Prev / Current layer
+
+    mark_r   = 4                                # move marks ( canvas coordinates )
+    pick_r   = 6                                # click on a move ( canvas coordinates, see pickMove )
+    paint_e2 = skia.Paint( Color=0xffffffff
+            ,   AntiAlias=True
+            ,   StrokeWidth=1
+            ,   Style=skia.Paint.kStroke_Style
+            ,   StrokeCap=skia.Paint.kRound_Cap
+            ,   StrokeJoin=skia.Paint.kRound_Join
+            )
+    paint_e3  = skia.Paint( Color=0xffffffff, AntiAlias=True )
+    paint_e4  = skia.Paint( Color=0xffffffff, AntiAlias=True, StrokeWidth=1.0, Style=skia.Paint.kStroke_Style )
+    paint_m   = skia.Paint( Color=0xff00cc00, AntiAlias=True, StrokeWidth=1.0, Style=skia.Paint.kStroke_Style )
+    paint_m2  = skia.Paint( Color=0xff00ff00, AntiAlias=True, StrokeWidth=2.0, Style=skia.Paint.kStroke_Style )
+    paint_zu  = skia.Paint( Color=0xff00ff00, AntiAlias=True )
+    paint_zu2 = skia.Paint( Color=0xff00ff00, AntiAlias=True, StrokeWidth=1.0, Style=skia.Paint.kStroke_Style )
+    paint_zd  = skia.Paint( Color=0xffffff00, AntiAlias=True )
+    paint_zd2 = skia.Paint( Color=0xffffff00, AntiAlias=True, StrokeWidth=1.0, Style=skia.Paint.kStroke_Style )
+
+    layer_pictures = None                       # { ( layer, color, st, ed ) : skia.Picture } in LRU order
+    layer_whole_picture = True                  # False : draw the layers by checkpoints ( see renderSnapshot )
+    layer_grids = None                          # { ( layer, moves ) : SegmentGrid } in LRU order
+    layer_lods = None                           # { ( layer, st, ed ) : PolylineLOD } in LRU order
+    layer_lod = True                            # False : draw the full extrusion polylines ( SVG )
+
+    overlay_images = None                       # { name : ( key, skia.Image ) } bed and overlays ( see overlayImage )
+    overlay_typeface = None                     # skia.Typeface of the overlays ( made in __init__, not at import )
+    overlay_font     = None
+    overlay_font_b   = None
+
+    play_frame = None                           # PlayFrame while playing
+
+    frame_ms        = int( 1000 / 60 )          # frame scheduler ( see requestImage )
+    frame_timer_id  = None
+    frame_requests  = 0                         # requests waiting for the next frame
+    frame_last      = 0.0                       # time.perf_counter() of the last frame
+    frame_stats     = None                      # FrameStats
+    frame_served    = 0                         # requests posted to the RenderThread since the last frame shown
+    frame_poll_ms   = int( 1000 / 120 )
+    frame_poll_id   = None
+
+    render_thread   = None                      # RenderThread
+    render_lock     = None                      # held while rendering ( the caches are shared with the RenderThread )
+    render_cancel   = None                      # callable, True when the frame being rendered is cancelled ( RenderThread )
+    grid_lock       = None                      # held while reading or updating layer_grids ( see layerGrid )
+
+    config_padxy = 10
+
+    play_timer_id = None
+
+    play_timer_span_dic = {  # ms, skip
+        "Slow"         : ( int( 1000 /  10 ), 1 )
+    ,   "Normal"       : ( int( 1000 / 100 ), 1 )
+    ,   "Fast"         : ( int( 1000 / 100 ), 5 )
+    ,   "VeryFast"     : ( int( 1000 / 100 ), 10 )
+    ,   "SupreSpeed"    : ( int( 1000 / 100 ), 20 )
+    ,   "UltraSpeed"    : ( int( 1000 / 100 ), 50 )
+    ,   "SoundSpeed"     : ( int( 1000 / 100 ), 100 )
+    ,   "HeavenlySpeed"  : ( int( 1000 / 100 ), 200 )
+    ,   "LightningSpeed" : ( int( 1000 / 100 ), 500 )
+    ,   "GodSpeed"       : ( int( 1000 / 100 ), -1 )
+    }
+
+    play_time_rate_dic = {  # print sec per sec ( see progressPlayTime )
+        "Time x1"       : 1
+    ,   "Time x10"      : 10
+    ,   "Time x100"     : 100
+    ,   "Time x1000"    : 1000
+    }
+
+    play_time_pos   = None                      # ( print time, ln, li, perf_counter ) of the last tick
+    play_fps        = 60                        # target of PlayPace
+
+    thread_gl = None
+    thread_gl_filename  = None
+    thread_gl_info      = None          # GcodeInfo of the loading file
+    thread_gl_thread    = None
+    thread_gl_th_image  = None
+    thread_gl_ptm       = int( 1000 / 8 )
+    thread_gl_live      = 0             # number of layers shown while loading ( 0 : not yet )
+
+    experiment = None
+
+    def __init__( self, **kwargs ):
+        self.option = kwargs
+
+        self.bed_w = self.option.get( "bed_w", self.bed_w )
+        self.bed_h = self.option.get( "bed_h", self.bed_h )
+
+        self.layer_pictures = collections.OrderedDict()
+        self.layer_grids    = collections.OrderedDict()
+        self.layer_lods     = collections.OrderedDict()
+        self.overlay_images = {}
+        self.overlay_typeface = skia.Typeface( '' )                     # the default family ( skia.Font( None ) is deprecated )
+        self.overlay_font   = skia.Font( self.overlay_typeface, 13.5 )
+        self.overlay_font_b = skia.Font( self.overlay_typeface, 18 )
+        self.frame_stats    = FrameStats()
+        self.play_pace      = PlayPace( self.play_fps )
+        self.render_lock    = threading.RLock()
+        self.grid_lock      = threading.Lock()
+
+    def isModeExp( self ):
+        return self.option.get( 'experiment', False )
+
+    def play_timer_span( self ):
+        # ( ms, skip ), skip None : time based ( play_time_rate_dic )
+        if self.cbo_pl.get() in self.play_time_rate_dic:
+            return ( int( 1000 / self.play_fps ), None )
+
+        return self.play_timer_span_dic.get( self.cbo_pl.get() )
+
+    def gcode_ln_min( self ):
+        return 1 if len( self.gcode.layer_data ) > 1 else 0
+
+    def gcode_ln_max( self ):
+        return len( self.gcode.layer_data ) - 1
+
+    def gcode_li_max( self ):
+        try:
+            return len( self.gcode.layer_data[ self.gcode_ln() ].layer ) - 1
+        except IndexError:
+            return 0
+
+    def gcode_ln( self ):
+        return self.scale_v_value.get()
+
+    def gcode_li( self ):
+        return self.scale_h_value.get()
+
+    def gcode_layer( self, ln ):
+        try:
+            return self.gcode.layer_data[ ln ].layer
+        except IndexError:
+            return []
+
+    def gcode_layer_height( self, ln ):
+        try:
+            return self.gcode.layer_data[ ln ].height
+        except IndexError:
+            return 0
+
+    def gcode_layer_time( self, ln ):
+        try:
+            return self.gcode.layer_data.layerTime( ln )
+        except ( IndexError, AttributeError ):
+            return 0
+
+    def gcode_lnli( self, ln, li ):
+        layer = self.gcode_layer( ln )
+
+        if len( layer ) == 0:
+            return None
+
+        if li < 0:
+            li = 0
+        elif li >= len( layer ):
+            li = len( layer ) - 1
+
+        return layer[ li ]
+
+    def bedOuter( self ):
+        return Point( self.bed_w + self.bed_m * 2, self.bed_h + self.bed_m * 2 )
+
+    def drawAreaSize( self ):
+        bed_o = self.bedOuter()
+        return Point( int( bed_o.X * self.zoom ), int( bed_o.Y * self.zoom ) )
+
+    def canvAreaSize( self ):
+        return Point( self.canv_rect_wh.X - self.canv_rect_xy.X, self.canv_rect_wh.Y - self.canv_rect_xy.Y )
+
+    def feedrateColor( self, fr ):
+        return self.gcode_fr_map.get( fr, self.gcode_fr_fail )
+
+    def layerPicture( self, ln, color = None, st = 0, ed = None ):
+        # skia.Picture of the extrusion of the moves [ st, ed ) of the layer ln ( bed coordinates ), color : None for the feedrate colors
+        # The polylines are simplified for the zoom ( see lodTolerance ), one path per color in each range of layerChunks.
+        # The pictures are kept up to LAYER_PICTURE_MAX_BYTES, the least recently used first out.
+        # A cancelled frame ( renderCheck ) stops between the ranges, the PolylineLOD built so far are kept.
+
+        if ln < 0:
+            ln += len( self.gcode.layer_data )
+
+        tol = self.lodTolerance()
+        key = ( ln, color, st, ed, tol )
+        pic = self.layer_pictures.get( key )
+
+        if pic is not None:
+            self.layer_pictures.move_to_end( key )
+            return pic
+
+        chunks = []
+
+        for ( c0, c1 ) in self.layerChunks( ln, st, ed ):
+            self.renderCheck()
+            chunks.append( self.layerRuns( ln, c0, c1, tol ) )
+
+        runs = [ r for c in chunks for r in c ]
+
+        if len( runs ) > 0:
+            pts = np.concatenate( [ p for ( _, p ) in runs ] )
+            ( x0, y0 ) = pts.min( axis = 0 )
+            ( x1, y1 ) = pts.max( axis = 0 )
+        else:
+            ( x0, y0, x1, y1 ) = ( 0, 0, 0, 0 )
+
+        rec = skia.PictureRecorder()
+        skc = rec.beginRecording( skia.Rect.MakeLTRB( x0, y0, x1, y1 ).makeOutset( 1, 1 ) )
+
+        for c in chunks:
+            self.renderCheck()
+
+            for ( path, paint ) in self.runPaths( c, color ):
+                skc.drawPath( path, paint )
+
+        pic = rec.finishRecordingAsPicture()
+
+        self.layer_pictures[ key ] = pic
+
+        size = sum( x.approximateBytesUsed() for x in self.layer_pictures.values() )
+
+        while size > LAYER_PICTURE_MAX_BYTES and len( self.layer_pictures ) > 1:
+            ( _, old ) = self.layer_pictures.popitem( last = False )
+            size -= old.approximateBytesUsed()
+
+        return pic
+
+    def layerChunks( self, ln, st = 0, ed = None ):
+        # the moves [ st, ed ) of the layer ln split at the checkpoints ( LAYER_CHECKPOINT_MOVES ) : [ ( st, ed ) ]
+        # The extrusion is drawn a path per color in each of them ( see runPaths ), so the whole layer and the
+        # checkpoint pictures draw the same paths in the same order.
+
+        layer = self.gcode_layer( ln )
+        ed    = len( layer ) if ed is None else ed
+
+        cps = [ st ] + [ c for c in layer.checkpoints( LAYER_CHECKPOINT_MOVES ).tolist() if st < c < ed ] + [ ed ]
+
+        return list( zip( cps, cps[ 1: ] ) )
+
+    def lodTolerance( self ):
+        # tolerance ( mm ) of the PolylineLOD level for the zoom, None : the full polylines
+        if not self.layer_lod:
+            return None
+
+        tols = [ t for t in LAYER_LOD_LEVELS if t <= LAYER_LOD_PIXEL / self.zoom ]
+
+        return tols[ -1 ] if len( tols ) > 0 else None
+
+    def layerRuns( self, ln, st, ed, tol, take = None ):
+        # extrusionRuns of the moves [ st, ed ) of the layer ln simplified with tol ( see lodTolerance ), take : see extrusionRuns
+        # The PolylineLOD are kept up to LAYER_LOD_MAX_BYTES, the least recently used first out.
+
+        if tol is None:
+            return self.gcode_layer( ln ).extrusionRuns( st, ed, take )
+
+        key = ( ln, st, ed )
+        lod = self.layer_lods.get( key )
+
+        if lod is not None:
+            self.layer_lods.move_to_end( key )
+            return lod.runs( tol, take )
+
+        lod = self.layer_lods[ key ] = PolylineLOD( self.gcode_layer( ln ).extrusionRuns( st, ed ), LAYER_LOD_LEVELS[ 0 ] )
+
+        size = sum( x.nbytes() for x in self.layer_lods.values() )
+
+        while size > LAYER_LOD_MAX_BYTES and len( self.layer_lods ) > 1:
+            ( _, old ) = self.layer_lods.popitem( last = False )
+            size -= old.nbytes()
+
+        return lod.runs( tol, take )
+
+    def layerGrid( self, ln ):
+        # SegmentGrid of the layer ln, the last LAYER_GRID_MAX are kept
+        # The cache is guarded by grid_lock only ( pickMove does not wait for a frame ), a grid is built outside of it.
+
+        if ln < 0:
+            ln += len( self.gcode.layer_data )
+
+        layer  = self.gcode_layer( ln )
+        key    = ( ln, len( layer ) )       # a layer may grow while loading
+        grids  = self.layer_grids
+
+        with self.grid_lock:
+            grid = grids.get( key )
+
+            if grid is not None:
+                grids.move_to_end( key )
+                return grid
+
+        self.renderCheck()
+
+        grid = SegmentGrid( layer )
+
+        with self.grid_lock:
+            grids[ key ] = grid
+
+            while len( grids ) > LAYER_GRID_MAX:
+                grids.popitem( last = False )
+
+        return grid
+
+    def visibleBedRect( self ):
+        # the bed rectangle ( x0, y0, x1, y1 ) on the canvas, widened by the move marks and the extrusion width
+        # ( viewMatrix has no rotation nor skew )
+
+        mtx     = self.viewMatrix()
+        canv_wh = self.canvAreaSize()
+
+        xs = ( ( 0 - mtx.trX ) / mtx.scX, ( canv_wh.X - mtx.trX ) / mtx.scX )
+        ys = ( ( 0 - mtx.trY ) / mtx.scY, ( canv_wh.Y - mtx.trY ) / mtx.scY )
+
+        m = ( self.mark_r + 4 ) / self.zoom + self.paint_e().getStrokeWidth()
+
+        return ( min( xs ) - m, min( ys ) - m, max( xs ) + m, max( ys ) + m )
+
+    def pickMove( self, x, y ):
+        # the move of the current layer nearest to the canvas point ( x, y ) within pick_r : ( li, G1code ) or None
+        # The candidates are those of the SegmentGrid cells around the point ( the extrusion only if the moves are hidden ).
+
+        ln    = self.gcode_ln()
+        layer = self.gcode_layer( ln )
+
+        if len( layer ) == 0:
+            return None
+
+        p = self.viewMatrix().inv() @ Point( x, y )
+        r = self.pick_r / self.zoom
+
+        idx = self.layerGrid( ln ).query( p.X - r, p.Y - r, p.X + r, p.Y + r )
+
+        tp = layer.toolpath
+        i  = idx + layer.st
+
+        if self.chk_mv_value.get() == 0:
+            i = i[ ( tp.flags[ i ] & ( G1_FLAG_EXTRUDE | G1_FLAG_Z ) ) == G1_FLAG_EXTRUDE ]
+
+        if len( i ) == 0:
+            return None
+
+        # distance to the segments
+
+        ( x0, y0 ) = ( tp.cx[ i ], tp.cy[ i ] )
+
+        dx = np.where( np.isnan( tp.X[ i ] ), x0, tp.X[ i ] ) - x0
+        dy = np.where( np.isnan( tp.Y[ i ] ), y0, tp.Y[ i ] ) - y0
+
+        l2 = dx * dx + dy * dy
+        t  = np.clip( np.divide( ( p.X - x0 ) * dx + ( p.Y - y0 ) * dy, l2, out = np.zeros( len( i ) ), where = l2 > 0 ), 0, 1 )
+        d  = np.hypot( x0 + dx * t - p.X, y0 + dy * t - p.Y )
+
+        k = int( np.argmin( d ) )
+
+        if not d[ k ] <= r:
+            return None
+
+        li = int( i[ k ] ) - layer.st
+
+        return ( li, layer[ li ] )
+
+    def visibleMoves( self, ln ):
+        # sorted indices of the moves of the layer ln which may be on the canvas ( SegmentGrid ),
+        # None if LAYER_GRID_CULL or more of the layer is ( drawing all of it costs less than culling )
+
+        if len( self.gcode_layer( ln ) ) == 0:
+            return None
+
+        rect = self.visibleBedRect()
+        grid = self.layerGrid( ln )
+
+        if grid.coverage( *rect ) >= LAYER_GRID_CULL:
+            return None
+
+        return grid.query( *rect )
+
+    def setupGcode( self, gcode, filename = None ):
+        title_tail = ""
+
+        if filename is not None:
+            # title_tail = " - %s [%s]" % ( os.path.basename( filename ), filename )
+            title_tail = " - [%s]" % ( os.path.basename( filename ) )
+
+        self.root.title( SCRIPT_NAME + title_tail)
+
+        if self.gcode is not None and self.gcode is not gcode:
+            self.gcode.raw_gcode.close()        # the mapping of the source file ( it may be overwritten or deleted now )
+
+        self.gcode = gcode
+        self.layer_pictures = collections.OrderedDict()     # not clear(), a RenderThread snapshot may hold them
+        self.layer_grids    = collections.OrderedDict()
+        self.layer_lods     = collections.OrderedDict()
+
+        self.scale_v.configure( from_ = self.gcode_ln_max(), to = self.gcode_ln_min() )
+        self.scale_v_value.set( self.gcode_ln_min() )
+
+        self.scale_h.configure( from_ = 0, to = self.gcode_li_max() )
+        self.scale_h_value.set( 0 )
+
+        self.setupFeedrateColor()
+
+        self.zoom = ZOOM_DEFAULT
+
+        self.setupGcodeInfo()
+
+    def setupFeedrateColor( self ):
+        feedrates = self.gcode.feedrates
+
+        self.gcode_fr_map = {}
+        self.layer_pictures = collections.OrderedDict()     # not clear(), a RenderThread snapshot may hold them
+
+        if len( feedrates ) > 0:
+            min_fr = min( feedrates )
+            max_fr = max( feedrates )
+            wid_fr = max_fr - min_fr
+
+            for fr in feedrates:
+
+                p = ( ( fr - min_fr ) / wid_fr )
+                h = self.feedrate_color_h_st + self.feedrate_color_h_ln * p
+
+                if h < 0.0:
+                    h += 1.0
+                elif h > 1.0:
+                    h -= 1.0
+
+                c = skia.HSVToColor( [ h * 360, 1, 1 ] )
+
+                self.gcode_fr_map[ fr ] = c
+
+    def setupGcodeInfo( self ):
+        # bed shape and thumbnail ( the bed shape is often at the end of the file : while it is loading, that of
+        # scanGcodeInfo, so the bed does not change when the load ends )
+
+        ( bed_x_max, bed_y_max ) = ( self.gcode.bed_x_max, self.gcode.bed_y_max )
+
+        if(     self.gcode is self.thread_gl and self.thread_gl_thread is not None and self.thread_gl_thread.is_alive()
+            and self.thread_gl_info is not None and self.thread_gl_info.bed is not None
+            ):
+            ( _, bed_x_max, _, bed_y_max ) = self.thread_gl_info.bed
+
+        if bed_x_max is not None:
+            self.bed_w = bed_x_max
+
+        if bed_y_max is not None:
+            self.bed_h = bed_y_max
+
+        self.gcode_thumbnail = None
+
+        thumbnail_bytes = self.gcode.getThumbnailImage()
+
+        if thumbnail_bytes != None:
+            self.gcode_thumbnail = skia.Image.MakeFromEncoded( skia.Data( thumbnail_bytes ) )
+
+    def updateGcodeRange( self ):
+        # self.gcode has more layers ( progressive loading ), keep the current layer and index
+        # return True if the image has to be redrawn
+
+        ln = self.gcode_ln()
+
+        self.scale_v.configure( from_ = self.gcode_ln_max(), to = self.gcode_ln_min() )
+        self.scale_v_value.set( min( max( self.gcode_ln_min(), ln ), self.gcode_ln_max() ) )
+
+        redraw = self.gcode_ln() != ln or self.chk_dt_value.get() != 0
+
+        if list( self.gcode_fr_map.keys() ) != list( self.gcode.feedrates ):
+            self.setupFeedrateColor()
+            redraw = True
+
+        if self.gcode_ln() != ln:
+            self.scale_h.configure( from_ = 0, to = self.gcode_li_max() )
+            self.scale_h_value.set( 0 )
+
+        return redraw
+
+    def setupIcons( self ):
+        self.icon_zoom_in       = makeTkImage( svgIconRenderer( io.StringIO( ICON_ZOOM_IN ), 24, 24 ) )
+        self.icon_zoom_out      = makeTkImage( svgIconRenderer( io.StringIO( ICON_ZOOM_OUT ), 24, 24 ) )
+        self.icon_zoom_reset    = makeTkImage( svgIconRenderer( io.StringIO( ICON_ZOOM_RESET ), 24, 24 ) )
+        self.icon_up            = makeTkImage( svgIconRenderer( io.StringIO( ICON_UP ), 24, 24 ) )
+        self.icon_down          = makeTkImage( svgIconRenderer( io.StringIO( ICON_DOWN ), 24, 24 ) )
+        self.icon_forward_skip  = makeTkImage( svgIconRenderer( io.StringIO( ICON_FORWARD_SKIP ), 24, 24 ) )
+        self.icon_forward       = makeTkImage( svgIconRenderer( io.StringIO( ICON_FORWARD ), 24, 24 ) )
+        self.icon_backword      = makeTkImage( svgIconRenderer( io.StringIO( ICON_BACKWORD ), 24, 24 ) )
+        self.icon_backword_skip = makeTkImage( svgIconRenderer( io.StringIO( ICON_BACKWORD_SKIP ), 24, 24 ) )
+        self.icon_file_text     = makeTkImage( svgIconRenderer( io.StringIO( ICON_FILE_TEXT ), 24, 24 ) )
+        self.icon_file_svg      = makeTkImage( svgIconRenderer( io.StringIO( ICON_FILE_SVG ), 24, 24 ) )
+        self.icon_player_play   = makeTkImage( svgIconRenderer( io.StringIO( ICON_PLAYER_PLAY ), 24, 24 ) )
+        self.icon_player_pause  = makeTkImage( svgIconRenderer( io.StringIO( ICON_PLAYER_PAUSE ), 24, 24 ) )
+        self.icon_config        = makeTkImage( svgIconRenderer( io.StringIO( ICON_CONFIIG ), 24, 24 ) )
+        self.icon_close         = makeTkImage( svgIconRenderer( io.StringIO( ICON_CLOSE ), 16, 16, color = self.legend_border_color ) )
+
+    def close( self ):
+        if self.experiment != None:
+            self.experiment.close()
+
+        if self.gcode is not None:
+            self.gcode.raw_gcode.close()
 
         self.root.destroy()
         self.root = None
@@ -1658,8 +4040,8 @@ class Viewer:
         self.updatePlayState( False )
 
         self.cbo_pl = ttk.Combobox( self.stat_bar, state='readonly'
-            ,   width = max( map( lambda x : len( x ), self.play_timer_span_dic.keys() ) )
-            ,   values = tuple( self.play_timer_span_dic.keys() )
+            ,   width = max( map( lambda x : len( x ), tuple( self.play_timer_span_dic.keys() ) + tuple( self.play_time_rate_dic.keys() ) ) )
+            ,   values = tuple( self.play_timer_span_dic.keys() ) + tuple( self.play_time_rate_dic.keys() )
             )
         self.cbo_pl.set( self.cbo_pl.cget( "values" )[1] )
 
@@ -1704,6 +4086,10 @@ class Viewer:
         self.canv.bind( "<B3-Motion>",          self.scrollMove )
         self.canv.bind( "<ButtonRelease-3>",    self.scrollEnd )
         self.canv.bind( "<MouseWheel>",         self.zoomInOut )
+        self.canv.bind( "<ButtonPress-1>",      self.onClick )
+
+        self.root.bind( "<Shift-Right>",        self.onKey_next_e )
+        self.root.bind( "<Shift-Left>",         self.onKey_prev_e )
 
         self.config_frame.bind( "<Configure>", self.onResizeConfig )
         self.config_frame.bind( "<Visibility>", self.onResizeConfig )
@@ -1723,7 +4109,7 @@ class Viewer:
         self.canv_rect_wh = Point( event.width, event.height )
 
         self.updateScrollBar()
-        self.updateImage()
+        self.requestImage()
 
         if self.config_frame.winfo_ismapped():
             x = self.canv.winfo_width() - self.config_padxy
@@ -1755,7 +4141,7 @@ class Viewer:
         if target_image[ 0 ] is None or target_image[ 2 ] != w or target_image[ 3 ] != h:
             surface = np.zeros( ( h, w, 4 ), dtype = np.uint8 )
 
-            with skia.Surface( surface ) as skc:
+            with makeSurface( surface ) as skc:
                 l0 = skia.Paint( Color=self.bed_color, AntiAlias=True )
                 l1 = skia.Paint( Color=self.legend_border_color, AntiAlias=True, StrokeWidth=2, Style=skia.Paint.kStroke_Style )
 
@@ -1775,27 +4161,40 @@ class Viewer:
         else:
             self.canv.moveto( target_image[ 1 ], x, y )
 
-    def setupCanvasImage( self ):
+    def setupCanvasImage( self, rects = None ):
+
+        # rects : [ ( x0, y0, x1, y1 ) ] update only these parts of the canvas image
+        # The Tk image is kept and updated in place while the size of the surface does not change.
+
+        if ( self.canv_image.height(), self.canv_image.width() ) == self.surface.shape[ : 2 ]:
+
+            if rects is None:
+                self.canv_image.paste( makePILImage( self.surface ) )
 
-        # important ^^^
+            else:
+                for ( x0, y0, x1, y1 ) in rects:
+                    image = makeTkImage( self.surface[ y0 : y1, x0 : x1 ] )
+                    self.canv.tk.call( str( self.canv_image ), 'copy', str( image ), '-to', x0, y0, '-compositingrule', 'set' )
 
-        # important vvv
-        # Reference the object to an instance of the class,
-        # since the object has already been deleted when the actual drawing takes place
+        else:
+            # important vvv
+            # Reference the object to an instance of the class,
+            # since the object has already been deleted when the actual drawing takes place
 
-        self.canv_image = makeTkImage( self.surface )
+            self.canv_image = makeTkImage( self.surface )
 
-        # important ^^^
+            # important ^^^
 
-        self.canv.itemconfig( self.canv_image_id, image = self.canv_image )
+            self.canv.itemconfig( self.canv_image_id, image = self.canv_image )
 
         # label update
 
-        msg = "L:%d/%d (%.2fmm/%.2fmm) I:%d/%d" % (
+        msg = "L:%d/%d (%.2fmm/%.2fmm) I:%d/%d F:%.1fms D:%d" % (
                     self.gcode_ln(), self.gcode_ln_max()
                 ,   self.gcode_layer_height( self.gcode_ln() )
                 ,   self.gcode_layer_height( -1 )
                 ,   self.gcode_li() + 1, self.gcode_li_max() + 1
+                ,   self.frame_stats.average(), self.frame_stats.dropped
                 )
 
         self.label.configure( text = msg )
@@ -1841,7 +4240,7 @@ class Viewer:
 
         target.set( first, last )
 
-        self.updateImage()
+        self.requestImage()
 
     def updateScrollBar( self ):
         canv_wh = self.canvAreaSize()
@@ -1879,30 +4278,18 @@ class Viewer:
                 new_first = 0
                 new_last  = 1
 
-            target.set( new_first, new_last )
-
-    def updateImage( self, canvas = None ):
-        canv_wh = self.canvAreaSize()
-
-        if canvas == None:
-            if self.surface is None or self.surface.shape != ( canv_wh.Y, canv_wh.X, 4 ):
-                self.surface = np.zeros( ( canv_wh.Y, canv_wh.X, 4 ), dtype = np.uint8 )   # Remake surface
+            target.set( new_first, new_last )
 
-        bed_o = self.bedOuter()
-        bed_t = Point( self.bed_w, self.bed_h )
-        bed_h = Point( self.bed_m, self.bed_m )
+    def viewMatrix( self ):
+        # bed coordinates to canvas pixels
 
+        canv_wh = self.canvAreaSize()
+        bed_h   = Point( self.bed_m, self.bed_m )
         draw_wh = self.drawAreaSize()
 
         ( h_offset_f, h_offset_l ) = self.bar_h.get()
         ( v_offset_f, v_offset_l ) = self.bar_v.get()
 
-        if canvas == None:
-            skc = skia.Surface( self.surface ).getCanvas()
-        else:
-            skc = canvas
-
-        # matrix setup
         mtx = Matrix.tran( 0, 0 )
 
         for _mtx in (
@@ -1916,17 +4303,48 @@ class Viewer:
             ):
             mtx = _mtx @ mtx
 
-        def coordXY( x, y = None ):
-            if y is not None:
-                return mtx @ Point( x, y )
+        return mtx
 
-            return mtx @ x
+    def overlayImage( self, name, key, draw ):
+        # skia.Image of draw( skc ) -> ( w, h ) which draws in [ 0, w ) x [ 0, h ).
+        # It is kept in self.overlay_images[ name ] and drawn again only when key changes.
 
-        # clear
+        ( k, image ) = self.overlay_images.get( name, ( None, None ) )
 
-        skc.clear( 0x00000000 )
+        if image is None or k != key:
+            rec = skia.PictureRecorder()
+            wh  = draw( rec.beginRecording( skia.Rect.MakeWH( 1 << 16, 1 << 16 ) ) )
+            pic = rec.finishRecordingAsPicture()
 
-        # bed grid draw
+            surface = skia.Surface( max( int( math.ceil( wh[ 0 ] ) ), 1 ), max( int( math.ceil( wh[ 1 ] ) ), 1 ) )
+            surface.getCanvas().drawPicture( pic )
+            image = surface.makeImageSnapshot()
+
+            self.overlay_images[ name ] = ( key, image )
+
+        return image
+
+    def bedImage( self, coordXY ):
+        # RGBA array of the canvas with only the bed drawn ( see drawBed ), kept while the view does not change.
+        # Copying it is the clear and the bed draw of a frame.
+
+        canv_wh = self.canvAreaSize()
+        key     = ( canv_wh, self.viewMatrix(), self.zoom, self.bed_w, self.bed_h, self.bed_m )
+
+        ( k, image ) = self.overlay_images.get( 'bed', ( None, None ) )
+
+        if image is None or k != key:
+            image = np.zeros( ( canv_wh.Y, canv_wh.X, 4 ), dtype = np.uint8 )
+            self.drawBed( makeSurface( image ).getCanvas(), coordXY )
+
+            self.overlay_images[ 'bed' ] = ( key, image )
+
+        return image
+
+    def drawBed( self, skc, coordXY ):
+        # bed, axes, grid and tick labels
+
+        bed_t = Point( self.bed_w, self.bed_h )
 
         skc.save()
 
@@ -1938,7 +4356,7 @@ class Viewer:
         a1 = skia.Paint( Color=0xff33ff33, AntiAlias=False, StrokeWidth=2, Style=skia.Paint.kStroke_Style )
 
         a2 = skia.Paint( Color=0xff33ff33, AntiAlias=True )
-        f2 = skia.Font( None, 13.5 if self.zoom >= ZOOM_DEFAULT else 13.5 * self.zoom / ZOOM_DEFAULT )
+        f2 = skia.Font( self.overlay_typeface, 13.5 if self.zoom >= ZOOM_DEFAULT else 13.5 * self.zoom / ZOOM_DEFAULT )
 
         a3 = skia.Paint( Color=0xffaaaaaa, AntiAlias=False, StrokeWidth=1, Style=skia.Paint.kStroke_Style )
 
@@ -1994,117 +4412,140 @@ class Viewer:
 
         skc.restore()
 
-        # move draw prepair
 
-        cr    = 4
-        pa_e  = functools.partial(
-                    skia.Paint
-                ,   Color=0xff990000
-                ,   AntiAlias=True
-                ,   StrokeWidth=0.4
-                ,   Style=skia.Paint.kStroke_Style
-                ,   StrokeCap=skia.Paint.kRound_Cap
-                ,   StrokeJoin=skia.Paint.kRound_Join
-                )
+    def extrusionDraws( self, skc, ln, ed, color = None ):
+        # DrawFunc of the extrusion of the moves [ 0, ed ) of the layer ln ( bed coordinates ), color : see layerPicture
+        # the cached picture of the whole layer, or those of the checkpoints up to ed and the polylines of the rest
+        # ( always the checkpoints if not layer_whole_picture ), or at high zoom the polylines holding visibleMoves only
+        # ( whole and simplified as in the pictures, in the same paths and colors : the pixels differ by the anti-aliasing
+        # only, as skia rasterizes a path with less polylines a little differently )
 
-        pa_e2 = skia.Paint( Color=0xffffffff
-                ,   AntiAlias=True
-                ,   StrokeWidth=1
-                ,   Style=skia.Paint.kStroke_Style
-                ,   StrokeCap=skia.Paint.kRound_Cap
-                ,   StrokeJoin=skia.Paint.kRound_Join
-                )
+        layer = self.gcode_layer( ln )
 
-        pa_e3 = skia.Paint( Color=0xffffffff, AntiAlias=True )
-        pa_e4 = skia.Paint( Color=0xffffffff, AntiAlias=True, StrokeWidth=1.0, Style=skia.Paint.kStroke_Style )
+        if len( layer ) == 0 or ed <= 0:
+            return []
 
-        pa_e_b_color = 0xcc666666
+        moves = self.visibleMoves( ln )
 
-        pa_m  = skia.Paint( Color=0xff00cc00, AntiAlias=True, StrokeWidth=1.0, Style=skia.Paint.kStroke_Style )
-        pa_m2 = skia.Paint( Color=0xff00ff00, AntiAlias=True, StrokeWidth=2.0, Style=skia.Paint.kStroke_Style )
+        if moves is not None:
+            tol = self.lodTolerance()
+            cps = set( layer.checkpoints( LAYER_CHECKPOINT_MOVES ).tolist() + [ len( layer ) ] )     # the ends of the pictures
 
-        pa_zu = skia.Paint( Color=0xff00ff00, AntiAlias=True )
-        pa_zu2 = skia.Paint( Color=0xff00ff00, AntiAlias=True, StrokeWidth=1.0, Style=skia.Paint.kStroke_Style )
+            draws = []
 
-        pa_zd = skia.Paint( Color=0xffffff00, AntiAlias=True )
-        pa_zd2 = skia.Paint( Color=0xffffff00, AntiAlias=True, StrokeWidth=1.0, Style=skia.Paint.kStroke_Style )
+            for ( c0, c1 ) in self.layerChunks( ln, 0, min( ed, len( layer ) ) ):
+                self.renderCheck()
 
-        d_layer_0   = []    # Use canvas affine transformation
-        d_layer_1   = []    # Use custom affine transformation
+                ( a, b ) = np.searchsorted( moves, ( c0, c1 ) )
 
-        # prepair current or prev layer
+                if a == b:
+                    continue
 
-        d_layer_b_opt = self.cbo_ly.get()
-        d_layer_b_ln = 0 if d_layer_b_opt == "Current" else -1 if d_layer_b_opt == "Prev" else None
+                ( take, order ) = layer.extrusionRunsOf( c0, c1, moves[ a : b ] )
 
-        d_point     = []    # [0] : feedrate, [1:] Point
+                if len( take ) > 0:
+                    draws += self.polylineDraws( skc, self.layerRuns( ln, c0, c1, tol if c1 in cps else None, take ), color, order )
 
-        def d_point_func_b( feedrate = None ):
-            if len( d_point ) > 0:
-                if feedrate is None or feedrate != d_point[ 0 ]:
-                    d_layer_0.append( DrawFunc( skc.drawPoints, ( skia.Canvas.PointMode.kPolygon_PointMode, d_point[1:], pa_e( Color = pa_e_b_color ) ) ) )
-                    d_point.clear()
+            return draws
 
-        if d_layer_b_ln is not None:
-            layer_b = self.gcode_layer( self.gcode_ln() + d_layer_b_ln )
+        if ed >= len( layer ) and self.layer_whole_picture:
+            return [ DrawFunc( skc.drawPicture, ( self.layerPicture( ln, color ), ) ) ]
 
-            for g1 in layer_b:
+        cps = [ c for c in layer.checkpoints( LAYER_CHECKPOINT_MOVES ).tolist() if c <= ed ]
 
-                if g1.Z is None:
-                    x = g1.X if g1.X is not None else g1.cx
-                    y = g1.Y if g1.Y is not None else g1.cy
+        if ed >= len( layer ):
+            cps.append( len( layer ) )
 
-                    if g1.E is not None and g1.E > 0:
+        draws = [ DrawFunc( skc.drawPicture, ( self.layerPicture( ln, color, c0, c1 ), ) ) for ( c0, c1 ) in zip( cps, cps[ 1: ] ) ]
 
-                        d_point_func_b( g1.cf )
+        return draws + self.polylineDraws( skc, layer.extrusionRuns( cps[ -1 ], ed ) )
 
-                        if len( d_point ) == 0:
-                            d_point.append( g1.cf )
-                            d_point.append( Point( g1.cx, g1.cy ) )
+    def polylineDraws( self, skc, runs, color = None, order = None ):
+        # DrawFunc of extrusionRuns ( bed coordinates ), color : None for the feedrate colors, order : see runPaths
+        return [ DrawFunc( skc.drawPath, ( path, paint ) ) for ( path, paint ) in self.runPaths( runs, color, order ) ]
 
-                        d_point.append( Point( x, y ) )
-                        continue
+    def runPaths( self, runs, color = None, order = None ):
+        # [ ( skia.Path, skia.Paint ) ] of extrusionRuns, one path per color ( a draw call each instead of one per run ),
+        # color : None for the feedrate colors. The runs of a layerChunks range at most, the later colors are drawn over
+        # the earlier ones whatever the order of the runs.
+        # order : feedrates of all the runs of the range if runs are some of them ( the colors keep the order of the whole )
 
-                d_point_func_b()
+        by_color = {}
 
-            d_point_func_b()
+        if order is not None and color is None:
+            for fr in dict.fromkeys( order.tolist() ):
+                by_color.setdefault( self.feedrateColor( fr ), [] )
 
-        # prepair current move
+        for ( fr, p ) in runs:
+            by_color.setdefault( self.feedrateColor( fr ) if color is None else color, [] ).append( p )
+
+        return [ ( polylinePath( ps ), self.paint_e( Color = c ) ) for ( c, ps ) in by_color.items() if len( ps ) > 0 ]
 
-        d_point     = []    # [0] : feedrate, [1:] Point
+    def moveDraws( self, skc, coordXY, layer, idx, im1 ):
+        # DrawFunc of the moves idx of the layer other than the extrusion polylines ( travel, z ),
+        # and of the current move im1 ( canvas coordinates )
+        # The moves other than im1 are taken from the columns and transformed at once, a drawPoints per paint.
 
+        cr      = self.mark_r
+        pa_e    = self.paint_e
         layer_h = self.gcode_layer_height( self.gcode_ln() )
-        layer   = self.gcode_layer( self.gcode_ln() )
+        im2     = len( layer ) - 1
 
-        def d_point_func( feedrate = None ):
-            if len( d_point ) > 0:
-                if feedrate is None or feedrate != d_point[ 0 ]:
-                    p = pa_e( Color = self.feedrateColor( d_point[ 0 ] ) )
-                    d_layer_0.append( DrawFunc( skc.drawPoints, ( skia.Canvas.PointMode.kPolygon_PointMode, tuple( d_point[1:] ), p ) ) )
-                    d_point.clear()
+        draws = []
 
-        im2 = len( layer ) - 1
-        im1 = min( self.gcode_li(), im2 )
+        idx = np.asarray( idx, dtype = np.int64 )
+        cur = idx[ idx == im1 ].tolist()
+        idx = idx[ idx != im1 ] + layer.st
+
+        tp = layer.toolpath
+
+        ( cx, cy, z, e ) = ( tp.cx[ idx ], tp.cy[ idx ], tp.Z[ idx ], tp.E[ idx ] )
+
+        x = np.where( np.isnan( tp.X[ idx ] ), cx, tp.X[ idx ] )
+        y = np.where( np.isnan( tp.Y[ idx ] ), cy, tp.Y[ idx ] )
 
-        for i in range( im1 + 1 ):
+        p0 = coordXY( np.column_stack( ( cx, cy ) ) )
+        p1 = coordXY( np.column_stack( ( x, y ) ) )
+
+        ok = np.isfinite( p0 ).all( axis = 1 ) & np.isfinite( p1 ).all( axis = 1 )      # no position before the first move
+        zm = ~np.isnan( z )
+
+        def lines( sel, paint ):
+            if sel.any():
+                pts = np.empty( ( sel.sum() * 2, 2 ) )
+                pts[ 0 :: 2 ] = p0[ sel ]
+                pts[ 1 :: 2 ] = p1[ sel ]
+                draws.append( DrawFunc( skc.drawPoints, ( skia.Canvas.PointMode.kLines_PointMode, list( map( Point._make, pts.tolist() ) ), paint ) ) )
+
+        def discs( sel, paint ):
+            # filled circles of radius cr as round points
+            if sel.any():
+                p = skia.Paint( paint )
+                p.setStyle( skia.Paint.kStroke_Style )
+                p.setStrokeWidth( cr * 2 )
+                p.setStrokeCap( skia.Paint.kRound_Cap )
+                draws.append( DrawFunc( skc.drawPoints, ( skia.Canvas.PointMode.kPoints_PointMode, list( map( Point._make, p1[ sel ].tolist() ) ), p ) ) )
+
+        lines( ok & zm & ( ( x != cx ) | ( y != cy ) ), pa_e() )
+        lines( ok & ~zm & ~( e > 0 ), self.paint_m )
+        discs( ok & zm & ~( z > layer_h ), self.paint_zd )     # a z up is after the z down at the same place
+        discs( ok & zm & ( z > layer_h ), self.paint_zu )
+
+        for i in cur:
             g1 = layer[ i ]
 
             if g1.Z is not None:
-                d_point_func()
-
                 x = g1.X if g1.X is not None else g1.cx
                 y = g1.Y if g1.Y is not None else g1.cy
 
                 if x != g1.cx or y != g1.cy:
-                    p = pa_e() if g1.E is not None and g1.E > 0 else pa_e()
-                    d_layer_1.append( DrawFunc( skc.drawLine, ( coordXY( g1.cx, g1.cy ), coordXY( x, y ), p ) ) )
+                    draws.append( DrawFunc( skc.drawLine, ( coordXY( g1.cx, g1.cy ), coordXY( x, y ), pa_e() ) ) )
 
-                p = pa_zu if g1.Z > layer_h else pa_zd
-                d_layer_1.append( DrawFunc( skc.drawCircle, ( coordXY( x, y ), cr, p ) ) )
+                p = self.paint_zu if g1.Z > layer_h else self.paint_zd
+                draws.append( DrawFunc( skc.drawCircle, ( coordXY( x, y ), cr, p ) ) )
 
-                if i == im1:
-                    p = pa_zu2 if g1.Z > layer_h else pa_zd2
-                    d_layer_1.append( DrawFunc( skc.drawCircle, ( coordXY( x, y ), cr + 2, p ) ) )
+                p = self.paint_zu2 if g1.Z > layer_h else self.paint_zd2
+                draws.append( DrawFunc( skc.drawCircle, ( coordXY( x, y ), cr + 2, p ) ) )
 
             else:
                 x = g1.X if g1.X is not None else g1.cx
@@ -2112,31 +4553,183 @@ class Viewer:
 
                 if g1.E is not None and g1.E > 0:
 
-                    d_point_func( g1.cf )
+                    if i != im2:
+                        draws.append( DrawFunc( skc.drawLine, ( coordXY( g1.cx, g1.cy ), coordXY( x, y ), self.paint_e2 ) ) )
 
-                    if len( d_point ) == 0:
-                        d_point.append( g1.cf )
-                        d_point.append( Point( g1.cx, g1.cy ) )
+                else:
+                    draws.append( DrawFunc( skc.drawLine, ( coordXY( g1.cx, g1.cy ), coordXY( x, y ), self.paint_m2 ) ) )
 
-                    d_point.append( Point( x, y ) )
+                draws.append( DrawFunc( skc.drawCircle, ( coordXY( x, y ), cr, self.paint_e3 ) ) )
+                draws.append( DrawFunc( skc.drawCircle, ( coordXY( x, y ), cr + 2, self.paint_e4 ) ) )
 
-                    if i == im1:
-                        d_point_func()
+        return draws
 
-                        if i != im2:
-                            d_layer_1.append( DrawFunc( skc.drawLine, ( coordXY( g1.cx, g1.cy ), coordXY( x, y ), pa_e2 ) ) )
+    def requestImage( self ):
+        # updateImage at the next frame ( at most one per frame_ms ) : the requests until then are served by
+        # the same frame, the states between them are never drawn
 
-                else:
-                    d_point_func()
+        self.frame_requests += 1
+
+        if self.frame_timer_id is None:
+            ms = ( self.frame_last - time.perf_counter() ) * 1000 + self.frame_ms
+            self.frame_timer_id = self.root.after( max( int( ms ), 0 ), self.renderFrame )
+
+    def renderFrame( self ):
+        # render the requested frame on the RenderThread ( in place while the experiment is active )
+
+        self.frame_timer_id = None
+        self.frame_served  += self.frame_requests
+        self.frame_requests = 0
+
+        if self.experiment != None:
+            requests = self.frame_served
+
+            t = time.perf_counter()
+            self.updateImage()
+            self.frame_last = time.perf_counter()
+
+            self.frame_stats.add( ( self.frame_last - t ) * 1000, requests )
+            return
+
+        if self.render_thread is None:
+            self.render_thread = RenderThread()
+
+        self.play_frame = None              # the surface is replaced
+
+        self.render_thread.post( self.renderSnapshot() )
+        self.frame_last = time.perf_counter()
+
+        if self.frame_poll_id is None:
+            self.frame_poll_id = self.root.after( self.frame_poll_ms, self.pollFrame )
+
+    def pollFrame( self ):
+        # show the frame finished by the RenderThread, the surface shown so far is its next back buffer
+
+        self.frame_poll_id = None
+
+        done = self.render_thread.take()
+
+        if done is not None:
+            ( surface, ms ) = done
+
+            if self.surface is not None:
+                self.render_thread.giveBack( self.surface )
+
+            self.surface = surface
+            self.setupCanvasImage()
+
+            self.frame_stats.add( ms, self.frame_served )
+            self.frame_served = 0
+
+        if self.render_thread.busy():
+            self.frame_poll_id = self.root.after( self.frame_poll_ms, self.pollFrame )
+
+    def renderSnapshot( self ):
+        # the view state of a frame for the RenderThread : a shallow copy of the viewer with the values of the Tk
+        # variables read now ( the gcode, the caches and render_lock are shared )
+
+        snapshot = copy.copy( self )
+
+        # skia keeps the GIL during a draw call : draw the layers in pieces of LAYER_CHECKPOINT_MOVES,
+        # the Tk thread runs between them
+
+        snapshot.layer_whole_picture = False
+
+        for name in ( 'scale_v_value', 'scale_h_value', 'cbo_ly', 'chk_lg_value', 'chk_dt_value', 'chk_th_value', 'chk_mv_value', 'bar_h', 'bar_v' ):
+            setattr( snapshot, name, FrozenVar( getattr( self, name ).get() ) )
+
+        return snapshot
+
+    def cancelFrame( self ):
+        # the requested frame is drawn by the caller
+
+        if self.frame_timer_id is not None:
+            self.root.after_cancel( self.frame_timer_id )
+            self.frame_timer_id = None
+
+        if self.render_thread is not None:
+            self.render_thread.cancel()
+
+        self.frame_requests = 0
+
+    def updateImage( self, canvas = None ):
+        canv_wh = self.canvAreaSize()
+
+        if canvas == None:
+            if self.surface is None or self.surface.shape != ( canv_wh.Y, canv_wh.X, 4 ):
+                self.surface = np.zeros( ( canv_wh.Y, canv_wh.X, 4 ), dtype = np.uint8 )   # Remake surface
+
+            self.play_frame = None          # the surface is redrawn
+            self.cancelFrame()
+
+        if canvas == None:
+            skc = makeSurface( self.surface ).getCanvas()
+        else:
+            skc = canvas
+
+        with self.render_lock:
+            self.renderImage( skc, self.surface if canvas == None else None )
+
+        del skc
+
+        if canvas == None:
+            self.setupCanvasImage()
+
+    def renderCheck( self ):
+        # raise RenderCancelled if the frame this viewer ( a snapshot of RenderThread ) renders is not wanted any more
+        if self.render_cancel is not None and self.render_cancel():
+            raise RenderCancelled()
+
+    def renderImage( self, skc, surface = None ):
+        # draw the view on skc, surface : the RGBA array of skc ( None : not a raster surface, e.g. SVG )
+        # No Tk call here, RenderThread runs it on a snapshot of the viewer ( see renderSnapshot ).
+
+        canv_wh = self.canvAreaSize()
+
+        # matrix setup
+        mtx = self.viewMatrix()
+
+        def coordXY( x, y = None ):
+            if y is not None:
+                return mtx @ Point( x, y )
+
+            return mtx @ x
+
+        # clear and bed grid draw
+
+        if surface is not None:
+            np.copyto( surface, self.bedImage( coordXY ) )
+
+        else:
+            skc.clear( 0x00000000 )
+            self.drawBed( skc, coordXY )
+
+        # move draw prepair
+
+        d_layer_0   = []    # Use canvas affine transformation
+        d_layer_1   = []    # Use custom affine transformation
+
+        # prepair current or prev layer ( cached picture of the whole layer )
 
-                    p = pa_m2 if i == im1 else pa_m
-                    d_layer_1.append( DrawFunc( skc.drawLine, ( coordXY( g1.cx, g1.cy ), coordXY( x, y ), p ) ) )
+        d_layer_b_opt = self.cbo_ly.get()
+        d_layer_b_ln = 0 if d_layer_b_opt == "Current" else -1 if d_layer_b_opt == "Prev" else None
+
+        if d_layer_b_ln is not None:
+            d_layer_0 += self.extrusionDraws( skc, self.gcode_ln() + d_layer_b_ln, len( self.gcode_layer( self.gcode_ln() + d_layer_b_ln ) ), self.layer_b_color )
+
+        # prepair current move
+
+        layer   = self.gcode_layer( self.gcode_ln() )
 
+        im2 = len( layer ) - 1
+        im1 = min( self.gcode_li(), im2 )
 
-                if i == im1:
+        d_layer_0 += self.extrusionDraws( skc, self.gcode_ln(), im1 + 1 )
 
-                    d_layer_1.append( DrawFunc( skc.drawCircle, ( coordXY( x, y ), cr, pa_e3 ) ) )
-                    d_layer_1.append( DrawFunc( skc.drawCircle, ( coordXY( x, y ), cr + 2, pa_e4 ) ) )
+        # the other moves ( travel, z ) and the current position
+
+        if len( layer ) > 0:
+            d_layer_1 += self.moveDraws( skc, coordXY, layer, layer.otherMoves( 0, im1, self.visibleMoves( self.gcode_ln() ) ) + [ im1 ], im1 )
 
         # move draw ( d_layer_0 )
 
@@ -2145,10 +4738,13 @@ class Viewer:
         skc.setMatrix( skia.Matrix( mtx ) )
 
         for x in d_layer_0:
+            self.renderCheck()
             x[0]( *x[1], **x[2] )
 
         skc.restore()
 
+        self.renderCheck()
+
         # move draw ( d_layer_1 )
 
         if self.chk_mv_value.get() == 1:
@@ -2170,194 +4766,434 @@ class Viewer:
 
             skc.restore()
 
+        self.drawOverlays( skc, canv_wh, cache = surface is not None )
+
+        skc.flush()
+
+    def playFrameKey( self ):
+        # what a PlayFrame depends on besides the layer and the index
+        return (
+                self.canvAreaSize(), self.viewMatrix(), self.bed_w, self.bed_h
+            ,   self.cbo_ly.get(), self.chk_mv_value.get(), self.chk_lg_value.get(), self.chk_dt_value.get(), self.chk_th_value.get()
+            ,   self.gcode, self.gcode.layer_data, self.gcode_fr_map, self.gcode_thumbnail
+            )
+
+    def updateImagePlay( self ):
+        # updateImage for the playback : only the moves since the last frame are drawn ( see PlayFrame ), and only
+        # the dirty rects ( new moves, current move marks of the last and this frame, details ) are converted for Tk.
+        # Anything else than a step forward in the same layer ( layer change, view change, ... ) starts a new PlayFrame.
+
+        if self.experiment != None:
+            self.updateImage()
+            return
+
+        self.cancelFrame()
+
+        with self.render_lock:
+            self.updateImagePlayFrame()
+
+    def updateImagePlayFrame( self ):
+
+        canv_wh = self.canvAreaSize()
+        shape   = ( canv_wh.Y, canv_wh.X, 4 )
+
+        ln    = self.gcode_ln()
+        layer = self.gcode_layer( ln )
+        im1   = min( self.gcode_li(), len( layer ) - 1 )
+
+        mtx = self.viewMatrix()
+
+        def coordXY( x, y = None ):
+            if y is not None:
+                return mtx @ Point( x, y )
+
+            return mtx @ x
+
+        key = self.playFrameKey()
+        pf  = self.play_frame
+
+        if self.surface is None or self.surface.shape != shape:
+            self.surface = np.zeros( shape, dtype = np.uint8 )
+            pf = None
+
+        mv = self.chk_mv_value.get() == 1
+
+        if pf is None or pf.key != key or pf.ln != ln or im1 < pf.li:
+
+            pf = PlayFrame( key, ln, shape )
+
+            np.copyto( pf.moves, self.bedImage( coordXY ) )
+
+            skc = makeSurface( pf.moves ).getCanvas()
+
+            d_layer_b_opt = self.cbo_ly.get()
+            d_layer_b_ln = 0 if d_layer_b_opt == "Current" else -1 if d_layer_b_opt == "Prev" else None
+
+            skc.save()
+            skc.setMatrix( skia.Matrix( mtx ) )
+
+            if d_layer_b_ln is not None and len( self.gcode_layer( ln + d_layer_b_ln ) ) > 0:
+                skc.drawPicture( self.layerPicture( ln + d_layer_b_ln, self.layer_b_color ) )
+
+            for x in self.extrusionDraws( skc, ln, im1 + 1 ):
+                x[0]( *x[1], **x[2] )
+
+            skc.restore()
+
+            if mv and im1 > 0:
+                skc = makeSurface( pf.travel ).getCanvas()
+
+                for x in self.moveDraws( skc, coordXY, layer, layer.otherMoves( 0, im1, self.visibleMoves( ln ) ), im1 ):
+                    x[0]( *x[1], **x[2] )
+
+            dirty = [ ( 0, 0, canv_wh.X, canv_wh.Y ) ]
+
+        else:
+            dirty = [ pf.marks, pf.details ]
+
+            runs = layer.extrusionRuns( pf.li + 1, im1 + 1 )
+
+            if len( runs ) > 0:
+                skc = makeSurface( pf.moves ).getCanvas()
+                skc.setMatrix( skia.Matrix( mtx ) )
+
+                for x in self.polylineDraws( skc, runs ):
+                    x[0]( *x[1], **x[2] )
+
+                pts = np.concatenate( [ p for ( _, p ) in runs ] )
+                p0 = coordXY( *pts.min( axis = 0 ) )
+                p1 = coordXY( *pts.max( axis = 0 ) )
+                w  = self.paint_e().getStrokeWidth() * self.zoom / 2 + 2
+
+                dirty.append( (
+                        int( math.floor( min( p0.X, p1.X ) - w ) ), int( math.floor( min( p0.Y, p1.Y ) - w ) )
+                    ,   int( math.ceil( max( p0.X, p1.X ) + w ) ),  int( math.ceil( max( p0.Y, p1.Y ) + w ) )
+                    ) )
+
+            if mv:
+                skc = makeSurface( pf.travel ).getCanvas()
+                draws = self.moveDraws( skc, coordXY, layer, layer.otherMoves( pf.li, im1 ), im1 )
+
+                for x in draws:
+                    x[0]( *x[1], **x[2] )
+
+                dirty.append( drawFuncRect( draws ) )
+
+        pf.li = im1
+        self.play_frame = pf
+
+        # compose the dirty rects : moves, travel, current move marks and overlays
+
+        skc = makeSurface( self.surface ).getCanvas()
+
+        marks = self.moveDraws( skc, coordXY, layer, [ im1 ], im1 ) if mv and len( layer ) > 0 else []
+
+        pf.marks = drawFuncRect( marks )
+
+        dirty = mergeRects( dirty + [ pf.marks ], canv_wh.X, canv_wh.Y )
+
+        clip = skia.Region()
+
+        for ( x0, y0, x1, y1 ) in dirty:
+            self.surface[ y0 : y1, x0 : x1 ] = pf.moves[ y0 : y1, x0 : x1 ]
+            clip.op( skia.IRect.MakeLTRB( x0, y0, x1, y1 ), skia.Region.kUnion_Op )
+
+        skc.save()
+        skc.clipRegion( clip )
+
+        if mv:
+            skc.drawImage( skia.Image.fromarray( pf.travel, colorType = skia.ColorType.kRGBA_8888_ColorType, alphaType = skia.AlphaType.kUnpremul_AlphaType, copy = False ), 0, 0 )
+
+        skc.restore()
+
+        for x in marks:
+            x[0]( *x[1], **x[2] )
+
+        pf.details = self.drawOverlays( skc, canv_wh, clip )
+
+        skc.flush()
+        del skc
+
+        self.setupCanvasImage( mergeRects( dirty + [ pf.details ], canv_wh.X, canv_wh.Y ) )
+
+    def drawOverlays( self, skc, canv_wh, clip = None, cache = True ):
+        # legend, details and thumbnail ( the legend and the thumbnail only in the skia.Region clip if given )
+        # Each is a cached image ( see overlayImage ) unless cache is False ( e.g. SVG ).
+        # return the rect of the details ( x0, y0, x1, y1 ) or None
+
+        def drawOverlay( name, key, draw ):
+            # draw at ( 0, 0 ) of the current matrix, return ( w, h )
+
+            if not cache:
+                return draw( skc )
+
+            image = self.overlayImage( name, key, draw )
+            skc.drawImage( image, 0, 0 )
+
+            return ( image.width(), image.height() )
+
+        if clip is not None:
+            skc.save()
+            skc.clipRegion( clip )
+
         # legend
 
-        l0 = skia.Paint( Color=self.bed_color, AntiAlias=True )
-        l1 = skia.Paint( Color=self.legend_border_color, AntiAlias=True, StrokeWidth=2, Style=skia.Paint.kStroke_Style )
+        if self.chk_lg_value.get() != 0:
+
+            skc.save()
+
+            skc.translate( self.canv_padxy, self.canv_padxy )
+
+            drawOverlay( 'legend', ( tuple( self.gcode_fr_map.items() ), self.chk_mv_value.get() ), self.drawLegend )
+
+            skc.restore()
+
+        if clip is not None:
+            skc.restore()
+
+        # details
+
+        details_rect = None
+
+        if self.chk_dt_value.get() != 0:
+
+            g1 = self.gcode_lnli( self.gcode_ln(), self.gcode_li() )
+
+            text = (
+                ( 'Layer',      '%d /%d'            % ( self.gcode_ln(), self.gcode_ln_max() ) )
+            ,   ( 'Height',     '%.2f /%.2f (mm)'   % ( self.gcode_layer_height( self.gcode_ln() ), self.gcode_layer_height( -1 ) ) )
+            ,   ( 'Index',      '%d /%d'            % ( self.gcode_li() + 1, self.gcode_li_max() + 1 ) )
+            ,   ( 'Feedrate',   '%.1f (mm/s)'       % ( g1.cf / 60, )               if g1 is not None else '' )
+            ,   ( 'Time',       '%s'        % ( format_time( g1.tm ), ) if g1 is not None else '' )
+            ,   ( 'LayerTime',  '%s'        % ( format_time( self.gcode_layer_time( self.gcode_ln() ) ), ) )
+            ,   ( 'LineNo',     '%d'        % ( g1.no + 1, )                if g1 is not None else '' )
+            )
+
+            if self.play_timer_id is not None:
+                text += ( ( 'Play', '%.0f fps  x%.1f' % ( self.play_pace.fps(), self.play_pace.speed() ) ), )
+
+            ( x0, y0 ) = ( self.canv_padxy, canv_wh.Y - self.detailsHeight( text ) - self.canv_padxy )
+
+            skc.save()
+
+            skc.translate( x0, y0 )
+
+            ( w, h ) = drawOverlay( 'details', text, functools.partial( self.drawDetails, text = text ) )
+
+            skc.restore()
+
+            details_rect = ( int( x0 ), int( y0 ), int( math.ceil( x0 + w ) ), int( math.ceil( y0 + h ) ) )
+
+        # thumbnail
+
+        if clip is not None:
+            skc.save()
+            skc.clipRegion( clip )
 
-        l2 = skia.Paint( Color=0xff33ff33, AntiAlias=True )
-        lf2     = skia.Font( None, 13.5 )
-        lf2b    = skia.Font( None, 18 )
+        if self.chk_th_value.get() != 0:
 
-        l3 = functools.partial( skia.Paint, Color=0xff333333, AntiAlias=True )
+            ( w, _ ) = self.thumbnailSize()
 
-        if self.chk_lg_value.get() != 0:
+            skc.save()
+
+            skc.translate( canv_wh.X - w - self.canv_padxy, self.canv_padxy  )
 
-            # prepair
-            hf_e = 1 if len( self.gcode_fr_map ) > 0 else 0
-            mv_e = 3 if self.chk_mv_value.get() == 1 else 0
+            drawOverlay( 'thumbnail', ( self.gcode_thumbnail, ), self.drawThumbnail )
 
-            h  = len( self.gcode_fr_map ) + hf_e + mv_e
-            dh = lf2.getSize()
-            t_offset = 1.3
+            skc.restore()
 
-            ww = 15
+        if clip is not None:
+            skc.restore()
 
-            fr_fmt0 = "%.1f : "
-            fr_fmt1 = "%d"
+        return details_rect
 
-            wmax0 = 0
-            wmax1 = 0
+    def drawLegend( self, skc ):
+        # feedrate colors and move marks, return ( w, h )
 
-            frs = list( self.gcode_fr_map.keys() )
+        l0 = skia.Paint( Color=self.bed_color, AntiAlias=True )
+        l1 = skia.Paint( Color=self.legend_border_color, AntiAlias=True, StrokeWidth=2, Style=skia.Paint.kStroke_Style )
 
-            if len( self.gcode_fr_map ) != 0:
-                wmax0 = max( map( lambda fr : lf2.measureText( fr_fmt0 % ( fr / 60, ) ), frs) )
-                wmax1 = max( map( lambda fr : lf2.measureText( fr_fmt1 % ( fr, ) ), frs  ) )
+        l2 = skia.Paint( Color=0xff33ff33, AntiAlias=True )
+        lf2 = self.overlay_font
 
-            wmax0 = max( wmax0, lf2.measureText( "mm/s : " ) )
-            wmax1 = max( wmax1, lf2.measureText( "mm/m" ) )
+        l3 = functools.partial( skia.Paint, Color=0xff333333, AntiAlias=True )
 
-            cx1 = 10
-            cx2 = 30
+        # prepair
+        hf_e = 1 if len( self.gcode_fr_map ) > 0 else 0
+        mv_e = 3 if self.chk_mv_value.get() == 1 else 0
 
-            wmax2 = cx1 + cx2 + max( wmax0 + wmax1, lf2.measureText( "z-down" ) )
+        h  = len( self.gcode_fr_map ) + hf_e + mv_e
+        dh = lf2.getSize()
+        t_offset = 1.3
 
-            # draw
+        ww = 15
 
-            skc.save()
+        fr_fmt0 = "%.1f : "
+        fr_fmt1 = "%d"
 
-            skc.translate( self.canv_padxy, self.canv_padxy )
+        wmax0 = 0
+        wmax1 = 0
 
-            legend_rect = skia.Rect.MakeWH( wmax2, ( h + 1 ) * dh  )
+        frs = list( self.gcode_fr_map.keys() )
 
-            skc.clipRect( legend_rect )
-            skc.drawRoundRect( legend_rect, 10, 10, l0 )
-            skc.drawRoundRect( legend_rect.makeInset( 2, 2 ), 10, 10, l1 )
+        if len( self.gcode_fr_map ) != 0:
+            wmax0 = max( map( lambda fr : lf2.measureText( fr_fmt0 % ( fr / 60, ) ), frs) )
+            wmax1 = max( map( lambda fr : lf2.measureText( fr_fmt1 % ( fr, ) ), frs  ) )
 
-            i = 0
+        wmax0 = max( wmax0, lf2.measureText( "mm/s : " ) )
+        wmax1 = max( wmax1, lf2.measureText( "mm/m" ) )
 
-            if hf_e > 0:
-                txt = "mm/s : "
-                p0 = Point( cx2 + ( wmax0 ) - lf2.measureText( txt ) , ( i + t_offset  ) * dh )
-                skc.drawString( txt, p0.X, p0.Y, lf2, l2 )
+        cx1 = 10
+        cx2 = 30
 
-                txt = "mm/m"
-                p0 = Point( cx2 + ( wmax0 + wmax1 ) - lf2.measureText( txt ) , ( i + t_offset  ) * dh )
-                skc.drawString( txt, p0.X, p0.Y, lf2, l2 )
-                i += 1
+        wmax2 = cx1 + cx2 + max( wmax0 + wmax1, lf2.measureText( "z-down" ) )
 
-            for fr, clr in self.gcode_fr_map.items():
-                txt = fr_fmt0 % ( fr / 60, )
-                p0 = Point( cx2 + ( wmax0 ) - lf2.measureText( txt ) , ( i + t_offset  ) * dh )
-                skc.drawString( txt, p0.X, p0.Y, lf2, l2 )
+        # draw
 
-                txt = fr_fmt1 % ( fr, )
-                p0 = Point( cx2 + ( wmax0 + wmax1 ) - lf2.measureText( txt ) , ( i + t_offset  ) * dh )
-                skc.drawString( txt, p0.X, p0.Y, lf2, l2 )
+        legend_rect = skia.Rect.MakeWH( wmax2, ( h + 1 ) * dh  )
 
-                r = skia.Rect.MakeXYWH( cx1, ( i + t_offset - 0.5 ) * dh , ww, dh * 0.3 )
-                skc.drawRoundRect( r, 5, 5, l3( Color=clr ) )
-                i += 1
+        skc.save()
 
-            if mv_e > 0:
-                p0 = Point( cx2, ( i + t_offset  ) * dh )
-                skc.drawString( "move", p0.X, p0.Y, lf2, l2 )
-                p0 = Point( cx1, ( i + t_offset - 0.3 ) * dh )
-                skc.drawLine( p0.X, p0.Y, p0.X + ww, p0.Y, pa_m )
-                i += 1
+        skc.clipRect( legend_rect )
+        skc.drawRoundRect( legend_rect, 10, 10, l0 )
+        skc.drawRoundRect( legend_rect.makeInset( 2, 2 ), 10, 10, l1 )
+
+        i = 0
+
+        if hf_e > 0:
+            txt = "mm/s : "
+            p0 = Point( cx2 + ( wmax0 ) - lf2.measureText( txt ) , ( i + t_offset  ) * dh )
+            skc.drawString( txt, p0.X, p0.Y, lf2, l2 )
+
+            txt = "mm/m"
+            p0 = Point( cx2 + ( wmax0 + wmax1 ) - lf2.measureText( txt ) , ( i + t_offset  ) * dh )
+            skc.drawString( txt, p0.X, p0.Y, lf2, l2 )
+            i += 1
+
+        for fr, clr in self.gcode_fr_map.items():
+            txt = fr_fmt0 % ( fr / 60, )
+            p0 = Point( cx2 + ( wmax0 ) - lf2.measureText( txt ) , ( i + t_offset  ) * dh )
+            skc.drawString( txt, p0.X, p0.Y, lf2, l2 )
+
+            txt = fr_fmt1 % ( fr, )
+            p0 = Point( cx2 + ( wmax0 + wmax1 ) - lf2.measureText( txt ) , ( i + t_offset  ) * dh )
+            skc.drawString( txt, p0.X, p0.Y, lf2, l2 )
+
+            r = skia.Rect.MakeXYWH( cx1, ( i + t_offset - 0.5 ) * dh , ww, dh * 0.3 )
+            skc.drawRoundRect( r, 5, 5, l3( Color=clr ) )
+            i += 1
+
+        if mv_e > 0:
+            p0 = Point( cx2, ( i + t_offset  ) * dh )
+            skc.drawString( "move", p0.X, p0.Y, lf2, l2 )
+            p0 = Point( cx1, ( i + t_offset - 0.3 ) * dh )
+            skc.drawLine( p0.X, p0.Y, p0.X + ww, p0.Y, self.paint_m )
+            i += 1
+
+            p0 = Point( cx2, ( i + t_offset  ) * dh )
+            skc.drawString( "z-up", p0.X, p0.Y, lf2, l2 )
+            p0 = Point( cx1, ( i + t_offset - 0.3 ) * dh )
+            skc.drawCircle( p0.X + ( ww / 2 ), p0.Y, self.mark_r, self.paint_zu )
+            i += 1
+
+            p0 = Point( cx2, ( i + t_offset  ) * dh )
+            skc.drawString( "z-down", p0.X, p0.Y, lf2, l2 )
+            p0 = Point( cx1, ( i + t_offset - 0.3 ) * dh )
+            skc.drawCircle( p0.X + ( ww / 2 ), p0.Y, self.mark_r, self.paint_zd )
+            i += 1
 
-                p0 = Point( cx2, ( i + t_offset  ) * dh )
-                skc.drawString( "z-up", p0.X, p0.Y, lf2, l2 )
-                p0 = Point( cx1, ( i + t_offset - 0.3 ) * dh )
-                skc.drawCircle( p0.X + ( ww / 2 ), p0.Y, cr, pa_zu )
-                i += 1
+        skc.restore()
 
-                p0 = Point( cx2, ( i + t_offset  ) * dh )
-                skc.drawString( "z-down", p0.X, p0.Y, lf2, l2 )
-                p0 = Point( cx1, ( i + t_offset - 0.3 ) * dh )
-                skc.drawCircle( p0.X + ( ww / 2 ), p0.Y, cr, pa_zd )
-                i += 1
+        return ( legend_rect.width(), legend_rect.height() )
 
-            skc.restore()
+    details_ipad = 8
 
-        if self.chk_dt_value.get() != 0:
+    def detailsHeight( self, text ):
+        return self.overlay_font_b.getSize() * len( text ) + self.details_ipad * 2
 
-            g1 = self.gcode_lnli( self.gcode_ln(), self.gcode_li() )
+    def drawDetails( self, skc, text ):
+        # [ ( title, value ) ], return ( w, h )
 
-            text = [
-                ( 'Layer',      '%d /%d'            % ( self.gcode_ln(), self.gcode_ln_max() ) )
-            ,   ( 'Height',     '%.2f /%.2f (mm)'   % ( self.gcode_layer_height( self.gcode_ln() ), self.gcode_layer_height( -1 ) ) )
-            ,   ( 'Index',      '%d /%d'            % ( self.gcode_li() + 1, self.gcode_li_max() + 1 ) )
-            ,   ( 'Feedrate',   '%.1f (mm/s)'       % ( g1.cf / 60, )               if g1 is not None else '' )
-            ,   ( 'Time',       '%s'        % ( format_time( g1.tm * self.gcode.time_diff_rate ), ) if g1 is not None else '' )
-            ,   ( 'LineNo',     '%d'        % ( g1.no + 1, )                if g1 is not None else '' )
-            ]
+        l0 = skia.Paint( Color=self.bed_color, AntiAlias=True )
+        l1 = skia.Paint( Color=self.legend_border_color, AntiAlias=True, StrokeWidth=2, Style=skia.Paint.kStroke_Style )
+        l2 = skia.Paint( Color=0xff33ff33, AntiAlias=True )
 
+        lf2  = self.overlay_font
+        lf2b = self.overlay_font_b
 
-            ipad  = 8
-            w2 = lf2.measureText( ' : ' )
+        ipad  = self.details_ipad
+        w2 = lf2.measureText( ' : ' )
 
-            w = max( map( lambda x : lf2.measureText( x[0] ) + w2 + lf2b.measureText( x[1] ), text ) )
-            dh = lf2b.getSize()
-            h = dh * len( text )
-            t_offset = 1.4
+        w = max( map( lambda x : lf2.measureText( x[0] ) + w2 + lf2b.measureText( x[1] ), text ) )
+        dh = lf2b.getSize()
+        t_offset = 1.4
 
-            cx1 = ipad
-            cx2 = cx1 + max( map( lambda x : lf2.measureText( x[0] ), text ) )
-            cx3 = cx2 + w2
+        cx1 = ipad
+        cx2 = cx1 + max( map( lambda x : lf2.measureText( x[0] ), text ) )
+        cx3 = cx2 + w2
 
-            skc.save()
+        rect = skia.Rect.MakeWH( w + ipad * 4, self.detailsHeight( text ) )
 
-            skc.translate( self.canv_padxy, canv_wh.Y - h - self.canv_padxy - ipad * 2  )
+        skc.save()
+        skc.clipRect( rect )
+        skc.drawRoundRect( rect, 10, 10, l0 )
+        skc.drawRoundRect( rect.makeInset( 2, 2 ), 10, 10, l1 )
 
-            rect = skia.Rect.MakeWH( w + ipad * 4, h + ipad * 2 )
+        for ( i, ( t1, t2 ) ) in enumerate( text ):
+            p0 = Point( cx1, ( i + t_offset  ) * dh )
+            skc.drawString( t1, p0.X, p0.Y, lf2, l2 )
 
-            skc.save()
-            skc.clipRect( rect )
-            skc.drawRoundRect( rect, 10, 10, l0 )
-            skc.drawRoundRect( rect.makeInset( 2, 2 ), 10, 10, l1 )
+            p0 = Point( cx2, ( i + t_offset  ) * dh )
+            skc.drawString( ' : ', p0.X, p0.Y, lf2, l2 )
 
-            for ( i, ( t1, t2 ) ) in enumerate( text ):
-                p0 = Point( cx1, ( i + t_offset  ) * dh )
-                skc.drawString( t1, p0.X, p0.Y, lf2, l2 )
+            p0 = Point( cx3, ( i + t_offset  ) * dh )
+            skc.drawString( t2, p0.X, p0.Y, lf2b, l2 )
 
-                p0 = Point( cx2, ( i + t_offset  ) * dh )
-                skc.drawString( ' : ', p0.X, p0.Y, lf2, l2 )
+        skc.restore()
 
-                p0 = Point( cx3, ( i + t_offset  ) * dh )
-                skc.drawString( t2, p0.X, p0.Y, lf2b, l2 )
+        return ( rect.width(), rect.height() )
 
-            skc.restore()
+    thumbnail_ipad = 6
 
-            skc.restore()
+    def thumbnailSize( self ):
+        ( w, h ) = ( 50, 50 ) if self.gcode_thumbnail is None else ( self.gcode_thumbnail.width(), self.gcode_thumbnail.height() )
 
-        if self.chk_th_value.get() != 0:
+        return ( w + self.thumbnail_ipad * 2, h + self.thumbnail_ipad * 2 )
 
-            skc.save()
+    def drawThumbnail( self, skc ):
+        # the thumbnail image of the file in a frame, return ( w, h )
 
-            w = 50
-            h = 50
+        l0 = skia.Paint( Color=self.bed_color, AntiAlias=True )
+        l1 = skia.Paint( Color=self.legend_border_color, AntiAlias=True, StrokeWidth=2, Style=skia.Paint.kStroke_Style )
 
-            ipad = 6
+        ( w, h ) = self.thumbnailSize()
 
-            if self.gcode_thumbnail != None:
-                w = self.gcode_thumbnail.width()
-                h = self.gcode_thumbnail.height()
+        rect = skia.Rect.MakeWH( w, h )
 
-            skc.translate( canv_wh.X - w - self.canv_padxy - ipad * 2, self.canv_padxy  )
+        skc.save()
+        skc.clipRect( rect )
+        skc.drawRoundRect( rect, 10, 10, l0 )
+        skc.drawRoundRect( rect.makeInset( 2, 2 ), 10, 10, l1 )
+        skc.restore()
 
-            rect = skia.Rect.MakeWH( w + ipad * 2, h + ipad * 2 )
+        if self.gcode_thumbnail != None:
+            rect = rect.makeInset( self.thumbnail_ipad, self.thumbnail_ipad )
 
             skc.save()
             skc.clipRect( rect )
-            skc.drawRoundRect( rect, 10, 10, l0 )
-            skc.drawRoundRect( rect.makeInset( 2, 2 ), 10, 10, l1 )
+            skc.drawImageRect( self.gcode_thumbnail, rect )
             skc.restore()
 
-            if self.gcode_thumbnail != None:
-                rect = rect.makeInset( ipad, ipad )
+        return ( w, h )
 
-                skc.save()
-                skc.clipRect( rect )
-                skc.drawImageRect( self.gcode_thumbnail, rect )
-                skc.restore()
+    def onClick( self, event ):
+        # to the move under the pointer ( the details show its line, feedrate and time )
 
-        skc.flush()
-        del skc
+        hit = self.pickMove( event.x, event.y )
 
-        if canvas == None:
-            self.setupCanvasImage()
+        if hit is not None:
+            self.scale_h_value.set( hit[ 0 ] )
+            self.requestImage()
 
     def scrollStart( self, event ):
         self.scan_mark = Point( event.x, event.y )
@@ -2392,7 +5228,7 @@ class Viewer:
 
                     target.set( first, last )
 
-                    self.updateImage()
+                    self.requestImage()
 
             self.scan_mark = Point( event.x, event.y )
 
@@ -2415,7 +5251,7 @@ class Viewer:
         if zoom != self.zoom:
             self.zoom = zoom
             self.updateScrollBar()
-            self.updateImage()
+            self.requestImage()
 
     def isConfigVisible( self ):
         return self.config_frame.winfo_ismapped()
@@ -2442,9 +5278,15 @@ class Viewer:
         if force or self.loadprog_frame.winfo_ismapped():
 
             x = self.canv.winfo_width() / 2
-            y = self.canv.winfo_height() / 2
 
-            self.loadprog_frame.place( x=x, y=y, anchor = tk.CENTER )
+            if self.thread_gl_live:
+                # keep the view visible
+                y = self.config_padxy
+                self.loadprog_frame.place( x=x, y=y, anchor = tk.N )
+
+            else:
+                y = self.canv.winfo_height() / 2
+                self.loadprog_frame.place( x=x, y=y, anchor = tk.CENTER )
 
     def showLoadProgress( self, filename ):
         self.loadProgressReposition( True )
@@ -2475,7 +5317,7 @@ class Viewer:
     def onButton_btn_zr( self, event = None ):
         self.zoom = ZOOM_DEFAULT
         self.updateScrollBar()
-        self.updateImage()
+        self.requestImage()
 
     def onScaleVChange( self, event ):
         old_value = self.scale_v_value.get()
@@ -2488,7 +5330,7 @@ class Viewer:
         self.scale_h.configure( from_ = 0, to = self.gcode_li_max() )
         self.scale_h_value.set( self.gcode_li_max() )
 
-        self.updateImage()
+        self.requestImage()
 
     def onScaleHChange( self, event ):
         old_value = self.scale_h_value.get()
@@ -2498,22 +5340,22 @@ class Viewer:
 
         self.scale_h_value.set( value )
 
-        self.updateImage()
+        self.requestImage()
 
     def onChange_chk_lg( self, event = None ):
-        self.updateImage()
+        self.requestImage()
 
     def onChange_chk_dt( self, event = None ):
-        self.updateImage()
+        self.requestImage()
 
     def onChange_th_lg( self, event = None ):
-        self.updateImage()
+        self.requestImage()
 
     def onChange_chk_mv( self, event = None ):
-        self.updateImage()
+        self.requestImage()
 
     def onChange_cbo_ly( self, event = None ):
-        self.updateImage()
+        self.requestImage()
 
     def updatePlayState( self, force = None ):
         if self.thread_gl_thread is not None:
@@ -2524,10 +5366,13 @@ class Viewer:
 
                 ( ms, skip ) = self.play_timer_span()
                 self.play_timer_id = self.root.after( ms, self.progressPlay )
+                self.play_time_pos = None
+                self.play_pace.start()
 
             else:
                 self.root.after_cancel( self.play_timer_id )
                 self.play_timer_id = None
+                self.requestImage()             # the details without the playback pace
 
         self.btn_pl.configure( image =  self.icon_player_play if self.play_timer_id is None else self.icon_player_pause )
 
@@ -2539,41 +5384,85 @@ class Viewer:
                 ):
                 self.updatePlayState( False )
             else:
+                # skip per ms at any frame rate ( see PlayPace )
+
+                now = time.perf_counter()
+                pos = ( self.gcode_ln(), self.gcode_li() )
+
                 ( ms, skip ) = self.play_timer_span()
 
-                if skip == -1:
+                n = self.play_pace.steps( now, 1000 / ms * max( skip, 1 ) ) if skip is not None and skip != -1 else 1
+
+                if skip is None:
+                    self.progressPlayTime()
+
+                elif n == 0:
+                    pass
+
+                elif skip == -1:
                     if  self.gcode_li() == self.gcode_li_max():
                         self.layerUp( True )
 
                     self.scale_h_value.set( self.gcode_li_max() )
 
-                elif skip == 1:
-                    self.onButton_btn_n()
-
                 elif self.gcode_li() == self.gcode_li_max():
                     self.layerUp( True )
 
+                elif skip == 1:
+                    self.scale_h_value.set( min( self.gcode_li() + n, self.gcode_li_max() ) )
+
                 else:
+                    self.scale_h_value.set( self.gcode_layer( self.gcode_ln() ).extrusionSkip( self.gcode_li(), n ) )
 
-                    li_max = self.gcode_li_max()
-                    li_cur = self.scale_h_value.get()
+                frame = ( self.gcode_ln(), self.gcode_li() ) != pos    # no step this tick ( slow rate, long move ) : the same frame
 
-                    layer = self.gcode_layer( self.gcode_ln() )
+                if frame or self.play_pace.refresh():
+                    self.updateImagePlay()                              # ( only the marks and the details if no step )
 
-                    while skip > 0 and li_cur < li_max:
+                g1 = self.gcode_lnli( self.gcode_ln(), self.gcode_li() )
 
-                        li_cur += 1
+                self.play_timer_id = self.root.after( self.play_pace.tick( now, g1.tm if g1 is not None else 0, frame ), self.progressPlay )
 
-                        g1 = layer[ li_cur ]
+    def progressPlayTime( self ):
+        # advance the print time by play_time_rate_dic x the wall clock time since the last tick, the move is found
+        # by a binary search of the cumulative time ( Toolpath.tm ), so a tick costs the same at any rate
 
-                        if g1.E is not None and g1.E > 0:
-                            skip -= 1
+        now  = time.perf_counter()
+        rate = self.play_time_rate_dic.get( self.cbo_pl.get(), 1 )
 
-                    self.scale_h_value.set( min( li_cur, li_max ) )
+        ln    = self.gcode_ln()
+        li    = self.gcode_li()
+        layer = self.gcode_layer( ln )
 
-                self.updateImage()
+        if len( layer ) == 0:
+            self.layerUp( True )
+            return
 
-                self.play_timer_id = self.root.after( ms, self.progressPlay )
+        tp  = layer.toolpath
+        pos = self.play_time_pos
+
+        if pos is None or pos[ 1 : 3 ] != ( ln, li ):     # ( re )started or moved : from the end of the current move
+            t = float( tp.tm[ layer.st + li ] )
+        else:
+            t = pos[ 0 ] + min( now - pos[ 3 ], 0.25 ) * rate  # a stalled tick does not jump ahead
+
+        if t > tp.tm[ layer.ed - 1 ] and self.chk_stop_value.get() == 0 and ln < self.gcode_ln_max():
+
+            # the layer of t ( the first that ends at t or later )
+
+            ends = tp.tm[ np.maximum( tp.layer_offset[ 1 : ] - 1, 0 ) ]
+            ln   = int( np.clip( np.searchsorted( ends, t ), ln + 1, self.gcode_ln_max() ) )
+
+            self.scale_v_value.set( ln )
+            self.scale_h.configure( from_ = 0, to = self.gcode_li_max() )
+
+            layer = self.gcode_layer( ln )
+
+        li = int( np.searchsorted( tp.tm[ layer.st : layer.ed ], t, side = 'right' ) ) - 1
+        li = max( 0, min( li, len( layer ) - 1 ) )
+
+        self.scale_h_value.set( li )
+        self.play_time_pos = ( t, ln, li, now )
 
     def onButton_btn_pl( self, event = None ):
         if self.play_timer_id is None and self.gcode_li() == self.gcode_li_max():
@@ -2601,11 +5490,11 @@ class Viewer:
 
     def onButton_btn_u( self, event = None ):
         self.layerUp( False )
-        self.updateImage()
+        self.requestImage()
 
     def onButton_btn_d( self, event = None ):
         self.layerDown( False )
-        self.updateImage()
+        self.requestImage()
 
     def onButton_btn_pp( self, event = None ):
         if self.gcode_li() == 0:
@@ -2613,7 +5502,7 @@ class Viewer:
         else:
             self.scale_h_value.set( 0 )
 
-        self.updateImage()
+        self.requestImage()
 
     def onButton_btn_p( self, event = None ):
         if self.gcode_li() == 0:
@@ -2621,14 +5510,33 @@ class Viewer:
         else:
             self.scale_h_value.set( max( self.scale_h_value.get() - 1, 0 ) )
 
-        self.updateImage()
+        self.requestImage()
 
     def onButton_btn_n( self, event = None ):
         if self.gcode_li() == self.gcode_li_max():
             self.layerUp( True )
         else:
             self.scale_h_value.set( min( self.scale_h_value.get() + 1, self.gcode_li_max() ) )
-        self.updateImage()
+        self.requestImage()
+
+    def onKey_next_e( self, event = None ):
+        self.stepExtrusion( 1 )
+
+    def onKey_prev_e( self, event = None ):
+        self.stepExtrusion( -1 )
+
+    def stepExtrusion( self, n ):
+        # to the n th extrusion move after ( n < 0 : before ) the current move, or to the next / previous layer at the end
+        layer = self.gcode_layer( self.gcode_ln() )
+
+        if n > 0 and self.gcode_li() == self.gcode_li_max():
+            self.layerUp( True )
+        elif n < 0 and self.gcode_li() == 0:
+            self.layerDown( False )
+        elif len( layer ) > 0:
+            self.scale_h_value.set( layer.extrusionSkip( self.gcode_li(), n ) )
+
+        self.requestImage()
 
     def onButton_btn_nn( self, event = None ):
         if self.gcode_li() == self.gcode_li_max():
@@ -2636,7 +5544,7 @@ class Viewer:
         else:
             self.scale_h_value.set( self.gcode_li_max() )
 
-        self.updateImage()
+        self.requestImage()
 
     def openFile_UI( self, filenames ):
         self.updatePlayState( False )
@@ -2654,7 +5562,7 @@ class Viewer:
             # blocking
 
             try:
-                gl = GcodeLoader()
+                gl = GcodeLoader( workers = self.option.get( 'load_workers', 1 ), cache = self.gcodeCache(), arc_tolerance = self.option.get( 'arc_tolerance', ARC_TOLERANCE ) )
                 gl.load( filename )
                 self.setupGcode( gl, filename )
                 self.updateImage()
@@ -2670,7 +5578,13 @@ class Viewer:
             self.loadProgressReposition( filename )
 
             self.thread_gl_filename = filename
-            self.thread_gl = GcodeLoader()
+            self.thread_gl_live = 0
+
+            try:
+                self.thread_gl_info = scanGcodeInfo( filename )
+            except Exception:
+                self.thread_gl_info = None
+            self.thread_gl = GcodeLoader( workers = self.option.get( 'load_workers', 1 ), cache = self.gcodeCache(), arc_tolerance = self.option.get( 'arc_tolerance', ARC_TOLERANCE ) )
             self.thread_gl_thread = threading.Thread( group=None, target = lambda x : x.load( filename ), args=( self.thread_gl, ) )
             self.thread_gl_thread.start()
             self.loadprog_th.delete( 'all' )
@@ -2678,6 +5592,12 @@ class Viewer:
             self.thread_gl_th_image = None
             self.root.after( self.thread_gl_ptm, self.loadProgress )
 
+    def gcodeCache( self ):
+        if not self.option.get( 'cache', True ):
+            return None
+
+        return GcodeCache( self.option.get( 'cache_dir', None ) )
+
     def loadError( self, err, filename = "" ):
         traceback.print_exception( err, file=sys.stderr )
         msg = "File open error.\n[%s]\n%s" % ( filename, err )
@@ -2687,7 +5607,9 @@ class Viewer:
     def loadProgress( self ):
         if self.thread_gl_thread.is_alive():
 
-            self.loadprog_loading_value.set( "Now Loading ...[%s]" % ( os.path.basename( self.thread_gl_filename ), ) )
+            info_text = formatGcodeInfo( self.thread_gl_info ) if self.thread_gl_info is not None else ""
+
+            self.loadprog_loading_value.set( "Now Loading ...[%s]%s" % ( os.path.basename( self.thread_gl_filename ), "\n" + info_text if info_text else "" ) )
 
             proc = self.thread_gl.getProc()
 
@@ -2725,6 +5647,9 @@ class Viewer:
 
                 thumbnail_bytes = self.thread_gl.getThumbnailImage()
 
+                if thumbnail_bytes is None and self.thread_gl_info is not None:
+                    thumbnail_bytes = self.thread_gl_info.thumbnail
+
                 if thumbnail_bytes is not None:
                     self.thread_gl_th_image = ImageTk.PhotoImage( Image.open( io.BytesIO( thumbnail_bytes ) ) )
 
@@ -2734,6 +5659,8 @@ class Viewer:
                     self.loadprog_th.configure( width = w, height = h )
                     self.loadprog_th.create_image( w / 2, h / 2, image = self.thread_gl_th_image, anchor=tk.CENTER, tag='all' )
 
+            self.loadProgressLayers()
+
             self.root.after( self.thread_gl_ptm, self.loadProgress )
 
         else:
@@ -2744,7 +5671,23 @@ class Viewer:
             self.hideLoadProgress()
 
             if self.thread_gl.err:
+                if self.thread_gl_live:
+                    self.setupGcode( GcodeLoader() )
+                    self.updateImage()
+
                 self.loadError( self.thread_gl.err, self.thread_gl_filename )
+
+            elif self.thread_gl_live:
+                bed = ( self.bed_w, self.bed_h )
+
+                self.updateGcodeRange()
+                self.setupGcodeInfo()
+
+                if bed != ( self.bed_w, self.bed_h ):
+                    self.updateScrollBar()
+
+                self.updateImage()
+
             else:
                 self.setupGcode( self.thread_gl, self.thread_gl_filename )
                 self.updateImage()
@@ -2752,10 +5695,34 @@ class Viewer:
             self.thread_gl          = None
             self.thread_gl_filename = None
             self.thread_gl_thread   = None
+            self.thread_gl_live     = 0
+            self.thread_gl_info     = None
             self.loadprog_th.delete( 'all' )
             self.loadprog_th.configure( width = 0, height = 0 )
             self.thread_gl_th_image = None
 
+    def loadProgressLayers( self ):
+        # show the completed layers while the rest of the file is loading
+
+        ( layer_data, feedrates ) = self.thread_gl.getLayerData()
+
+        if len( layer_data ) == 0:
+            return
+
+        if self.thread_gl_live == 0:
+            self.thread_gl_live = len( layer_data )
+
+            self.setupGcode( self.thread_gl, self.thread_gl_filename )
+            self.updateScrollBar()
+            self.updateImage()
+            self.loadProgressReposition()
+
+        elif len( layer_data ) != self.thread_gl_live or feedrates != list( self.gcode_fr_map.keys() ):
+            self.thread_gl_live = len( layer_data )
+
+            if self.updateGcodeRange():
+                self.updateImage()
+
     def onButton_btn_open( self, event = None ):
         self.openFile_UI( tkfd.askopenfilename( filetypes = FILETYPES_GCODE ) )
 
@@ -2780,7 +5747,9 @@ class Viewer:
 
                 canvas = skia.SVGCanvas.Make( ( canv_wh.X, canv_wh.Y ), stream )
 
-                self.updateImage( canvas )
+                svg = copy.copy( self )         # the full polylines, the SVG may be zoomed in
+                svg.layer_lod = False
+                svg.updateImage( canvas )
 
                 del canvas
 
@@ -3098,6 +6067,10 @@ class Experiment():
         if not self.isCalcDone():
             return ()
 
+        if self.viewer.thread_gl_thread is not None:
+            tkmb.showinfo( "File save", "Now loading. Try again after loading." )
+            return ()
+
         filenames = self.root.tk.splitlist( tkfd.asksaveasfilename( filetypes = FILETYPES_GCODE, defaultextension = ".gcode" ) )
 
         if filenames is not None and len( filenames ) > 0:
@@ -3117,27 +6090,48 @@ class Experiment():
 
             g1list.sort()
 
-            raw_gcode_iter = iter( enumerate( self.viewer.gcode.raw_gcode ) )
+            raw_gcode = self.viewer.gcode.raw_gcode
 
             try:
-                stream = open( filename, "w" )
+                # The lines are copied from the source file ( mmap ) as is ( original line endings ) : written to a
+                # temporary file and replaced, the target may be the source itself.
+
+                ( fd, tmp ) = tempfile.mkstemp( suffix = '.tmp', dir = os.path.dirname( os.path.abspath( filename ) ) )
 
-                for ( no, mt, cf ) in g1list:
+                try:
+                    with os.fdopen( fd, 'wb' ) as stream:
 
-                    for ( i, ln ) in raw_gcode_iter:
+                        i = 0
 
-                        if i < no:
-                            stream.write( ln )
-                        else:
-                            stream.write( "G1 X%.3f Y%.3f F%d\n" % ( mt.X, mt.Y, cf ) )
+                        for ( no, mt, cf ) in g1list:
+
+                            no = max( i, no )
+
+                            if no >= len( raw_gcode ):
+                                break
+
+                            raw_gcode.copyTo( stream, i, no )
+
+                            ln = raw_gcode[ no ]
+                            nl = ln[ len( ln.rstrip( b"\r\n" ) ): ] or b"\n"
+                            stream.write( b"G1 X%.3f Y%.3f F%d" % ( mt.X, mt.Y, cf ) + nl )
                             stream.write( ln )
-                            break
 
-                for ( _, ln ) in raw_gcode_iter:
-                    stream.write( ln )
+                            i = no + 1
 
-                stream.flush()
-                stream.close()
+                        raw_gcode.copyTo( stream, i )
+
+                    if os.path.exists( filename ):
+                        os.chmod( tmp, os.stat( filename ).st_mode & 0o7777 )
+
+                        if isinstance( raw_gcode.source, str ) and os.path.samefile( filename, raw_gcode.source ):
+                            raw_gcode.close()       # a mapped file can not be replaced on Windows
+
+                    os.replace( tmp, filename )
+
+                except:
+                    os.remove( tmp )
+                    raise
 
                 tkmb.showinfo( "File save", "Ok." )
 
@@ -3547,7 +6541,7 @@ class Experiment():
 #               drawfunc.append( DrawFunc( skc.drawPoints, ( skia.Canvas.PointMode.kPolygon_PointMode, pts, pa_g_i ) ) )
 
             if len( gcode_info.i1 ) != 0:
-                pts = tuple( map( lambda x : coordXY( x ), gcode_info.i1  + [ gcode_info.i1[0] ] ) ) #
+                pts = tuple( map( Point._make, coordXY( np.array( gcode_info.i1 + [ gcode_info.i1[0] ], dtype = np.float64 ) ).tolist() ) )
                 drawfunc.append( DrawFunc( skc.drawPoints, ( skia.Canvas.PointMode.kPolygon_PointMode, pts, pa_g_i ) ) )
 
         if gcode_info.rd in ( 2, 3 ):
@@ -3560,20 +6554,258 @@ class Experiment():
 #               drawfunc.append( DrawFunc( skc.drawPoints, ( skia.Canvas.PointMode.kPolygon_PointMode, pts, pa_g_o ) ) )
 
             if len( gcode_info.o1 ) != 0:
-                pts = tuple( map( lambda x : coordXY( x ), gcode_info.o1  + [ gcode_info.o1[0] ] ) ) #
+                pts = tuple( map( Point._make, coordXY( np.array( gcode_info.o1 + [ gcode_info.o1[0] ], dtype = np.float64 ) ).tolist() ) )
                 drawfunc.append( DrawFunc( skc.drawPoints, ( skia.Canvas.PointMode.kPolygon_PointMode, pts, pa_g_o ) ) )
 
-        for ( i, g1, mt, _ ) in gcode_info.mov:
+        # reroutes : the original move and the two new ones, a drawPoints ( lines ) per paint
 
-            if i > self.viewer.gcode_li():
-                break
+        mov = [ ( g1.cx, g1.cy, g1.X, g1.Y ) + tuple( mt ) for ( i, g1, mt, _ ) in gcode_info.mov if i <= self.viewer.gcode_li() ]
 
-            drawfunc.append( DrawFunc( skc.drawLine, ( coordXY( Point( g1.cx, g1.cy ) ), coordXY( Point( g1.X, g1.Y ) ),    pa_m_0 ) ) )
-            drawfunc.append( DrawFunc( skc.drawLine, ( coordXY( Point( g1.cx, g1.cy ) ), coordXY( mt                  ),    pa_m_1 ) ) )
-            drawfunc.append( DrawFunc( skc.drawLine, ( coordXY( mt,                   ), coordXY( Point( g1.X, g1.Y ) ),    pa_m_2 ) ) )
+        if len( mov ) != 0:
+            ( c, e, m ) = ( coordXY( a ) for a in np.split( np.array( mov, dtype = np.float64 ), 3, axis = 1 ) )
+
+            for ( p0, p1, pa ) in ( ( c, e, pa_m_0 ), ( c, m, pa_m_1 ), ( m, e, pa_m_2 ) ):
+                pts = np.stack( ( p0, p1 ), axis = 1 ).reshape( -1, 2 )
+                drawfunc.append( DrawFunc( skc.drawPoints, ( skia.Canvas.PointMode.kLines_PointMode, tuple( map( Point._make, pts.tolist() ) ), pa ) ) )
 
         return drawfunc
 
+def toolpathEqual( a, b ):
+
+    return (    all( np.array_equal( x, y, equal_nan = True ) for ( x, y ) in zip( a.columns().values(), b.columns().values() ) )
+            and np.array_equal( a.layer_offset, b.layer_offset )
+            and np.array_equal( a.layer_height, b.layer_height )
+            and a.tail == b.tail
+            )
+
+def benchmark( filename, workers = 1 ):
+
+    # -b : check tokenizeG1 against parseMove line by line and show the throughput
+
+    buf = openGcodeBuffer( filename )
+
+    try:
+        lines = 0
+        g1s = 0
+        diff = 0
+        tm_re = 0
+        tm_tk = 0
+
+        kind = rows = motion = words = tails = starts = ends = None
+
+        for ( ed, starts, ends ) in lineChunks( buf, GcodeLoader.read_chunk_size ):
+
+            t = time.perf_counter()
+            ( kind, rows, motion, words, tails ) = tokenizeG1( buf, starts, ends )
+            tm_tk += time.perf_counter() - t
+
+            t = time.perf_counter()
+            expect = []
+
+            for ( a, b ) in zip( starts.tolist(), ends.tolist() ):
+                ln = buf[ a : b ].rstrip( b"\r\n" )
+                expect.append( None if KW_COMMENT_B.match( ln ) else parseMove( ln ) )
+
+            tm_re += time.perf_counter() - t
+
+            r = dict( ( i, j ) for ( j, i ) in enumerate( rows.tolist() ) )
+
+            for ( i, mv ) in enumerate( expect ):
+                if mv is None:
+                    diff += i in r
+                    continue
+
+                g1s += 1
+                j = r.get( i )
+
+                if j is None:
+                    diff += 1
+                    continue
+
+                w = [ None if v != v else v for v in words[ j ].tolist() ]
+
+                if motion[ j ] != mv[0] or w != [ None if v != v else v for v in mv[1] ] or tails.get( j ) != mv[2]:
+                    diff += 1
+
+            lines += len( starts )
+
+        del kind, rows, motion, words, tails, starts, ends
+
+    finally:
+        if isinstance( buf, mmap.mmap ):
+            buf.close()
+
+    print( "file          : %s ( %s, %d lines, %d G0-G3 )" % ( filename, format_size( os.path.getsize( filename ) ), lines, g1s ) )
+    print( "parity        : %s ( %d lines differ )" % ( "OK" if diff == 0 else "NG", diff ) )
+    print( "parseMove     : %8.3f s  %10.0f lines/s" % ( tm_re, lines / tm_re if tm_re > 0 else 0 ) )
+    print( "tokenizeG1    : %8.3f s  %10.0f lines/s" % ( tm_tk, lines / tm_tk if tm_tk > 0 else 0 ) )
+
+    gl = GcodeLoader()
+    t = time.perf_counter()
+    gl.load( filename )
+    t = time.perf_counter() - t
+
+    print( "GcodeLoader   : %8.3f s  %10.0f lines/s ( %d layers, %d moves, %s )" % ( t, lines / t if t > 0 else 0, len( gl.layer_data ), gl.toolpath.moves(), format_size( gl.toolpath.nbytes() ) ) )
+
+    if workers > 1:
+        gp = GcodeLoader( workers = workers )
+        gp.parallel_min_size = 0
+
+        t = time.perf_counter()
+        gp.load( filename )
+        t = time.perf_counter() - t
+
+        same = (    toolpathEqual( gl.toolpath, gp.toolpath )
+                and gl.feedrates == gp.feedrates
+                )
+
+        print( "GcodeLoader -j%d: %6.3f s  %10.0f lines/s ( %s serial )" % ( workers, t, lines / t if t > 0 else 0, "same as" if same else "DIFFERS from" ) )
+
+        diff += 0 if same else 1
+
+    with tempfile.TemporaryDirectory() as d:
+
+        gw = GcodeLoader( cache = GcodeCache( d ) )
+        t = time.perf_counter()
+        gw.load( filename )
+        t_w = time.perf_counter() - t
+
+        gc = GcodeLoader( cache = GcodeCache( d ) )
+        t = time.perf_counter()
+        gc.load( filename )
+        t_r = time.perf_counter() - t
+
+        same = (    gc.cached
+                and toolpathEqual( gl.toolpath, gc.toolpath )
+                and gl.feedrates == gc.feedrates
+                and np.array_equal( gl.raw_gcode_cm_no, gc.raw_gcode_cm_no )
+                and np.array_equal( gl.raw_gcode.offsets, gc.raw_gcode.offsets )
+                and ( gl.time_est, gl.time_calc, gl.thumbnail_image_bytes ) == ( gc.time_est, gc.time_calc, gc.thumbnail_image_bytes )
+                )
+
+        print( "cache write   : %8.3f s" % ( t_w, ) )
+        print( "cache read    : %8.3f s  ( %s load )" % ( t_r, "same as" if same else "DIFFERS from" ) )
+
+        diff += 0 if same else 1
+
+    # machine limits of 0 ( the limit of a still axis does not apply, a limit <= 0 is not set ) on a small synthetic file,
+    # after its limit block : a jerk of 0 must be slower than the block alone, an unset limit the same as a huge one
+
+    def limitsGcode( m ):
+        g = [ b"M201 X1000 Y1000 Z200 E5000", b"M203 X200 Y200 Z12 E120", b"M205 X8 Y8 Z0.4 E4.5", m ]
+
+        for i in range( 1, 6 ):
+            g.append( b"G1 Z%.1f F1200" % ( i * 0.2 + 2, ) )       # a hop long enough to reach the Z limits
+            g.append( b"G1 Z%.1f" % ( i * 0.2, ) )
+
+            for ( x, y ) in ( ( 10, 10 ), ( 60, 10 ), ( 60, 60 ), ( 10, 60 ), ( 10, 10 ) ):
+                g.append( b"G1 X%d Y%d E1 F3000" % ( x, y ) )
+
+        return b"\n".join( g ) + b"\n"
+
+    def limitsTime( m ):
+        gm = GcodeLoader()
+        gm.load( io.BytesIO( limitsGcode( m ) ) )
+        return gm.time_calc if np.all( np.isfinite( gm.toolpath.tmd ) ) else math.nan
+
+    base = limitsTime( b"" )
+
+    for ( m, ref ) in ( ( b"M205 X0 Y0", None ), ( b"M205 Z0", None ), ( b"M203 Z0", b"M203 Z100000" ), ( b"M201 Z0", b"M201 Z100000" ) ):
+        t = limitsTime( m )
+        r = limitsTime( ref ) if ref is not None else base
+
+        ok = 0 < t < math.inf and 0 < base < math.inf and ( t > base if ref is None else ( t < base and abs( t - r ) <= 1e-9 * r ) )
+
+        print( "%-14s: %s ( %.3f s, %.3f s %s )" % ( m.decode(), "OK" if ok else "NG", t, r, "without" if ref is None else ref.decode() ) )
+
+        diff += 0 if ok else 1
+
+    return diff == 0
+
+def printGcodeInfo( filename ):
+
+    # -i : report of scanGcodeInfo
+
+    t = time.perf_counter()
+    info = scanGcodeInfo( filename )
+    t = time.perf_counter() - t
+
+    def opt( v, fmt ):
+        return fmt % ( v, ) if v is not None else "-"
+
+    print( "file          : %s ( %s )" % ( filename, format_size( info.size ) ) )
+    print( "bed           : %s" % ( "%d - %d x %d - %d (mm)" % info.bed if info.bed is not None else "-", ) )
+    print( "estimated time: %s" % ( format_time( info.time_est )[ : -3 ] if info.time_est != 0 else "-", ) )
+    print( "layer height  : %s ( first %s )" % ( opt( info.layer_height, "%.2f mm" ), opt( info.first_layer_height, "%.2f mm" ) ) )
+    print( "thumbnail     : %s" % ( "%dx%d png ( %s )" % ( pngSize( info.thumbnail ) + ( format_size( len( info.thumbnail ) ), ) ) if info.thumbnail is not None else "-", ) )
+    print( "scan time     : %.3f ms" % ( t * 1000, ) )
+
+def benchmarkTkImage( frames = 30 ):
+
+    # -t : ms/frame of the transfer of the canvas image to Tk ( needs a display )
+    #   swap    : BGRA -> RGBA by a matrix multiply, PIL Image and a new PhotoImage every frame ( the former way )
+    #   paste   : RGBA surface ( makeSurface ) pasted into a persistent PhotoImage
+    #   rects   : paste only 8 dirty rects of 1/16 x 1/16 of the canvas ( Viewer.setupCanvasImage( rects ) )
+
+    mtx = np.array( [ [ 0, 0, 1, 0 ], [ 0, 1, 0, 0 ], [ 1, 0, 0, 0 ], [ 0, 0, 0, 1 ] ], dtype = np.uint8 )
+
+    root = tk.Tk()
+
+    try:
+        for ( w, h ) in ( ( 1200, 800 ), ( 3840, 2160 ) ):
+            surface = np.zeros( ( h, w, 4 ), dtype = np.uint8 )
+
+            with makeSurface( surface ) as skc:
+                skc.clear( 0xff333333 )
+
+                paint = skia.Paint( Color=0xff990000, AntiAlias=True, StrokeWidth=2, Style=skia.Paint.kStroke_Style )
+
+                for i in range( 0, w, 8 ):
+                    skc.drawLine( i, 0, w - i, h, paint )
+
+            canv = tk.Canvas( root, width = w, height = h )
+            canv.pack()
+
+            image = makeTkImage( surface )
+            image_id = canv.create_image( 0, 0, anchor = tk.NW, image = image )
+            root.update()
+
+            def run( f ):
+                t = time.perf_counter()
+
+                for i in range( frames ):
+                    f()
+                    root.update()
+
+                return ( time.perf_counter() - t ) * 1000 / frames
+
+            def swap():
+                nonlocal image
+                np.dot( surface, mtx, out = surface )
+                image = ImageTk.PhotoImage( Image.fromarray( surface ) )
+                canv.itemconfig( image_id, image = image )
+
+            def paste():
+                image.paste( makePILImage( surface ) )
+
+            rw = w // 16
+            rh = h // 16
+
+            def rects():
+                for i in range( 8 ):
+                    ( x0, y0 ) = ( rw * i * 2, rh * i * 2 )
+                    part = makeTkImage( surface[ y0 : y0 + rh, x0 : x0 + rw ] )
+                    canv.tk.call( str( image ), 'copy', str( part ), '-to', x0, y0, '-compositingrule', 'set' )
+
+            tm = [ run( f ) for f in ( swap, paste, rects ) ]
+
+            canv.destroy()
+
+            print( "%4d x %4d : swap %8.2f ms/frame  paste %8.2f ms/frame  rects %8.2f ms/frame" % ( ( w, h ) + tuple( tm ) ) )
+
+    finally:
+        root.destroy()
+
 def usage():
     print( "", file=sys.stderr )
     print( SCRIPT_NAME, file=sys.stderr )
@@ -3581,6 +6813,13 @@ def usage():
     print( "  -x : Bed x size (mm) defalt %f" % ( DEFAULT_BED_W, ), file=sys.stderr )
     print( "  -y : Bed y size (mm) defalt %f" % ( DEFAULT_BED_H, ), file=sys.stderr )
     print( "  -e : Experiment mode", file=sys.stderr )
+    print( "  -b : Benchmark and self check of the loader with the file ( no window )", file=sys.stderr )
+    print( "  -t : Benchmark of the canvas image transfer to Tk at 1200x800 and 3840x2160", file=sys.stderr )
+    print( "  -i : Show the metadata of the files ( no window )", file=sys.stderr )
+    print( "  -j : Number of loader processes for large files ( default 1 )", file=sys.stderr )
+    print( "  -n : Do not use the cache of parsed files", file=sys.stderr )
+    print( "  -a : Chord tolerance of G2/G3 arcs (mm) default %f" % ( ARC_TOLERANCE, ), file=sys.stderr )
+    print( "  -c : Cache directory ( default %s )" % ( defaultCacheDir(), ), file=sys.stderr )
     print( "  -h : Show usage", file=sys.stderr )
 
 def parse_option():
@@ -3588,7 +6827,7 @@ def parse_option():
     option = {}
 
     try:
-        opts, args = getopt.getopt( sys.argv[1:], 'hex:y:')
+        opts, args = getopt.getopt( sys.argv[1:], 'hebtinc:a:j:x:y:')
 
     except getopt.GetoptError as err:
         print( err )
@@ -3606,6 +6845,49 @@ def parse_option():
             elif k in ( '-e' ):
                 option[ 'experiment' ] = True
 
+            elif k in ( '-b' ):
+                option[ 'benchmark' ] = True
+
+            elif k in ( '-t' ):
+                option[ 'benchmark_tk' ] = True
+
+            elif k in ( '-i' ):
+                option[ 'info' ] = True
+
+            elif k in ( '-n' ):
+                option[ 'cache' ] = False
+
+            elif k in ( '-c' ):
+                option[ 'cache_dir' ] = v
+
+            elif k in ( '-j' ):
+                try:
+                    v = int( v )
+
+                    if v < 1:
+                        raise Exception( "Invalid value for [%s]" % ( k, ) )
+
+                    option[ 'load_workers' ] = min( v, os.cpu_count() or 1 )
+
+                except Exception as err:
+                    print( err, file=sys.stderr )
+                    usage()
+                    sys.exit()
+
+            elif k in ( '-a' ):
+                try:
+                    v = float( v )
+
+                    if not v > 0:
+                        raise Exception( "Invalid value for [%s]" % ( k, ) )
+
+                    option[ 'arc_tolerance' ] = v
+
+                except Exception as err:
+                    print( err, file=sys.stderr )
+                    usage()
+                    sys.exit()
+
             elif k in (  '-x', '-y' ):
                 try:
                     v = int( v )
@@ -3626,12 +6908,42 @@ def parse_option():
 
         if len( args ) > 0:
             option[ 'open_file' ] = args[ 0 ]
+            option[ 'files' ] = args
 
     return option
 
 if __name__ == "__main__":
 
-    viewer = Viewer( **parse_option() )
+    option = parse_option()
+
+    if option.get( 'benchmark', False ):
+        if 'open_file' not in option:
+            usage()
+            sys.exit( 2 )
+
+        sys.exit( 0 if benchmark( option[ 'open_file' ], option.get( 'load_workers', 1 ) ) else 1 )
+
+    if option.get( 'benchmark_tk', False ):
+        benchmarkTkImage()
+        sys.exit( 0 )
+
+    if option.get( 'info', False ):
+        if 'files' not in option:
+            usage()
+            sys.exit( 2 )
+
+        for ( i, filename ) in enumerate( option[ 'files' ] ):
+            if i > 0:
+                print( "" )
+
+            try:
+                printGcodeInfo( filename )
+            except Exception as err:
+                print( "%s : %s" % ( filename, err ), file=sys.stderr )
+
+        sys.exit( 0 )
+
+    viewer = Viewer( **option )
     viewer.run()
 
 # EOF